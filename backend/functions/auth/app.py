@@ -1,11 +1,27 @@
 import json
+import logging
+import os
+import secrets
 import time
-from db_util import get_table
+import db_util
+from db_util import get_table, request_scope
 from session_util import create_session, validate_session, delete_session
-from password_util import hash_password, verify_password
-from response_util import success, error
+from password_util import hash_password, verify_password, needs_rehash
+from metrics_util import instrument_handler, count_event
+from response_util import success, error, negotiate_encoding
+import throttle_util
 
+# Failed logins allowed per window (throttle_util.THROTTLE_WINDOW_SECONDS)
+# before further attempts are refused without running a password hash.
+LOGIN_MAX_FAILURES_PER_USER = int(os.environ.get('LOGIN_MAX_FAILURES_PER_USER', '5'))
+LOGIN_MAX_FAILURES_PER_IP = int(os.environ.get('LOGIN_MAX_FAILURES_PER_IP', '50'))
 
+_dummy_hash = None
+
+
+@instrument_handler
+@negotiate_encoding
+@request_scope
 def lambda_handler(event, context):
     path = event.get('path', '')
     method = event.get('httpMethod', '')
@@ -33,15 +49,29 @@ def handle_login(event):
     if not username or not password:
         return error('Username and password required')
 
+    source_ip = ((event.get('requestContext') or {}).get('identity') or {}).get('sourceIp')
+    shed_reason = _login_shed_reason(username, source_ip)
+    if shed_reason:
+        return _shed_login(shed_reason)
+
     resp = get_table().get_item(Key={'PK': f'USER#{username}', 'SK': f'USER#{username}'})
     user = resp.get('Item')
     if not user:
+        # Hash anyway so unknown usernames cost the same time as wrong passwords
+        verify_password(password, _get_dummy_hash())
+        _record_login_failure(username, source_ip)
         return error('Invalid credentials', 401)
 
     if not verify_password(password, user.get('passwordHash', '')):
+        _record_login_failure(username, source_ip)
         return error('Invalid credentials', 401)
 
-    token = create_session(username, user['role'])
+    throttle_util.reset('login-user', username)
+
+    if needs_rehash(user['passwordHash']):
+        _rehash_password(username, password, user['passwordHash'])
+
+    token = create_session(username, user['role'], user.get('aclRevision', 0))
     return success({
         'sessionToken': token,
         'username': username,
@@ -50,6 +80,49 @@ def handle_login(event):
     })
 
 
+def _get_dummy_hash():
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(secrets.token_hex(16))
+    return _dummy_hash
+
+
+def _login_shed_reason(username, source_ip):
+    if throttle_util.get_count('login-user', username) >= LOGIN_MAX_FAILURES_PER_USER:
+        return 'username'
+    if source_ip and throttle_util.get_count('login-ip', source_ip) >= LOGIN_MAX_FAILURES_PER_IP:
+        return 'sourceIp'
+    return None
+
+
+def _record_login_failure(username, source_ip):
+    throttle_util.record_failure('login-user', username)
+    if source_ip:
+        throttle_util.record_failure('login-ip', source_ip)
+
+
+def _shed_login(reason):
+    """Refuse a login before hashing, counted as a LoginShed metric by reason."""
+    count_event('LoginShed', Reason=reason)
+    return error('Too many failed login attempts, try again later', 429)
+
+
+def _rehash_password(username, password, old_hash):
+    """Upgrade a stored hash to the current algorithm/cost. Best effort: the
+    condition skips the write if the password changed concurrently, and any
+    other failure is logged without failing the login."""
+    try:
+        get_table().update_item(
+            Key={'PK': f'USER#{username}', 'SK': f'USER#{username}'},
+            UpdateExpression='SET passwordHash = :h',
+            ConditionExpression='passwordHash = :old',
+            ExpressionAttributeValues={':h': hash_password(password), ':old': old_hash},
+        )
+    except db_util.ClientError as e:
+        if db_util.error_code(e) != 'ConditionalCheckFailedException':
+            logging.getLogger(__name__).exception('Rehashing the password of %s failed', username)
+
+
 def handle_logout(event):
     session = validate_session(event)
     if not session:
@@ -99,10 +172,13 @@ def handle_seed_admin(event):
         'SK': 'USER#admin',
         'GSI1PK': 'USERS',
         'GSI1SK': 'USER#admin',
+        'GSI2PK': 'ROLE#admin',
+        'GSI2SK': 'USER#admin',
         'username': 'admin',
         'passwordHash': hash_password('ChangeMe123!'),
         'role': 'admin',
         'mustChangePassword': True,
         'createdAt': int(time.time()),
+        'folderIds': [],
     })
     return success({'message': 'Admin created', 'defaultPassword': 'ChangeMe123!'})
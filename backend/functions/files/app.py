@@ -1,16 +1,19 @@
 import json
-import uuid
 import time
 import os
-import boto3
-from db_util import get_table, get_s3_client
+from db_util import (get_table, get_s3_client, query_items, batch_get_items, request_scope,
+    fast_get_item, fast_query_items, Key, new_id)
 from session_util import validate_session, require_role
-from response_util import success, error
-from boto3.dynamodb.conditions import Key
+from metrics_util import instrument_handler
+from response_util import success, error, negotiate_encoding, conditional, make_etag
+from revision_util import folder_scope, get_revision, bump_revision
 
 MAX_FILE_SIZE = 1_073_741_824  # 1 GB
 
 
+@instrument_handler
+@negotiate_encoding
+@request_scope
 def lambda_handler(event, context):
     path = event.get('path', '')
     method = event.get('httpMethod', '')
@@ -34,26 +37,27 @@ def lambda_handler(event, context):
 def _get_accessible_folder_ids(session):
     """Return list of folder IDs the user can access."""
     if session['role'] == 'admin':
-        table = get_table()
-        resp = table.query(
+        return [item['folderId'] for item in query_items(
             IndexName='GSI1',
             KeyConditionExpression=Key('GSI1PK').eq('FOLDERS'),
-        )
-        return [item['folderId'] for item in resp.get('Items', [])]
+            projection=['folderId'],
+        )]
+    elif 'folderIds' in session:
+        # ACL snapshot stored on the session (see session_util.refresh_folder_acl)
+        return session['folderIds']
     else:
-        table = get_table()
-        resp = table.query(
-            KeyConditionExpression=Key('PK').eq(f'USER#{session["username"]}') & Key('SK').begins_with('FOLDER#'),
-        )
-        return [item['folderId'] for item in resp.get('Items', [])]
+        return [item['folderId'] for item in fast_query_items(
+            'PK = :pk AND begins_with(SK, :sk)', {':pk': f'USER#{session["username"]}', ':sk': 'FOLDER#'},
+            projection=['folderId'],
+        )]
 
 
 def _has_folder_access(session, folder_id):
     if session['role'] == 'admin':
         return True
-    table = get_table()
-    resp = table.get_item(Key={'PK': f'USER#{session["username"]}', 'SK': f'FOLDER#{folder_id}'})
-    return 'Item' in resp
+    if 'folderIds' in session:
+        return folder_id in session['folderIds']
+    return fast_get_item({'PK': f'USER#{session["username"]}', 'SK': f'FOLDER#{folder_id}'}) is not None
 
 
 def list_or_search_files(event):
@@ -67,45 +71,50 @@ def list_or_search_files(event):
     sort_by = params.get('sortBy', 'name')
     sort_order = params.get('sortOrder', 'asc')
 
-    table = get_table()
-
     if search:
-        # Cross-folder search
-        accessible = _get_accessible_folder_ids(session)
-        if not accessible:
-            return success({'files': []})
-
-        # Query GSI4 for all files, filter by name and accessible folders
-        resp = table.query(
-            IndexName='GSI4',
-            KeyConditionExpression=Key('GSI4PK').eq('FILES'),
-        )
-        files = []
-        for item in resp.get('Items', []):
-            if item.get('folderId') in accessible and search in item.get('fileName', '').lower():
-                files.append(_format_file(item))
-    else:
-        if not folder_id:
-            return error('folderId or search required')
-        if not _has_folder_access(session, folder_id):
-            return error('Forbidden', 403)
-
-        # List files in folder (latest pointers only — SK = FILE#<name> without VERSION)
-        resp = table.query(
-            KeyConditionExpression=Key('PK').eq(f'FOLDER#{folder_id}') & Key('SK').begins_with('FILE#'),
-        )
-        files = []
-        for item in resp.get('Items', []):
-            # Only include latest pointers (no VERSION in SK)
-            if '#VERSION#' not in item['SK']:
-                files.append(_format_file(item))
-
-    # Sort
+        # Cross-folder search: no single revision covers it, so the ETag
+        # falls back to a hash of the payload
+        return conditional(event, lambda: _search_files(session, search, sort_by, sort_order))
+
+    if not folder_id:
+        return error('folderId or search required')
+    if not _has_folder_access(session, folder_id):
+        return error('Forbidden', 403)
+
+    etag = make_etag('files', folder_id, get_revision(folder_scope(folder_id)), sort_by, sort_order)
+    return conditional(event, lambda: _list_folder_files(folder_id, sort_by, sort_order), etag)
+
+
+def _search_files(session, search, sort_by, sort_order):
+    accessible = set(_get_accessible_folder_ids(session))
+    if not accessible:
+        return success({'files': []})
+
+    # Query GSI4 for all files, filter by name and accessible folders
+    files = []
+    for item in fast_query_items('GSI4PK = :pk', {':pk': 'FILES'}, index='GSI4'):
+        if item.get('folderId') in accessible and search in item.get('fileName', '').lower():
+            files.append(_format_file(item))
+    return success({'files': _sort_files(files, sort_by, sort_order)})
+
+
+def _list_folder_files(folder_id, sort_by, sort_order):
+    # List files in folder (latest pointers only — SK = FILE#<name> without VERSION)
+    files = []
+    for item in fast_query_items(
+        'PK = :pk AND begins_with(SK, :sk)', {':pk': f'FOLDER#{folder_id}', ':sk': 'FILE#'},
+    ):
+        # Only include latest pointers (no VERSION in SK)
+        if '#VERSION#' not in item['SK']:
+            files.append(_format_file(item))
+    return success({'files': _sort_files(files, sort_by, sort_order)})
+
+
+def _sort_files(files, sort_by, sort_order):
     key_map = {'name': 'fileName', 'uploadedAt': 'uploadedAt', 'fileSize': 'fileSize'}
     sort_key = key_map.get(sort_by, 'fileName')
     files.sort(key=lambda f: f.get(sort_key, ''), reverse=(sort_order == 'desc'))
-
-    return success({'files': files})
+    return files
 
 
 def _format_file(item):
@@ -140,24 +149,24 @@ def generate_upload_url(event):
     table = get_table()
     now = int(time.time())
 
-    # Determine version number
-    existing = table.get_item(Key={'PK': f'FOLDER#{folder_id}', 'SK': f'FILE#{file_name}'})
-    if existing.get('Item'):
-        version = int(existing['Item'].get('latestVersion', 0)) + 1
+    # Latest pointer (for the version number) and folder (for its name) in one read
+    existing, folder = batch_get_items([
+        {'PK': f'FOLDER#{folder_id}', 'SK': f'FILE#{file_name}'},
+        {'PK': f'FOLDER#{folder_id}', 'SK': f'FOLDER#{folder_id}'},
+    ])
+    if existing:
+        version = int(existing.get('latestVersion', 0)) + 1
     else:
         version = 1
 
     s3_key = f'{folder_id}/{file_name}/v{version}'
-
-    # Get folder name
-    f_resp = table.get_item(Key={'PK': f'FOLDER#{folder_id}', 'SK': f'FOLDER#{folder_id}'})
-    folder_name = f_resp.get('Item', {}).get('folderName', '')
+    folder_name = (folder or {}).get('folderName', '')
 
     # Write version entry
     table.put_item(Item={
         'PK': f'FOLDER#{folder_id}',
         'SK': f'FILE#{file_name}#VERSION#{version}',
-        'fileId': str(uuid.uuid4()),
+        'fileId': new_id(),
         'fileName': file_name,
         'folderId': folder_id,
         'folderName': folder_name,
@@ -182,6 +191,7 @@ def generate_upload_url(event):
         'uploadedBy': session['username'],
         'uploadedAt': now,
     })
+    bump_revision(folder_scope(folder_id))
 
     # Generate pre-signed URL
     s3 = get_s3_client()
@@ -213,27 +223,22 @@ def generate_download_url(event):
     if not _has_folder_access(session, folder_id):
         return error('Forbidden', 403)
 
-    table = get_table()
-
     if version_number:
         # Specific version
-        resp = table.get_item(Key={
+        item = fast_get_item({
             'PK': f'FOLDER#{folder_id}',
             'SK': f'FILE#{file_name}#VERSION#{version_number}',
         })
-        item = resp.get('Item')
     else:
         # Latest version — look up pointer then get version entry
-        pointer = table.get_item(Key={'PK': f'FOLDER#{folder_id}', 'SK': f'FILE#{file_name}'})
-        p = pointer.get('Item')
+        p = fast_get_item({'PK': f'FOLDER#{folder_id}', 'SK': f'FILE#{file_name}'})
         if not p:
             return error('File not found', 404)
         v = int(p['latestVersion'])
-        resp = table.get_item(Key={
+        item = fast_get_item({
             'PK': f'FOLDER#{folder_id}',
             'SK': f'FILE#{file_name}#VERSION#{v}',
         })
-        item = resp.get('Item')
 
     if not item:
         return error('File version not found', 404)
@@ -258,13 +263,15 @@ def get_versions(event, folder_id, file_name):
     if not _has_folder_access(session, folder_id):
         return error('Forbidden', 403)
 
-    table = get_table()
-    resp = table.query(
-        KeyConditionExpression=Key('PK').eq(f'FOLDER#{folder_id}') & Key('SK').begins_with(f'FILE#{file_name}#VERSION#'),
-    )
+    etag = make_etag('versions', folder_id, file_name, get_revision(folder_scope(folder_id)))
+    return conditional(event, lambda: _list_versions(folder_id, file_name), etag)
+
 
+def _list_versions(folder_id, file_name):
     versions = []
-    for item in resp.get('Items', []):
+    for item in fast_query_items(
+        'PK = :pk AND begins_with(SK, :sk)', {':pk': f'FOLDER#{folder_id}', ':sk': f'FILE#{file_name}#VERSION#'},
+    ):
         versions.append({
             'versionNumber': item.get('versionNumber'),
             'fileSize': item.get('fileSize', 0),
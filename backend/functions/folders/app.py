@@ -1,14 +1,35 @@
 import json
-import uuid
+import logging
 import time
 import os
-import boto3
-from db_util import get_table, get_s3_client
-from session_util import validate_session, require_role
-from response_util import success, error
-from boto3.dynamodb.conditions import Key
-
-
+import db_util
+from db_util import (get_table, get_s3_client, query_items, fast_scan_items, batch_get_items, request_scope,
+    Key, error_code, new_id, TRANSACT_MAX_ITEMS)
+from session_util import validate_session, require_role, refresh_folder_acl
+from metrics_util import instrument_handler
+from response_util import success, error, negotiate_encoding, conditional, make_etag
+from revision_util import CATALOG, folder_scope, get_revision, bump_revision, delete_revision
+from assignment_util import FOLDER_FIELDS, TREE_PARTITION, assignment_item, folder_fields, put_assignments
+
+# Parallel scan segments for the admin listing's assignment scan; one
+# segment reads ~1MB of assignments per call, raise it for large tables
+ASSIGNMENT_SCAN_SEGMENTS = int(os.environ.get('ASSIGNMENT_SCAN_SEGMENTS', '1'))
+
+# Every folder stores its materialized path, the IDs from the top-level
+# folder down to itself each followed by '/' ('<top>/<child>/'), and is
+# indexed on GSI4 under TREE_PARTITION by that path: a subtree is one
+# begins_with range query, in parent-before-child order. parentFolderId
+# stays the source of truth that paths are derived from.
+
+# Deepest nesting allowed (top-level folders are depth 1). Each level adds a
+# 37-byte '<uuid>/' to the path, and GSI4SK, like any sort key, is limited to
+# 1024 bytes: 27 levels fit.
+FOLDER_MAX_DEPTH = 25
+
+
+@instrument_handler
+@negotiate_encoding
+@request_scope
 def lambda_handler(event, context):
     path = event.get('path', '')
     method = event.get('httpMethod', '')
@@ -27,6 +48,11 @@ def lambda_handler(event, context):
         return create_folder(event)
     elif path == '/folders' and method == 'GET':
         return list_folders(event)
+    elif path == '/folders/tree' and method == 'GET':
+        return folder_tree(event)
+    elif method == 'PUT' and '/folders/' in path:
+        folder_id = event['pathParameters']['folderId']
+        return move_folder(event, folder_id)
     elif method == 'DELETE' and '/folders/' in path:
         folder_id = event['pathParameters']['folderId']
         return delete_folder(event, folder_id)
@@ -48,129 +74,419 @@ def create_folder(event):
 
     table = get_table()
 
-    # Check duplicate name in same parent
-    resp = table.query(
-        IndexName='GSI2',
-        KeyConditionExpression=Key('GSI2PK').eq(f'PARENT#{parent_id}'),
-    )
-    for item in resp.get('Items', []):
-        if item.get('folderName') == folder_name:
-            return error('Folder name already exists in this location', 409)
-
-    folder_id = str(uuid.uuid4())
-    table.put_item(Item={
+    parent_path = ''
+    if parent_id != 'ROOT':
+        parent = _get_folder(parent_id)
+        if not parent:
+            return error('Parent folder not found', 404)
+        parent_path = _folder_path(parent)
+        if _depth(parent_path) >= FOLDER_MAX_DEPTH:
+            return error(f'Folders can be nested at most {FOLDER_MAX_DEPTH} levels deep')
+
+    if _name_taken(parent_id, folder_name):
+        return error('Folder name already exists in this location', 409)
+
+    folder_id = new_id()
+    folder_path = f'{parent_path}{folder_id}/'
+    item = {
         'PK': f'FOLDER#{folder_id}',
         'SK': f'FOLDER#{folder_id}',
         'GSI1PK': 'FOLDERS',
         'GSI1SK': f'FOLDER#{folder_id}',
         'GSI2PK': f'PARENT#{parent_id}',
         'GSI2SK': f'FOLDER#{folder_id}',
+        'GSI4PK': TREE_PARTITION,
+        'GSI4SK': folder_path,
         'folderId': folder_id,
         'folderName': folder_name,
         'parentFolderId': parent_id,
+        'folderPath': folder_path,
         'createdAt': int(time.time()),
-    })
+    }
+    if parent_id == 'ROOT':
+        table.put_item(Item=item)
+    else:
+        # The parent must still exist with the path read above: a folder
+        # created under a subtree while it moves would otherwise keep the
+        # old path and drop out of subtree queries
+        parent_check = {'TableName': table.name, 'Key': _folder_key(parent_id)}
+        if parent.get('folderPath'):
+            parent_check.update(ConditionExpression='folderPath = :pp',
+                                ExpressionAttributeValues={':pp': parent_path})
+        else:
+            parent_check.update(ConditionExpression='attribute_exists(PK) AND attribute_not_exists(folderPath)')
+        try:
+            db_util.transact_write_items([
+                {'ConditionCheck': parent_check},
+                {'Put': {'TableName': table.name, 'Item': item}},
+            ])
+        except db_util.ClientError as e:
+            if error_code(e) != 'TransactionCanceledException':
+                raise
+            return error('Parent folder was moved or deleted; retry', 409)
+    bump_revision(CATALOG)
     return success({'folderId': folder_id, 'folderName': folder_name}, 201)
 
 
+def _folder_key(folder_id):
+    return {'PK': f'FOLDER#{folder_id}', 'SK': f'FOLDER#{folder_id}'}
+
+
+def _get_folder(folder_id):
+    return get_table().get_item(Key=_folder_key(folder_id)).get('Item')
+
+
+def _name_taken(parent_id, folder_name):
+    return any(item.get('folderName') == folder_name for item in query_items(
+        IndexName='GSI2',
+        KeyConditionExpression=Key('GSI2PK').eq(f'PARENT#{parent_id}'),
+        projection=['folderName'],
+    ))
+
+
+def _depth(path):
+    return path.count('/')
+
+
+def _folder_path(folder):
+    """folder's materialized path. Folders created before paths were stored
+    derive it from their parents until scripts/backfill_folder_paths.py runs."""
+    if folder.get('folderPath'):
+        return folder['folderPath']
+    parent_id = folder.get('parentFolderId', 'ROOT')
+    parent = _get_folder(parent_id) if parent_id != 'ROOT' else None
+    return f'{_folder_path(parent) if parent else ""}{folder["folderId"]}/'
+
+
+TREE_FIELDS = ['folderId', 'folderName', 'parentFolderId', 'folderPath']
+
+
+def _subtree(folder, projection=TREE_FIELDS):
+    """folder and all its descendants, parents before children."""
+    if folder.get('folderPath'):
+        return _path_range(folder['folderPath'], projection)
+    # Not backfilled yet: walk parent pointers a level at a time
+    found = [folder]
+    for item in found:
+        found.extend(query_items(
+            IndexName='GSI2',
+            KeyConditionExpression=Key('GSI2PK').eq(f'PARENT#{item["folderId"]}'),
+            projection=projection,
+        ))
+    return found
+
+
+def _path_range(path, projection=TREE_FIELDS):
+    """Folders whose path starts with path, in path order."""
+    return list(query_items(
+        IndexName='GSI4',
+        KeyConditionExpression=Key('GSI4PK').eq(TREE_PARTITION) & Key('GSI4SK').begins_with(path),
+        projection=projection,
+    ))
+
+
+def _nest(folders, parent_of):
+    """Nest folders into [{..., 'children': [...]}], each under parent_of(folder)
+    when that is one of folders, else at the top; siblings by name."""
+    nodes = {f['folderId']: {
+        'folderId': f['folderId'],
+        'folderName': f['folderName'],
+        'parentFolderId': f.get('parentFolderId', 'ROOT'),
+        'children': [],
+    } for f in folders}
+    roots = []
+    for f in folders:
+        parent = nodes.get(parent_of(f))
+        (parent['children'] if parent else roots).append(nodes[f['folderId']])
+    for node in [*nodes.values(), {'children': roots}]:
+        node['children'].sort(key=lambda n: n['folderName'].lower())
+    return roots
+
+
+def _path_ids(path):
+    return path.rstrip('/').split('/') if path else []
+
+
 def list_folders(event):
     session = validate_session(event)
     if not session:
         return error('Unauthorized', 401)
 
-    table = get_table()
+    etag = make_etag('folders', get_revision(CATALOG), session['username'], session['role'])
+    return conditional(event, lambda: _list_folders(session), etag)
 
+
+def _list_folders(session):
     if session['role'] == 'admin':
-        # Admin sees all folders
-        resp = table.query(
-            IndexName='GSI1',
-            KeyConditionExpression=Key('GSI1PK').eq('FOLDERS'),
-        )
+        # Admin sees all folders. Assignment rows are the only items with
+        # GSI3 keys, so scanning that sparse index reads every assignment
+        # and nothing else; they are joined to folders here
+        assigned = {}
+        for a in fast_scan_items(index='GSI3', projection=['folderId', 'username'],
+                                 segments=ASSIGNMENT_SCAN_SEGMENTS):
+            assigned.setdefault(a['folderId'], []).append(a['username'])
         folders = []
-        for item in resp.get('Items', []):
-            # Get assigned users
-            assign_resp = table.query(
-                IndexName='GSI3',
-                KeyConditionExpression=Key('GSI3PK').eq(f'FOLDER#{item["folderId"]}'),
-            )
-            users = [a['username'] for a in assign_resp.get('Items', [])]
+        for item in query_items(IndexName='GSI1', KeyConditionExpression=Key('GSI1PK').eq('FOLDERS')):
             folders.append({
                 'folderId': item['folderId'],
                 'folderName': item['folderName'],
                 'parentFolderId': item.get('parentFolderId', 'ROOT'),
-                'assignedUsers': users,
+                # Sorted as the per-folder GSI3 query (by GSI3SK) returned them
+                'assignedUsers': sorted(assigned.get(item['folderId'], [])),
             })
     else:
-        # Non-admin sees only assigned folders
-        assign_resp = table.query(
+        # Non-admin sees only assigned folders, listed from the folder fields
+        # copied onto their assignment rows
+        rows = list(query_items(
             KeyConditionExpression=Key('PK').eq(f'USER#{session["username"]}') & Key('SK').begins_with('FOLDER#'),
-        )
+            projection=['folderId', *FOLDER_FIELDS],
+        ))
+        # Rows written before parentFolderId was copied read the folder until
+        # scripts/verify_assignments.py --repair has run
+        legacy = [r['folderId'] for r in rows if 'parentFolderId' not in r]
+        current = dict(zip(legacy, batch_get_items(
+            [{'PK': f'FOLDER#{fid}', 'SK': f'FOLDER#{fid}'} for fid in legacy],
+            projection=list(FOLDER_FIELDS),
+        )))
         folders = []
-        for a in assign_resp.get('Items', []):
-            f_resp = table.get_item(Key={'PK': f'FOLDER#{a["folderId"]}', 'SK': f'FOLDER#{a["folderId"]}'})
-            f = f_resp.get('Item')
-            if f:
+        for r in rows:
+            source = current[r['folderId']] if r['folderId'] in current else r
+            if source:
+                fields = folder_fields(source)
                 folders.append({
-                    'folderId': f['folderId'],
-                    'folderName': f['folderName'],
-                    'parentFolderId': f.get('parentFolderId', 'ROOT'),
+                    'folderId': r['folderId'],
+                    'folderName': fields['folderName'],
+                    'parentFolderId': fields['parentFolderId'],
                 })
 
     return success({'folders': folders})
 
 
-def delete_folder(event, folder_id):
+def folder_tree(event):
+    """GET /folders/tree[?folderId=]: the folders the caller can see, nested
+    ({..., 'children': [...]}, children by name), in one query. With folderId,
+    only that folder's subtree plus breadcrumbs, its ancestors and itself from
+    the top down."""
+    session = validate_session(event)
+    if not session:
+        return error('Unauthorized', 401)
+    folder_id = (event.get('queryStringParameters') or {}).get('folderId')
+
+    etag = make_etag('tree', get_revision(CATALOG), session['username'], session['role'], folder_id or '')
+    return conditional(event, lambda: _folder_tree(session, folder_id), etag)
+
+
+def _folder_tree(session, folder_id):
+    if session['role'] == 'admin':
+        if not folder_id:
+            # parentFolderId suffices for the whole tree, and covers folders
+            # created before paths were stored
+            folders = list(query_items(IndexName='GSI1', KeyConditionExpression=Key('GSI1PK').eq('FOLDERS'),
+                                       projection=['folderId', 'folderName', 'parentFolderId']))
+            return success({'tree': _nest(folders, lambda f: f.get('parentFolderId'))})
+
+        folder = _get_folder(folder_id)
+        if not folder:
+            return error('Folder not found', 404)
+        ancestor_ids = _path_ids(_folder_path(folder))[:-1]
+        ancestors = batch_get_items(
+            [{'PK': f'FOLDER#{fid}', 'SK': f'FOLDER#{fid}'} for fid in ancestor_ids],
+            projection=['folderId', 'folderName'],
+        )
+        breadcrumbs = [{'folderId': a['folderId'], 'folderName': a['folderName']} for a in ancestors if a]
+        breadcrumbs.append({'folderId': folder_id, 'folderName': folder['folderName']})
+        tree = _nest(_subtree(folder), lambda f: f.get('parentFolderId'))
+        return success({'tree': tree, 'breadcrumbs': breadcrumbs})
+
+    # Non-admin: their assigned folders, from the fields copied onto their
+    # assignment rows. Each hangs under its nearest assigned ancestor; names
+    # of folders they aren't assigned are never returned
+    rows = list(query_items(
+        KeyConditionExpression=Key('PK').eq(f'USER#{session["username"]}') & Key('SK').begins_with('FOLDER#'),
+        projection=['folderId', *FOLDER_FIELDS],
+    ))
+    assigned = {r['folderId']: r for r in rows}
+
+    def nearest_assigned_ancestor(r):
+        ancestors = _path_ids(r.get('folderPath'))[:-1] or [r.get('parentFolderId')]
+        return next((fid for fid in reversed(ancestors) if fid in assigned), None)
+
+    if folder_id:
+        if folder_id not in assigned:
+            return error('Forbidden', 403)
+        root = assigned[folder_id]
+        prefix = root.get('folderPath') or None
+        rows = [r for r in rows if r['folderId'] == folder_id
+                or (prefix and (r.get('folderPath') or '').startswith(prefix))]
+        breadcrumbs = [{'folderId': fid, 'folderName': assigned[fid]['folderName']}
+                       for fid in _path_ids(prefix) if fid in assigned] or [
+                       {'folderId': folder_id, 'folderName': root['folderName']}]
+        return success({'tree': _nest(rows, nearest_assigned_ancestor), 'breadcrumbs': breadcrumbs})
+    return success({'tree': _nest(rows, nearest_assigned_ancestor)})
+
+
+def move_folder(event, folder_id):
+    """PUT /folders/{folderId} {"parentFolderId": <id> or "ROOT"}: move a
+    folder and its subtree, rewriting their paths and the copies on their
+    assignment rows."""
     session = require_role(event, ['admin'])
     if not session:
         return error('Forbidden', 403)
 
+    body = json.loads(event.get('body') or '{}')
+    new_parent_id = body.get('parentFolderId') or 'ROOT'
+    folder = _get_folder(folder_id)
+    if not folder:
+        return error('Folder not found', 404)
+    if new_parent_id == folder.get('parentFolderId', 'ROOT'):
+        return success({'message': f'Folder {folder_id} moved'})
+
+    old_path = _folder_path(folder)
+    parent_path = ''
+    if new_parent_id != 'ROOT':
+        parent = _get_folder(new_parent_id)
+        if not parent:
+            return error('Parent folder not found', 404)
+        parent_path = _folder_path(parent)
+        if parent_path.startswith(old_path):
+            return error('Cannot move a folder into itself or its subfolders')
+    if _name_taken(new_parent_id, folder['folderName']):
+        return error('Folder name already exists in this location', 409)
+
+    # Full items: a large move rewrites them with BatchWriteItem puts
+    subtree = [f for f in _subtree(folder, projection=None) if f['folderId'] != folder_id]
+    new_paths = _chain_paths({folder_id: f'{parent_path}{folder_id}/'}, subtree)
+    if max(_depth(p) for p in new_paths.values()) > FOLDER_MAX_DEPTH:
+        return error(f'Folders can be nested at most {FOLDER_MAX_DEPTH} levels deep')
+    moved = dict(folder, parentFolderId=new_parent_id, GSI2PK=f'PARENT#{new_parent_id}')
+    if not _rewrite_paths([moved] + subtree, new_paths, moved):
+        return error('Folders changed during the move; retry', 409)
+
+    # A folder created under the subtree before the move rewrote its parent
+    # was written with the old path; create_folder's parent check stops any
+    # after that
+    if folder.get('folderPath'):
+        late = [f for f in _path_range(old_path, projection=None) if f['folderId'] not in new_paths]
+        if late and not _rewrite_paths(late, _chain_paths(new_paths, late)):
+            logging.getLogger(__name__).warning('Folders created during the move of %s kept old paths', folder_id)
+    bump_revision(CATALOG)
+    return success({'message': f'Folder {folder_id} moved'})
+
+
+def _chain_paths(paths, folders):
+    """Extend paths ({folderId: path}) to the folders that chain to one of
+    them through parentFolderId. Folders that don't (stale paths) are logged
+    and left for scripts/backfill_folder_paths.py."""
+    children = {}
+    for f in folders:
+        if f['folderId'] not in paths:
+            children.setdefault(f.get('parentFolderId'), []).append(f)
+    paths, queue = dict(paths), list(paths)
+    for fid in queue:
+        for child in children.pop(fid, []):
+            paths[child['folderId']] = f'{paths[fid]}{child["folderId"]}/'
+            queue.append(child['folderId'])
+    for stray in (f for group in children.values() for f in group):
+        logging.getLogger(__name__).warning(
+            'Folder %s is in the subtree by path but not by parentFolderId; skipped', stray['folderId'])
+    return paths
+
+
+def _rewrite_paths(folders, new_paths, moved=None):
+    """Write new_paths onto folders (full items) and their assignment rows,
+    plus the new parent on moved (the moved folder) and its rows.
+
+    If they fit, one transaction writes them all, or nothing and returns
+    False when a folder or row went away meanwhile. Otherwise the first
+    folder is written first and the rest in batches, which is not atomic:
+    scripts/backfill_folder_paths.py then verify_assignments.py --repair
+    redo the paths of a move interrupted part-way."""
+    writes = []
+    for f in folders:
+        path = new_paths.get(f['folderId'])
+        if path is None:
+            continue
+        writes.append(dict(f, folderPath=path, GSI4PK=TREE_PARTITION, GSI4SK=path))
+        fields = {'folderPath': path}
+        if moved is not None and f['folderId'] == moved['folderId']:
+            fields['parentFolderId'] = moved['parentFolderId']
+        writes.extend(dict(row, **fields) for row in query_items(
+            IndexName='GSI3', KeyConditionExpression=Key('GSI3PK').eq(f'FOLDER#{f["folderId"]}')))
+    if not writes:
+        return True
+
     table = get_table()
-    existing = table.get_item(Key={'PK': f'FOLDER#{folder_id}', 'SK': f'FOLDER#{folder_id}'})
-    if not existing.get('Item'):
+    if len(writes) <= TRANSACT_MAX_ITEMS:
+        try:
+            db_util.transact_write_items([
+                # Don't resurrect a folder deleted or a row unassigned meanwhile
+                {'Put': {'TableName': table.name, 'Item': item, 'ConditionExpression': 'attribute_exists(PK)'}}
+                for item in writes])
+        except db_util.ClientError as e:
+            if error_code(e) != 'TransactionCanceledException':
+                raise
+            return False
+        return True
+    # The moved folder's parent pointer is the source of truth; write it first
+    table.put_item(Item=writes[0])
+    with table.batch_writer() as batch:
+        for item in writes[1:]:
+            batch.put_item(Item=item)
+    return True
+
+
+def delete_folder(event, folder_id):
+    session = require_role(event, ['admin'])
+    if not session:
+        return error('Forbidden', 403)
+
+    folder = _get_folder(folder_id)
+    if not folder:
         return error('Folder not found', 404)
 
-    _recursive_delete(table, folder_id)
+    # Children before their parents, so an interrupted delete leaves no
+    # folder whose parent is gone
+    table = get_table()
+    for item in reversed(_subtree(folder)):
+        _delete_one_folder(table, item['folderId'])
+    bump_revision(CATALOG)
     return success({'message': f'Folder {folder_id} deleted'})
 
 
-def _recursive_delete(table, folder_id):
-    # Delete child folders first
-    children = table.query(
-        IndexName='GSI2',
-        KeyConditionExpression=Key('GSI2PK').eq(f'PARENT#{folder_id}'),
-    )
-    for child in children.get('Items', []):
-        _recursive_delete(table, child['folderId'])
-
-    # Delete files in S3
+def _delete_one_folder(table, folder_id):
+    # Delete files in S3 (list pages and delete_objects both cap at 1000 keys)
     s3 = get_s3_client()
     bucket = os.environ['FILE_BUCKET']
-    resp = s3.list_objects_v2(Bucket=bucket, Prefix=f'{folder_id}/')
-    if 'Contents' in resp:
-        s3.delete_objects(
-            Bucket=bucket,
-            Delete={'Objects': [{'Key': o['Key']} for o in resp['Contents']]},
-        )
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=f'{folder_id}/'):
+        if 'Contents' in page:
+            s3.delete_objects(
+                Bucket=bucket,
+                Delete={'Objects': [{'Key': o['Key']} for o in page['Contents']]},
+            )
 
     # Delete file metadata from DynamoDB
-    file_resp = table.query(
-        KeyConditionExpression=Key('PK').eq(f'FOLDER#{folder_id}') & Key('SK').begins_with('FILE#'),
-    )
     with table.batch_writer() as batch:
-        for item in file_resp.get('Items', []):
+        for item in query_items(
+            KeyConditionExpression=Key('PK').eq(f'FOLDER#{folder_id}') & Key('SK').begins_with('FILE#'),
+            projection=['PK', 'SK'],
+        ):
             batch.delete_item(Key={'PK': item['PK'], 'SK': item['SK']})
 
     # Delete assignments
-    assign_resp = table.query(
+    assigned_users = [item['username'] for item in query_items(
         IndexName='GSI3',
         KeyConditionExpression=Key('GSI3PK').eq(f'FOLDER#{folder_id}'),
-    )
+        projection=['username'],
+    )]
     with table.batch_writer() as batch:
-        for item in assign_resp.get('Items', []):
-            batch.delete_item(Key={'PK': f'USER#{item["username"]}', 'SK': f'FOLDER#{folder_id}'})
+        for username in assigned_users:
+            batch.delete_item(Key={'PK': f'USER#{username}', 'SK': f'FOLDER#{folder_id}'})
+    for username in assigned_users:
+        refresh_folder_acl(username)
 
     # Delete folder itself
     table.delete_item(Key={'PK': f'FOLDER#{folder_id}', 'SK': f'FOLDER#{folder_id}'})
+    delete_revision(folder_scope(folder_id))
 
 
 def assign_folders(event):
@@ -185,27 +501,20 @@ def assign_folders(event):
     if not username or not folder_ids:
         return error('username and folderIds required')
 
-    table = get_table()
-
-    # Verify user exists
-    user_resp = table.get_item(Key={'PK': f'USER#{username}', 'SK': f'USER#{username}'})
-    if not user_resp.get('Item'):
+    # Verify user exists and look up folder names in one batch read
+    user, *folder_items = batch_get_items(
+        [{'PK': f'USER#{username}', 'SK': f'USER#{username}'}]
+        + [{'PK': f'FOLDER#{fid}', 'SK': f'FOLDER#{fid}'} for fid in folder_ids],
+    )
+    if not user:
         return error('User not found', 404)
 
-    with table.batch_writer() as batch:
-        for fid in folder_ids:
-            f_resp = table.get_item(Key={'PK': f'FOLDER#{fid}', 'SK': f'FOLDER#{fid}'})
-            folder = f_resp.get('Item', {})
-            batch.put_item(Item={
-                'PK': f'USER#{username}',
-                'SK': f'FOLDER#{fid}',
-                'GSI3PK': f'FOLDER#{fid}',
-                'GSI3SK': f'USER#{username}',
-                'username': username,
-                'folderId': fid,
-                'folderName': folder.get('folderName', ''),
-                'assignedAt': int(time.time()),
-            })
+    # Folders that don't exist get no row: there is nothing to list
+    if not put_assignments(username, [assignment_item(username, fid, folder)
+                                      for fid, folder in zip(folder_ids, folder_items) if folder]):
+        return error('User not found', 404)
+    refresh_folder_acl(username)
+    bump_revision(CATALOG)
 
     return success({'message': f'Folders assigned to {username}'})
 
@@ -226,5 +535,7 @@ def unassign_folders(event):
     with table.batch_writer() as batch:
         for fid in folder_ids:
             batch.delete_item(Key={'PK': f'USER#{username}', 'SK': f'FOLDER#{fid}'})
+    refresh_folder_acl(username)
+    bump_revision(CATALOG)
 
     return success({'message': f'Folders unassigned from {username}'})
@@ -0,0 +1,99 @@
+"""Single-function deploy mode: one Lambda serving every route.
+
+The route table below maps each API route to the module that implements it.
+Modules are imported on first use, and all of them share this container's
+clients and caches (db_util, session_util, throttle_util)."""
+import importlib
+import re
+from session_util import validate_session, require_role
+from metrics_util import instrument_handler, set_route
+from response_util import success, error, negotiate_encoding
+
+# Handler modules sit next to this package: 'functions.router.app' in tests and
+# local_server, 'router.app' when functions/ is the Lambda code root.
+_PACKAGE_ROOT = __name__[:-len('router.app')]
+
+PUBLIC = None      # no session needed
+SESSION = 'session'  # any valid session, else 401
+
+# (method, path pattern, module, auth): auth is PUBLIC, SESSION or a tuple of
+# roles (anything else gets 403). Handlers still run their own checks.
+ROUTES = [
+    ('POST', '/auth/login', 'auth', PUBLIC),
+    ('POST', '/auth/logout', 'auth', SESSION),
+    ('POST', '/auth/change-password', 'auth', SESSION),
+    ('POST', '/auth/seed-admin', 'auth', PUBLIC),
+    ('POST', '/users', 'users', ('admin',)),
+    ('GET', '/users', 'users', ('admin',)),
+    ('POST', '/users/import', 'users', ('admin',)),
+    ('DELETE', '/users', 'users', ('admin',)),
+    ('PUT', '/users/{username}', 'users', ('admin',)),
+    ('DELETE', '/users/{username}', 'users', ('admin',)),
+    ('POST', '/folders', 'folders', ('admin',)),
+    ('GET', '/folders', 'folders', SESSION),
+    ('POST', '/folders/assignments', 'folders', ('admin',)),
+    ('DELETE', '/folders/assignments', 'folders', ('admin',)),
+    ('GET', '/folders/tree', 'folders', SESSION),
+    ('PUT', '/folders/{folderId}', 'folders', ('admin',)),
+    ('DELETE', '/folders/{folderId}', 'folders', ('admin',)),
+    ('GET', '/files', 'files', SESSION),
+    ('POST', '/files/upload-url', 'files', ('admin', 'uploader')),
+    ('POST', '/files/download-url', 'files', ('admin', 'reader')),
+    ('GET', '/files/{folderId}/{fileName}/versions', 'files', SESSION),
+]
+
+
+def _compile(pattern):
+    return re.compile('^' + re.sub(r'\{(\w+)\}', r'(?P<\1>[^/]+)', pattern) + '$')
+
+
+# Literal routes are listed before parameterised ones that could shadow them
+# (e.g. /folders/assignments before /folders/{folderId}), and matched in order.
+_COMPILED = [(method, _compile(pattern), module, auth, pattern) for method, pattern, module, auth in ROUTES]
+_modules = {}
+
+
+def _handler_for(module):
+    if module not in _modules:
+        _modules[module] = importlib.import_module(f'{_PACKAGE_ROOT}{module}.app').lambda_handler
+    return _modules[module]
+
+
+def match_route(method, path):
+    """Return (module, auth, path_params, pattern) for a request, or None."""
+    for route_method, regex, module, auth, pattern in _COMPILED:
+        if route_method != method:
+            continue
+        m = regex.match(path)
+        if m:
+            return module, auth, m.groupdict(), pattern
+    return None
+
+
+@instrument_handler
+@negotiate_encoding
+def lambda_handler(event, context):
+    path = event.get('path', '')
+    method = event.get('httpMethod', '')
+
+    route = match_route(method, path)
+    # Before any early return: the raw path would make the metric dimension unbounded
+    set_route(f'{method} {route[3]}' if route else f'{method} UNMATCHED')
+
+    if method == 'OPTIONS':
+        return success({})
+    if not route:
+        return error('Not found', 404)
+    module, auth, path_params, pattern = route
+
+    if auth == SESSION and not validate_session(event):
+        return error('Unauthorized', 401)
+    if isinstance(auth, tuple) and not require_role(event, auth):
+        return error('Forbidden', 403)
+
+    # API Gateway fills pathParameters (decoded) and resource for explicit
+    # routes; behind /{proxy+} they come from the matched route instead
+    event = dict(event, resource=pattern)
+    if path_params:
+        event['pathParameters'] = {**path_params, **(event.get('pathParameters') or {})}
+    return _handler_for(module)(event, context)
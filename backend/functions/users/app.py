@@ -1,12 +1,44 @@
+import csv
+import io
 import json
+import logging
+import os
 import time
-from db_util import get_table
-from session_util import validate_session, require_role, delete_sessions_for_user
+from concurrent.futures import ThreadPoolExecutor
+import db_util
+from db_util import (get_table, query_page, fast_query_items, batch_get_items, batch_delete_items,
+    request_scope, Key, error_code, TRANSACT_MAX_ITEMS)
+from session_util import (validate_session, require_role, session_keys_for_user, forget_sessions,
+    refresh_folder_acl, load_folder_acl)
 from password_util import hash_password
-from response_util import success, error
-from boto3.dynamodb.conditions import Key
+from metrics_util import instrument_handler
+from response_util import success, error, negotiate_encoding, conditional
+from revision_util import CATALOG, bump_revision
+from assignment_util import FOLDER_FIELDS, assignment_item, put_assignments
 
+# GET /users page size (limit parameter) default and cap
+USERS_PAGE_SIZE = int(os.environ.get('USERS_PAGE_SIZE', '50'))
+USERS_PAGE_MAX = 200
 
+ROLES = ('admin', 'uploader', 'reader', 'viewer')
+
+# POST /users/import: rows per request, password hashing threads (PBKDF2
+# releases the GIL, so threads scale with the function's vCPUs) and how close
+# to the Lambda timeout to stop writing
+IMPORT_MAX_ROWS = int(os.environ.get('IMPORT_MAX_ROWS', '5000'))
+IMPORT_HASH_WORKERS = int(os.environ.get('IMPORT_HASH_WORKERS', str(os.cpu_count() or 2)))
+IMPORT_TIME_MARGIN_MS = 2000
+
+# DELETE /users: users per request and users deleted concurrently
+BULK_DELETE_MAX_USERS = int(os.environ.get('BULK_DELETE_MAX_USERS', '1000'))
+BULK_DELETE_WORKERS = int(os.environ.get('BULK_DELETE_WORKERS', '8'))
+
+TRANSACT_WRITE_ATTEMPTS = 4
+
+
+@instrument_handler
+@negotiate_encoding
+@request_scope
 def lambda_handler(event, context):
     path = event.get('path', '')
     method = event.get('httpMethod', '')
@@ -20,11 +52,15 @@ def lambda_handler(event, context):
 
     if path == '/users' and method == 'POST':
         return create_user(event)
+    elif path == '/users/import' and method == 'POST':
+        return import_users(event, context)
     elif path == '/users' and method == 'GET':
-        return list_users()
+        return conditional(event, lambda: list_users(event))
     elif method == 'PUT' and path.startswith('/users/'):
         username = event['pathParameters']['username']
         return update_user(event, username)
+    elif path == '/users' and method == 'DELETE':
+        return delete_users(event)
     elif method == 'DELETE' and path.startswith('/users/'):
         username = event['pathParameters']['username']
         return delete_user(username)
@@ -46,48 +82,254 @@ def create_user(event):
     if existing.get('Item'):
         return error('Username already exists', 409)
 
-    table.put_item(Item={
+    table.put_item(Item=_user_item(username, role, hash_password(password)))
+
+    # Optional folder assignments during creation
+    folder_ids = body.get('folderIds', [])
+    if folder_ids:
+        _assign_folders(username, folder_ids)
+
+    return success({'message': f'User {username} created'}, 201)
+
+
+def _user_item(username, role, password_hash, folder_ids=()):
+    return {
         'PK': f'USER#{username}',
         'SK': f'USER#{username}',
         'GSI1PK': 'USERS',
         'GSI1SK': f'USER#{username}',
+        'GSI2PK': f'ROLE#{role}',
+        'GSI2SK': f'USER#{username}',
         'username': username,
-        'passwordHash': hash_password(password),
+        'passwordHash': password_hash,
         'role': role,
         'mustChangePassword': False,
         'createdAt': int(time.time()),
-    })
+        'folderIds': list(folder_ids),
+    }
 
-    # Optional folder assignments during creation
-    folder_ids = body.get('folderIds', [])
-    if folder_ids:
-        _assign_folders(table, username, folder_ids)
 
-    return success({'message': f'User {username} created'}, 201)
+def _import_rows(event):
+    """Rows from a JSON body ({"users": [...]} or a bare list) or, with
+    Content-Type text/csv, a CSV with a header row and an optional UTF-8 BOM
+    (Excel writes one). CSV folderIds are separated by semicolons or spaces."""
+    headers = event.get('headers') or {}
+    content_type = next((v for k, v in headers.items() if k.lower() == 'content-type'), '') or ''
+    body = event.get('body') or ''
+    if 'csv' in content_type.lower():
+        rows = []
+        for row in csv.DictReader(io.StringIO(body.lstrip('\ufeff'))):
+            row = {k.strip(): (v or '').strip() for k, v in row.items() if k}
+            row['folderIds'] = row.get('folderIds', '').replace(';', ' ').split()
+            rows.append(row)
+        return rows
+    data = json.loads(body or '[]')
+    rows = data.get('users') if isinstance(data, dict) else data
+    if not isinstance(rows, list):
+        raise ValueError('Expected a list of users')
+    return rows
+
+
+def _validate_import_row(row, seen):
+    if not isinstance(row, dict):
+        return 'Row must be an object'
+    username = str(row.get('username') or '').strip()
+    folder_ids = row.get('folderIds') or []
+    password = row.get('password')
+    if not username or not password or not isinstance(password, str) or row.get('role') not in ('uploader', 'reader', 'viewer'):
+        return 'username, password, and role (uploader/reader/viewer) required'
+    if username in seen:
+        return 'Duplicate username in import'
+    if not isinstance(folder_ids, list) or not all(isinstance(f, str) for f in folder_ids):
+        return 'folderIds must be a list of folder IDs'
+    if len(set(folder_ids)) >= TRANSACT_MAX_ITEMS:
+        return f'At most {TRANSACT_MAX_ITEMS - 1} folderIds per user'
+    return None
+
 
+def import_users(event, context=None):
+    """Create many users in one request. Passwords are hashed in a thread
+    pool; users are written with TransactWriteItems, each user item guarded
+    by attribute_not_exists(PK) so existing usernames are reported instead of
+    overwritten, with no pre-reads. Returns a per-row report; rows left
+    unprocessed near the Lambda timeout are reported with status 503 and can
+    be resubmitted."""
+    try:
+        rows = _import_rows(event)
+    except (ValueError, csv.Error) as e:
+        return error(f'Invalid import body: {e}')
+    if not rows:
+        return error('No users to import')
+    if len(rows) > IMPORT_MAX_ROWS:
+        return error(f'At most {IMPORT_MAX_ROWS} users per import', 413)
+
+    results = [None] * len(rows)
+    valid = []
+    seen = set()
+    for i, row in enumerate(rows):
+        problem = _validate_import_row(row, seen)
+        username = str(row.get('username') or '').strip() if isinstance(row, dict) else ''
+        if problem:
+            results[i] = {'row': i + 1, 'username': username, 'status': 400, 'error': problem}
+            continue
+        seen.add(username)
+        valid.append((i, username, row['role'], row['password'], list(dict.fromkeys(row.get('folderIds') or []))))
+
+    # Folder fields for the assignment rows, one batched read for the import
+    folder_ids = list(dict.fromkeys(fid for *_, fids in valid for fid in fids))
+    folders = dict(zip(folder_ids, batch_get_items(
+        [{'PK': f'FOLDER#{fid}', 'SK': f'FOLDER#{fid}'} for fid in folder_ids], projection=list(FOLDER_FIELDS))))
+    pending = []
+    for i, username, role, password, fids in valid:
+        unknown = [fid for fid in fids if folders[fid] is None]
+        if unknown:
+            results[i] = {'row': i + 1, 'username': username, 'status': 400,
+                          'error': f'Unknown folderIds: {", ".join(unknown)}'}
+        else:
+            pending.append((i, username, role, password, fids))
+
+    def out_of_time():
+        return context is not None and context.get_remaining_time_in_millis() < IMPORT_TIME_MARGIN_MS
+
+    def hash_row(row):
+        try:
+            return hash_password(row[3])
+        except Exception:
+            # One bad row must not discard the report for rows already written
+            logging.getLogger(__name__).exception('Hashing password for import row %d failed', row[0] + 1)
+            return None
 
-def list_users():
     table = get_table()
-    resp = table.query(
-        IndexName='GSI1',
-        KeyConditionExpression=Key('GSI1PK').eq('USERS'),
-    )
-    users = []
-    for item in resp.get('Items', []):
-        username = item['username']
-        # Get folder assignments for this user
-        assign_resp = table.query(
-            KeyConditionExpression=Key('PK').eq(f'USER#{username}') & Key('SK').begins_with('FOLDER#'),
+    assigned = False
+    with ThreadPoolExecutor(max_workers=max(1, IMPORT_HASH_WORKERS)) as pool:
+        # Hashes arrive in row order while later ones are still computing, so
+        # each transaction is written as soon as its rows are hashed
+        hashes = pool.map(hash_row, pending)
+        chunk, size = [], 0
+        for row, password_hash in zip(pending, hashes):
+            if out_of_time():
+                break
+            i, username, role, _, fids = row
+            if password_hash is None:
+                results[i] = {'row': i + 1, 'username': username, 'status': 500, 'error': 'Password hashing failed'}
+                continue
+            actions = [_user_item(username, role, password_hash, fids)] + [
+                assignment_item(username, fid, folders[fid]) for fid in fids]
+            if size + len(actions) > TRANSACT_MAX_ITEMS:
+                _write_import_chunk(table, chunk, results)
+                chunk, size = [], 0
+            chunk.append((i, username, actions))
+            size += len(actions)
+            assigned = assigned or bool(fids)
+        if chunk:
+            _write_import_chunk(table, chunk, results)
+        pool.shutdown(cancel_futures=True)
+
+    for i, username, *_ in pending:
+        if results[i] is None:
+            results[i] = {'row': i + 1, 'username': username, 'status': 503,
+                          'error': 'Not processed before the time limit; resubmit'}
+    if assigned:
+        bump_revision(CATALOG)
+    created = sum(1 for r in results if r['status'] == 201)
+    return success({'created': created, 'failed': len(results) - created, 'results': results})
+
+
+def _write_import_chunk(table, chunk, results):
+    """Write [(row index, username, items)] in one transaction, the first
+    item of each being the user item. A cancelled transaction reports a
+    reason per action: users that already exist are dropped and the rest
+    retried, with backoff if the cancellation was a conflict or throttle."""
+    for attempt in range(TRANSACT_WRITE_ATTEMPTS):
+        if not chunk:
+            return
+        transact = []
+        for _, _, items in chunk:
+            transact.append({'Put': {'TableName': table.name, 'Item': items[0],
+                                     'ConditionExpression': 'attribute_not_exists(PK)'}})
+            transact.extend({'Put': {'TableName': table.name, 'Item': item}} for item in items[1:])
+        try:
+            db_util.transact_write_items(transact)
+        except db_util.ClientError as e:
+            if error_code(e) != 'TransactionCanceledException':
+                raise
+            reasons = [r.get('Code', 'None') for r in e.response.get('CancellationReasons', [])]
+        else:
+            for i, username, _ in chunk:
+                results[i] = {'row': i + 1, 'username': username, 'status': 201}
+            return
+
+        retry, offset, retryable = [], 0, False
+        for i, username, items in chunk:
+            codes = reasons[offset:offset + len(items)]
+            offset += len(items)
+            if codes and codes[0] == 'ConditionalCheckFailed':
+                results[i] = {'row': i + 1, 'username': username, 'status': 409, 'error': 'Username already exists'}
+            elif any(code == 'ValidationError' for code in codes):
+                results[i] = {'row': i + 1, 'username': username, 'status': 400, 'error': 'Rejected by DynamoDB'}
+            else:
+                retryable = retryable or any(code not in ('None', '') for code in codes)
+                retry.append((i, username, items))
+        chunk = retry
+        if retryable:
+            db_util.backoff(attempt)
+    for i, username, _ in chunk:
+        results[i] = {'row': i + 1, 'username': username, 'status': 503, 'error': 'Write failed; resubmit'}
+
+
+def list_users(event):
+    """One page of users, by username. Query parameters: limit, cursor (from
+    the previous page's nextCursor), role, prefix (case-sensitive username
+    prefix) and sortOrder (asc/desc). Filters are key conditions: GSI1 for
+    all users, GSI2 (ROLE#<role>) for one role."""
+    params = event.get('queryStringParameters') or {}
+    role = params.get('role')
+    prefix = params.get('prefix', '')
+    try:
+        limit = int(params.get('limit', USERS_PAGE_SIZE))
+    except ValueError:
+        return error('limit must be an integer')
+    if not 1 <= limit <= USERS_PAGE_MAX:
+        return error(f'limit must be between 1 and {USERS_PAGE_MAX}')
+    if role is not None and role not in ROLES:
+        return error(f'role must be one of {", ".join(ROLES)}')
+
+    if role:
+        index, pk, sk = 'GSI2', Key('GSI2PK').eq(f'ROLE#{role}'), Key('GSI2SK')
+    else:
+        index, pk, sk = 'GSI1', Key('GSI1PK').eq('USERS'), Key('GSI1SK')
+    try:
+        items, next_cursor = query_page(
+            limit, params.get('cursor'),
+            IndexName=index,
+            KeyConditionExpression=pk & sk.begins_with(f'USER#{prefix}'),
+            ScanIndexForward=params.get('sortOrder', 'asc') != 'desc',
+            projection=['username', 'role', 'createdAt', 'mustChangePassword', 'folderIds'],
         )
-        folders = [a['folderId'] for a in assign_resp.get('Items', [])]
+    except ValueError:
+        return error('Invalid cursor')
+    except db_util.ClientError as e:
+        # A well-formed cursor from a different query
+        if error_code(e) == 'ValidationException':
+            return error('Invalid cursor')
+        raise
+
+    users = []
+    for item in items:
+        # Assignment snapshot kept on the user item by refresh_folder_acl;
+        # users written before it existed are read directly until
+        # scripts/backfill_users.py has run
+        folders = item.get('folderIds')
+        if folders is None:
+            folders = load_folder_acl(item['username'])
         users.append({
-            'username': username,
+            'username': item['username'],
             'role': item['role'],
             'createdAt': item.get('createdAt'),
             'mustChangePassword': item.get('mustChangePassword', False),
             'assignedFolders': folders,
         })
-    return success({'users': users})
+    return success({'users': users, 'nextCursor': next_cursor})
 
 
 def update_user(event, username):
@@ -101,10 +343,14 @@ def update_user(event, username):
     updates = []
     values = {}
     names = {}
-    if 'role' in body and body['role'] in ('uploader', 'reader', 'viewer', 'admin'):
+    if 'role' in body and body['role'] in ROLES:
         updates.append('#r = :r')
         values[':r'] = body['role']
         names['#r'] = 'role'
+        # Keep the by-role index entry in step
+        updates.append('GSI2PK = :rk, GSI2SK = :uk')
+        values[':rk'] = f'ROLE#{body["role"]}'
+        values[':uk'] = f'USER#{username}'
     if 'password' in body and body['password']:
         updates.append('passwordHash = :h')
         values[':h'] = hash_password(body['password'])
@@ -127,41 +373,128 @@ def delete_user(username):
     if username == 'admin':
         return error('Cannot delete admin account')
 
-    table = get_table()
-    existing = table.get_item(Key={'PK': f'USER#{username}', 'SK': f'USER#{username}'})
-    if not existing.get('Item'):
+    result = _cascade_delete_user(username)
+    if result['status'] == 404:
         return error('User not found', 404)
+    forget_sessions([username])
+    if result['assignments']:
+        bump_revision(CATALOG)
+    return success({'message': f'User {username} deleted'})
 
-    # Delete user record
-    table.delete_item(Key={'PK': f'USER#{username}', 'SK': f'USER#{username}'})
 
-    # Delete all folder assignments
-    assign_resp = table.query(
-        KeyConditionExpression=Key('PK').eq(f'USER#{username}') & Key('SK').begins_with('FOLDER#'),
-    )
-    with table.batch_writer() as batch:
-        for item in assign_resp.get('Items', []):
-            batch.delete_item(Key={'PK': item['PK'], 'SK': item['SK']})
+def delete_users(event):
+    """Cascade-delete the users in {"usernames": [...]}, BULK_DELETE_WORKERS
+    at a time. Reports status, mode, item counts and time per user."""
+    body = json.loads(event.get('body') or '{}')
+    usernames = body.get('usernames')
+    if not isinstance(usernames, list) or not usernames or not all(isinstance(u, str) and u for u in usernames):
+        return error('usernames must be a non-empty list')
+    usernames = list(dict.fromkeys(usernames))
+    if len(usernames) > BULK_DELETE_MAX_USERS:
+        return error(f'At most {BULK_DELETE_MAX_USERS} users per request', 413)
 
-    # Delete all sessions
-    delete_sessions_for_user(username)
+    def delete_one(username):
+        if username == 'admin':
+            return {'username': username, 'status': 400, 'error': 'Cannot delete admin account'}
+        try:
+            return _cascade_delete_user(username)
+        except (db_util.ClientError, RuntimeError):
+            # Whatever was deleted leaves no orphans; deleting again finishes it
+            logging.getLogger(__name__).exception('Deleting user %s failed', username)
+            return {'username': username, 'status': 503, 'error': 'Delete failed; retry'}
 
-    return success({'message': f'User {username} deleted'})
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(BULK_DELETE_WORKERS, len(usernames)))) as pool:
+        results = list(pool.map(delete_one, usernames))
+    deleted = [r for r in results if r['status'] == 200]
+    forget_sessions(r['username'] for r in deleted)
+    if any(r['assignments'] for r in deleted):
+        bump_revision(CATALOG)
+    return success({
+        'deleted': len(deleted),
+        'failed': len(results) - len(deleted),
+        'ms': _elapsed_ms(start),
+        'results': results,
+    })
+
+
+def _elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def _cascade_delete_user(username):
+    """Delete a user item with its folder assignments and opaque sessions.
+
+    If they fit in one TransactWriteItems, they go together, guarded by the
+    user item still existing. Otherwise sessions and assignments are deleted
+    in concurrent BatchWriteItem chunks and the user item last, so a failure
+    part-way leaves a user that can be deleted again rather than orphaned
+    assignments. Once the user item is gone no assignment can be added
+    (put_assignments checks for it), so re-reading the partition then
+    catches any that landed after the first read. Uses the low-level client
+    only, so it is safe to run in worker threads; the caller handles
+    forget_sessions and the revision."""
+    start = time.perf_counter()
+    table = get_table()
+    user_key = {'PK': f'USER#{username}', 'SK': f'USER#{username}'}
+    # The user item and its assignments share the USER#<username> partition
+    items = list(fast_query_items('PK = :pk', {':pk': user_key['PK']}, projection=['PK', 'SK']))
+    assignments = [item for item in items if item['SK'] != user_key['SK']]
+    if len(assignments) == len(items):
+        return {'username': username, 'status': 404, 'error': 'User not found'}
+    sessions = list(session_keys_for_user(username))
+    keys = assignments + sessions
+
+    if len(keys) < TRANSACT_MAX_ITEMS:
+        mode = 'transaction'
+        if not _transact_delete(table, user_key, keys):
+            return {'username': username, 'status': 404, 'error': 'User not found'}
+    else:
+        mode = 'batched'
+        batch_delete_items(keys)
+        table.meta.client.delete_item(TableName=table.name, Key=user_key)
+    late = list(fast_query_items('PK = :pk', {':pk': user_key['PK']}, projection=['PK', 'SK']))
+    if late:
+        batch_delete_items(late)
+        assignments += late
+    return {
+        'username': username,
+        'status': 200,
+        'mode': mode,
+        'assignments': len(assignments),
+        'sessions': len(sessions),
+        'ms': _elapsed_ms(start),
+    }
 
 
-def _assign_folders(table, username, folder_ids):
-    with table.batch_writer() as batch:
-        for fid in folder_ids:
-            # Look up folder name
-            f_resp = table.get_item(Key={'PK': f'FOLDER#{fid}', 'SK': f'FOLDER#{fid}'})
-            folder = f_resp.get('Item', {})
-            batch.put_item(Item={
-                'PK': f'USER#{username}',
-                'SK': f'FOLDER#{fid}',
-                'GSI3PK': f'FOLDER#{fid}',
-                'GSI3SK': f'USER#{username}',
-                'username': username,
-                'folderId': fid,
-                'folderName': folder.get('folderName', ''),
-                'assignedAt': int(time.time()),
-            })
+def _transact_delete(table, user_key, keys):
+    """Delete user_key and keys atomically. False if the user item is already gone."""
+    transact = [{'Delete': {'TableName': table.name, 'Key': user_key,
+                            'ConditionExpression': 'attribute_exists(PK)'}}]
+    transact.extend({'Delete': {'TableName': table.name, 'Key': {'PK': k['PK'], 'SK': k['SK']}}} for k in keys)
+    for attempt in range(TRANSACT_WRITE_ATTEMPTS):
+        try:
+            db_util.transact_write_items(transact)
+            return True
+        except db_util.ClientError as e:
+            if error_code(e) != 'TransactionCanceledException':
+                raise
+            reasons = [r.get('Code') for r in e.response.get('CancellationReasons', [])]
+            if reasons and reasons[0] == 'ConditionalCheckFailed':
+                return False
+        # Conflict with another transaction or throttled: back off and retry
+        db_util.backoff(attempt)
+    raise RuntimeError(f'Could not delete {user_key["PK"]}')
+
+
+def _assign_folders(username, folder_ids):
+    # Look up the folder fields copied onto assignment rows in one batch read
+    folder_items = batch_get_items(
+        [{'PK': f'FOLDER#{fid}', 'SK': f'FOLDER#{fid}'} for fid in folder_ids],
+        projection=list(FOLDER_FIELDS),
+    )
+    # Folders that don't exist get no row: there is nothing to list
+    put_assignments(username, [assignment_item(username, fid, folder)
+                               for fid, folder in zip(folder_ids, folder_items) if folder])
+    refresh_folder_acl(username)
+    bump_revision(CATALOG)
@@ -0,0 +1,118 @@
+import time
+import db_util
+from db_util import get_table, fast_scan_items, batch_get_items, error_code, TRANSACT_MAX_ITEMS
+
+# Assignment rows (USER#<username> / FOLDER#<folderId>) carry a copy of the
+# folder fields the folder views display, so a non-admin listing or tree is
+# one query over the user's partition. Moving a folder rewrites the copies
+# for its subtree; otherwise copies drift only through rows written before a
+# field was copied or an assignment racing a folder delete or move (see
+# find_drift).
+FOLDER_FIELDS = ('folderName', 'parentFolderId', 'folderPath')
+
+# GSI4 partition holding every folder, sorted by folderPath
+TREE_PARTITION = 'FOLDERTREE'
+
+# Assignment rows per transaction in put_assignments; one of the
+# transaction's actions is the user item check
+PUT_ASSIGNMENTS_CHUNK = TRANSACT_MAX_ITEMS - 1
+PUT_ASSIGNMENTS_ATTEMPTS = 4
+
+
+def assignment_item(username, folder_id, folder):
+    """The assignment row for folder (its item, or any dict with FOLDER_FIELDS)."""
+    return {
+        'PK': f'USER#{username}',
+        'SK': f'FOLDER#{folder_id}',
+        'GSI3PK': f'FOLDER#{folder_id}',
+        'GSI3SK': f'USER#{username}',
+        'username': username,
+        'folderId': folder_id,
+        **folder_fields(folder),
+        'assignedAt': int(time.time()),
+    }
+
+
+def put_assignments(username, rows):
+    """Write assignment rows for username, each transaction guarded by a
+    ConditionCheck that the user item still exists: an assignment racing the
+    user's cascade delete fails instead of leaving an orphaned row. Returns
+    False if the user no longer exists (rows already written are the
+    delete's to clean up)."""
+    table = get_table()
+    user_check = {'ConditionCheck': {
+        'TableName': table.name,
+        'Key': {'PK': f'USER#{username}', 'SK': f'USER#{username}'},
+        'ConditionExpression': 'attribute_exists(PK)',
+    }}
+    rows = list({row['SK']: row for row in rows}.values())
+    for start in range(0, len(rows), PUT_ASSIGNMENTS_CHUNK):
+        transact = [user_check] + [{'Put': {'TableName': table.name, 'Item': row}}
+                                   for row in rows[start:start + PUT_ASSIGNMENTS_CHUNK]]
+        for attempt in range(PUT_ASSIGNMENTS_ATTEMPTS):
+            try:
+                db_util.transact_write_items(transact)
+                break
+            except db_util.ClientError as e:
+                if error_code(e) != 'TransactionCanceledException':
+                    raise
+                reasons = [r.get('Code') for r in e.response.get('CancellationReasons', [])]
+                if reasons and reasons[0] == 'ConditionalCheckFailed':
+                    return False
+                if attempt == PUT_ASSIGNMENTS_ATTEMPTS - 1:
+                    raise
+            # Conflict with another transaction or throttled: back off and retry
+            db_util.backoff(attempt)
+    return True
+
+
+def folder_fields(folder):
+    return {
+        'folderName': folder.get('folderName', ''),
+        'parentFolderId': folder.get('parentFolderId', 'ROOT'),
+        'folderPath': folder.get('folderPath', ''),
+    }
+
+
+def find_drift():
+    """Compare every assignment row with its folder. Returns (stale, orphaned):
+    stale is [(row, {field: folder value})] for rows whose copy differs or is
+    missing; orphaned lists rows whose folder no longer exists."""
+    rows = fast_scan_items(index='GSI3', projection=['PK', 'SK', 'username', 'folderId', *FOLDER_FIELDS])
+    folder_ids = list(dict.fromkeys(row['folderId'] for row in rows))
+    folders = dict(zip(folder_ids, batch_get_items(
+        [{'PK': f'FOLDER#{fid}', 'SK': f'FOLDER#{fid}'} for fid in folder_ids], projection=list(FOLDER_FIELDS))))
+    stale, orphaned = [], []
+    for row in rows:
+        folder = folders[row['folderId']]
+        if folder is None:
+            orphaned.append(row)
+            continue
+        changes = {k: v for k, v in folder_fields(folder).items() if row.get(k) != v}
+        if changes:
+            stale.append((row, changes))
+    return stale, orphaned
+
+
+def repair_drift(stale, orphaned):
+    """Rewrite stale copies and delete orphaned rows. Returns the usernames
+    whose assignments were deleted; the caller refreshes their folder ACLs
+    and bumps the catalog revision."""
+    table = get_table()
+    for row, changes in stale:
+        try:
+            table.update_item(
+                Key={'PK': row['PK'], 'SK': row['SK']},
+                UpdateExpression='SET ' + ', '.join(f'#f{i} = :f{i}' for i in range(len(changes))),
+                # Not if an unassign removed the row since it was read
+                ConditionExpression='attribute_exists(PK)',
+                ExpressionAttributeNames={f'#f{i}': k for i, k in enumerate(changes)},
+                ExpressionAttributeValues={f':f{i}': v for i, v in enumerate(changes.values())},
+            )
+        except db_util.ClientError as e:
+            if error_code(e) != 'ConditionalCheckFailedException':
+                raise
+    with table.batch_writer() as batch:
+        for row in orphaned:
+            batch.delete_item(Key={'PK': row['PK'], 'SK': row['SK']})
+    return sorted({row['username'] for row in orphaned})
@@ -0,0 +1,55 @@
+import time
+from collections import OrderedDict
+
+# Returned by TTLCache.get on a miss, so a cached None (negative entry) can be told apart.
+MISS = object()
+
+
+class TTLCache:
+    """Bounded LRU cache with per-entry expiry.
+
+    Instances are kept at module scope, so they live for the life of a warm
+    Lambda container. Not shared across containers: anything cached here can
+    be stale for at most its TTL after another container changes it."""
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return MISS
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return MISS
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl_seconds=None):
+        if self.max_entries <= 0:
+            return
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl <= 0:
+            self._data.pop(key, None)
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def evict_if(self, predicate):
+        """Drop every entry whose value matches predicate(value)."""
+        for key in [k for k, (_, v) in self._data.items() if predicate(v)]:
+            del self._data[key]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
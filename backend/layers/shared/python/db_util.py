@@ -1,43 +1,586 @@
+import base64
+import functools
 import json
-import boto3
+import random
+import time
 from decimal import Decimal
 import os
+from metrics_util import instrument_client
+
+# boto3/botocore take ~250ms to import, most of a handler's init time. They are
+# imported on first use (get_session, client_config, Key) instead of here, so
+# cold starts that never reach DynamoDB (OPTIONS, 401s on missing tokens) skip them.
 
 _table = None
 _s3_client = None
+_dynamodb_client = None
+_session = None
+
+# botocore client tuning, shared by every DynamoDB/S3 client in the container
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '32'))
+AWS_CONNECT_TIMEOUT = float(os.environ.get('AWS_CONNECT_TIMEOUT', '2'))
+AWS_READ_TIMEOUT = float(os.environ.get('AWS_READ_TIMEOUT', '5'))
+AWS_MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', '5'))
+AWS_RETRY_MODE = os.environ.get('AWS_RETRY_MODE', 'adaptive')
+
+# Response encoder: 'auto' uses orjson when it is installed, else json;
+# 'orjson' / 'json' force one. Chosen on the first to_json call.
+JSON_SERIALIZER = os.environ.get('JSON_SERIALIZER', 'auto')
+_dumps = None
+
+# Per-invocation identity map: (PK, SK) -> item, or None for a known-missing
+# item. Only active inside a request_scope; None means caching is off.
+_identity_map = None
+_request_stats = None
+last_request_stats = None
+
+
+def _item_key(key):
+    return key['PK'], key['SK']
+
+
+def _forget_items(keys):
+    """Drop keys (plain or low-level {'S': ...} values) from the identity map,
+    for writes it cannot follow item by item."""
+    if _identity_map is None:
+        return
+    for key in keys:
+        pk, sk = key['PK'], key['SK']
+        if isinstance(pk, dict):
+            pk, sk = pk['S'], sk['S']
+        _identity_map.pop((pk, sk), None)
+
+
+class _CachedTable:
+    """Table proxy that serves repeated get_item calls from the identity map
+    and keeps it current on our own writes. Everything else passes through;
+    transactions go through transact_write_items below so the map hears of
+    them."""
+
+    def __init__(self, table):
+        self._table = table
+
+    def __getattr__(self, name):
+        return getattr(self._table, name)
+
+    def get_item(self, **kwargs):
+        if _identity_map is None or 'ProjectionExpression' in kwargs or kwargs.get('ConsistentRead'):
+            return self._table.get_item(**kwargs)
+        key = _item_key(kwargs['Key'])
+        if key in _identity_map:
+            _request_stats['hits'] += 1
+            item = _identity_map[key]
+            return {'Item': dict(item)} if item is not None else {}
+        _request_stats['reads'] += 1
+        resp = self._table.get_item(**kwargs)
+        item = resp.get('Item')
+        _identity_map[key] = dict(item) if item is not None else None
+        return resp
+
+    def put_item(self, **kwargs):
+        resp = self._table.put_item(**kwargs)
+        if _identity_map is not None:
+            _identity_map[_item_key(kwargs['Item'])] = dict(kwargs['Item'])
+        return resp
+
+    def update_item(self, **kwargs):
+        try:
+            return self._table.update_item(**kwargs)
+        finally:
+            if _identity_map is not None:
+                _identity_map.pop(_item_key(kwargs['Key']), None)
+
+    def delete_item(self, **kwargs):
+        resp = self._table.delete_item(**kwargs)
+        if _identity_map is not None:
+            _identity_map[_item_key(kwargs['Key'])] = None
+        return resp
+
+    def batch_writer(self, **kwargs):
+        return _CachedBatchWriter(self._table.batch_writer(**kwargs))
+
+
+class _CachedBatchWriter:
+    def __init__(self, writer):
+        self._writer = writer
+
+    def __enter__(self):
+        self._writer.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._writer.__exit__(*exc_info)
+
+    def put_item(self, Item, **kwargs):
+        self._writer.put_item(Item=Item, **kwargs)
+        if _identity_map is not None:
+            _identity_map[_item_key(Item)] = dict(Item)
+
+    def delete_item(self, Key, **kwargs):
+        self._writer.delete_item(Key=Key, **kwargs)
+        if _identity_map is not None:
+            _identity_map[_item_key(Key)] = None
+
+
+TRANSACT_MAX_ITEMS = 100  # DynamoDB TransactWriteItems limit
+
+
+def transact_write_items(transact):
+    """TransactWriteItems through the table's client. The items it touched are
+    dropped from the identity map whether or not the transaction went through."""
+    try:
+        return get_table().meta.client.transact_write_items(TransactItems=transact)
+    finally:
+        ops = [next(iter(action.values())) for action in transact]
+        _forget_items(op.get('Key') or op['Item'] for op in ops)
+
+
+def request_scope(handler):
+    """Decorator for lambda_handler: enables the per-invocation read cache and
+    clears it when the handler returns. Stats for the finished invocation
+    ({'reads': unique items read, 'hits': reads served from the map}) are left
+    in last_request_stats."""
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        global _identity_map, _request_stats, last_request_stats
+        _identity_map, _request_stats = {}, {'reads': 0, 'hits': 0}
+        try:
+            return handler(event, context)
+        finally:
+            last_request_stats = _request_stats
+            _identity_map, _request_stats = None, None
+    return wrapper
+
+
+def client_config(**overrides):
+    """botocore Config with pool size, timeouts, retry mode and TCP keepalive."""
+    from botocore.config import Config
+    settings = {
+        'max_pool_connections': AWS_MAX_POOL_CONNECTIONS,
+        'connect_timeout': AWS_CONNECT_TIMEOUT,
+        'read_timeout': AWS_READ_TIMEOUT,
+        'retries': {'mode': AWS_RETRY_MODE, 'max_attempts': AWS_MAX_ATTEMPTS},
+        'tcp_keepalive': True,
+    }
+    settings.update(overrides)
+    return Config(**settings)
+
+
+def get_session():
+    """One boto3 Session per container; sessions are not free to create."""
+    global _session
+    if _session is None:
+        import boto3
+        _session = boto3.session.Session()
+    return _session
+
+
+def Key(name):
+    """boto3.dynamodb.conditions.Key, imported on first use."""
+    from boto3.dynamodb.conditions import Key
+    return Key(name)
+
+
+def new_id():
+    """A random UUID string for new item IDs. uuid is imported on first use,
+    like boto3, since only write paths need it."""
+    import uuid
+    return str(uuid.uuid4())
+
+
+def __getattr__(name):
+    # db_util.ClientError is botocore's, imported on first use: an
+    # `except db_util.ClientError` clause only evaluates it once an
+    # exception is raised, by which time a client call has loaded botocore
+    if name == 'ClientError':
+        from botocore.exceptions import ClientError
+        return ClientError
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def error_code(exc):
+    """The service error code of a ClientError."""
+    return exc.response.get('Error', {}).get('Code')
+
+
+def _dynamodb_args():
+    endpoint = os.environ.get('DYNAMODB_ENDPOINT')
+    if endpoint:
+        return {'endpoint_url': endpoint, 'region_name': 'us-east-1',
+                'aws_access_key_id': 'fake', 'aws_secret_access_key': 'fake'}
+    return {}
 
 
 def get_table():
     global _table
     if _table is None:
-        endpoint = os.environ.get('DYNAMODB_ENDPOINT')
-        if endpoint:
-            dynamodb = boto3.resource('dynamodb', endpoint_url=endpoint,
-                region_name='us-east-1', aws_access_key_id='fake', aws_secret_access_key='fake')
-        else:
-            dynamodb = boto3.resource('dynamodb')
-        _table = dynamodb.Table(os.environ['TABLE_NAME'])
+        dynamodb = get_session().resource('dynamodb', config=client_config(), **_dynamodb_args())
+        instrument_client(dynamodb.meta.client, 'dynamodb')
+        _table = _CachedTable(dynamodb.Table(os.environ['TABLE_NAME']))
     return _table
 
 
+def get_dynamodb_client():
+    """Low-level DynamoDB client for the fast read paths (see fast_get_item)."""
+    global _dynamodb_client
+    if _dynamodb_client is None:
+        _dynamodb_client = instrument_client(
+            get_session().client('dynamodb', config=client_config(), **_dynamodb_args()), 'dynamodb')
+    return _dynamodb_client
+
+
 def get_s3_client():
     global _s3_client
     if _s3_client is None:
         endpoint = os.environ.get('S3_ENDPOINT')
         if endpoint:
-            _s3_client = boto3.client('s3', endpoint_url=endpoint,
+            _s3_client = get_session().client('s3', endpoint_url=endpoint,
                 region_name='us-east-1', aws_access_key_id='minioadmin', aws_secret_access_key='minioadmin',
-                config=boto3.session.Config(signature_version='s3v4'))
+                config=client_config(signature_version='s3v4'))
         else:
-            _s3_client = boto3.client('s3')
+            _s3_client = get_session().client('s3', config=client_config())
+        instrument_client(_s3_client, 's3')
     return _s3_client
 
 
+# ---- Low-level fast path ----
+# The resource API runs every attribute through TypeDeserializer, which is
+# the bulk of its per-item cost on large results. These helpers call the
+# low-level client directly and decode with a lean decoder. Numbers decode
+# to int when integral and Decimal otherwise, so to_json and arithmetic
+# behave as they do for resource items.
+
+def _decode_number(n):
+    try:
+        return int(n)
+    except ValueError:
+        return Decimal(n)
+
+
+def decode_value(value):
+    (tag, v), = value.items()
+    if tag == 'S':
+        return v
+    if tag == 'N':
+        return _decode_number(v)
+    if tag == 'BOOL':
+        return v
+    if tag == 'NULL':
+        return None
+    if tag == 'M':
+        return {k: decode_value(x) for k, x in v.items()}
+    if tag == 'L':
+        return [decode_value(x) for x in v]
+    if tag == 'SS':
+        return set(v)
+    if tag == 'NS':
+        return {_decode_number(x) for x in v}
+    if tag == 'B':
+        return v
+    if tag == 'BS':
+        return set(v)
+    raise TypeError(f'Unsupported DynamoDB type {tag}')
+
+
+def decode_item(item):
+    out = {}
+    for k, v in item.items():
+        # Strings dominate our items; skip the generic dispatch for them
+        s = v.get('S')
+        out[k] = s if s is not None else decode_value(v)
+    return out
+
+
+def _encode_value(value):
+    if isinstance(value, str):
+        return {'S': value}
+    if isinstance(value, bool):
+        return {'BOOL': value}
+    if isinstance(value, (int, Decimal)):
+        return {'N': str(value)}
+    raise TypeError(f'Unsupported key/value type {type(value).__name__}')
+
+
+def _projection_args(projection, names=None):
+    """ProjectionExpression and ExpressionAttributeNames for a list of
+    attribute names, as #p<i> placeholders merged into names."""
+    names = dict(names or {})
+    names.update({f'#p{i}': attr for i, attr in enumerate(projection)})
+    return {'ProjectionExpression': ', '.join(f'#p{i}' for i in range(len(projection))),
+            'ExpressionAttributeNames': names}
+
+
+def fast_get_item(key, projection=None, consistent=False):
+    """get_item through the low-level client. Returns the decoded item or None.
+    Shares the request_scope identity map for eventually consistent reads
+    without a projection."""
+    use_map = _identity_map is not None and not projection and not consistent
+    if use_map:
+        ikey = _item_key(key)
+        if ikey in _identity_map:
+            _request_stats['hits'] += 1
+            item = _identity_map[ikey]
+            return dict(item) if item is not None else None
+        _request_stats['reads'] += 1
+    args = {'TableName': os.environ['TABLE_NAME'], 'Key': {k: _encode_value(v) for k, v in key.items()}}
+    if projection:
+        args.update(_projection_args(projection))
+    if consistent:
+        args['ConsistentRead'] = True
+    raw = get_dynamodb_client().get_item(**args).get('Item')
+    item = decode_item(raw) if raw is not None else None
+    if use_map:
+        _identity_map[ikey] = dict(item) if item is not None else None
+    return item
+
+
+def fast_query_items(key_condition, values, index=None, projection=None, names=None, limit=None,
+                     consistent=False):
+    """Lazily yield decoded items for a raw KeyConditionExpression string, e.g.
+    fast_query_items('PK = :pk AND begins_with(SK, :sk)', {':pk': 'USER#a', ':sk': 'FOLDER#'})."""
+    args = {
+        'TableName': os.environ['TABLE_NAME'],
+        'KeyConditionExpression': key_condition,
+        'ExpressionAttributeValues': {k: _encode_value(v) for k, v in values.items()},
+    }
+    if index:
+        args['IndexName'] = index
+    if consistent:
+        args['ConsistentRead'] = True
+    if projection:
+        args.update(_projection_args(projection, names))
+    elif names:
+        args['ExpressionAttributeNames'] = names
+    for raw in _paginate(get_dynamodb_client().query, args, limit, None):
+        yield decode_item(raw)
+
+
+def fast_scan_items(index=None, projection=None, segments=1):
+    """Decoded items from a Scan of the table or, more usefully, of a sparse
+    index. segments > 1 runs a parallel scan with the segments fetched
+    concurrently. Returns a list."""
+    args = {'TableName': os.environ['TABLE_NAME']}
+    if index:
+        args['IndexName'] = index
+    if projection:
+        args.update(_projection_args(projection))
+    client = get_dynamodb_client()
+
+    def scan_segment(segment):
+        segment_args = dict(args, Segment=segment, TotalSegments=segments) if segments > 1 else args
+        return [decode_item(raw) for raw in _paginate(client.scan, segment_args, None, None)]
+
+    if segments <= 1:
+        return scan_segment(0)
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        return [item for items in pool.map(scan_segment, range(segments)) for item in items]
+
+
+def _with_projection(kwargs, projection):
+    kwargs = dict(kwargs)
+    if projection:
+        kwargs.update(_projection_args(projection, kwargs.get('ExpressionAttributeNames')))
+    return kwargs
+
+
+def _paginate(operation, kwargs, limit, projection):
+    kwargs = _with_projection(kwargs, projection)
+    page_size = kwargs.pop('Limit', None)
+    remaining = limit
+    while True:
+        if remaining is not None:
+            kwargs['Limit'] = min(page_size, remaining) if page_size else remaining
+        elif page_size:
+            kwargs['Limit'] = page_size
+        resp = operation(**kwargs)
+        for item in resp.get('Items', []):
+            yield item
+            if remaining is not None:
+                remaining -= 1
+                if remaining == 0:
+                    return
+        if 'LastEvaluatedKey' not in resp:
+            return
+        kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+
+def query_items(limit=None, projection=None, **kwargs):
+    """Lazily yield every item matching a table query, following LastEvaluatedKey.
+
+    kwargs are passed to Table.query (Limit sets the page size). limit caps the
+    total number of items yielded; projection is a list of attribute names."""
+    return _paginate(get_table().query, kwargs, limit, projection)
+
+
+def scan_items(limit=None, projection=None, **kwargs):
+    """Like query_items, for Table.scan."""
+    return _paginate(get_table().scan, kwargs, limit, projection)
+
+
+def encode_cursor(key):
+    """Opaque, URL-safe page cursor for a LastEvaluatedKey."""
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor. Raises ValueError for anything that isn't one."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError('Invalid cursor') from e
+    # Every key attribute in this table is a string
+    if not isinstance(key, dict) or not key or not all(
+            isinstance(k, str) and isinstance(v, str) for k, v in key.items()):
+        raise ValueError('Invalid cursor')
+    return key
+
+
+def query_page(limit, cursor=None, projection=None, **kwargs):
+    """One page of up to limit items from Table.query. Returns (items,
+    next_cursor); next_cursor is None once the query is exhausted. Raises
+    ValueError for a malformed cursor."""
+    kwargs = _with_projection(kwargs, projection)
+    kwargs['Limit'] = limit
+    if cursor:
+        kwargs['ExclusiveStartKey'] = decode_cursor(cursor)
+    resp = get_table().query(**kwargs)
+    last_key = resp.get('LastEvaluatedKey')
+    return resp.get('Items', []), encode_cursor(last_key) if last_key else None
+
+
+# Retry backoff for unprocessed batch items and cancelled transactions:
+# exponential from BACKOFF_BASE_SECONDS with full jitter, capped at
+# BACKOFF_MAX_SECONDS
+BACKOFF_BASE_SECONDS = 0.05
+BACKOFF_MAX_SECONDS = 2.0
+
+
+def backoff(attempt):
+    """Sleep before retry number attempt + 1 (attempt counts from 0)."""
+    time.sleep(random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)))
+
+
+BATCH_GET_CHUNK_SIZE = 100  # DynamoDB BatchGetItem limit
+BATCH_GET_MAX_ATTEMPTS = 8
+
+
+def _batch_get_chunk(client, table_name, keys, projection):
+    request = {'Keys': keys}
+    if projection:
+        request.update(_projection_args(projection))
+    items = []
+    for attempt in range(BATCH_GET_MAX_ATTEMPTS):
+        resp = client.batch_get_item(RequestItems={table_name: request})
+        items.extend(resp.get('Responses', {}).get(table_name, []))
+        unprocessed = resp.get('UnprocessedKeys', {}).get(table_name)
+        if not unprocessed:
+            return items
+        request = unprocessed
+        backoff(attempt)
+    raise RuntimeError(f'BatchGetItem left {len(request["Keys"])} keys unprocessed')
+
+
+def batch_get_items(keys, projection=None, max_workers=4):
+    """Fetch items by primary key ({'PK', 'SK'} dicts) with BatchGetItem.
+
+    Keys are de-duplicated and split into chunks of 100 fetched concurrently;
+    UnprocessedKeys are retried with backoff. Returns a list aligned with keys,
+    holding None where an item does not exist."""
+    if not keys:
+        return []
+    use_map = _identity_map is not None and not projection
+    unique = [k for k in {_item_key(k): k for k in keys}.values()
+              if not (use_map and _item_key(k) in _identity_map)]
+    if use_map:
+        _request_stats['hits'] += len(keys) - len(unique)
+        _request_stats['reads'] += len(unique)
+    if projection:
+        projection = list(dict.fromkeys(['PK', 'SK', *projection]))
+    table = get_table()
+    client = table.meta.client
+    chunks = [unique[i:i + BATCH_GET_CHUNK_SIZE] for i in range(0, len(unique), BATCH_GET_CHUNK_SIZE)]
+    if not chunks:
+        results = []
+    elif len(chunks) == 1:
+        results = [_batch_get_chunk(client, table.name, chunks[0], projection)]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as pool:
+            results = list(pool.map(lambda c: _batch_get_chunk(client, table.name, c, projection), chunks))
+    found = {_item_key(item): item for items in results for item in items}
+    if use_map:
+        for k in unique:
+            item = found.get(_item_key(k))
+            _identity_map[_item_key(k)] = dict(item) if item is not None else None
+        for k in keys:
+            cached = _identity_map[_item_key(k)]
+            found.setdefault(_item_key(k), dict(cached) if cached is not None else None)
+    return [found.get(_item_key(k)) for k in keys]
+
+
+BATCH_WRITE_CHUNK_SIZE = 25  # DynamoDB BatchWriteItem limit
+
+
+def _batch_delete_chunk(client, table_name, keys):
+    requests = [{'DeleteRequest': {'Key': key}} for key in keys]
+    _forget_items(keys)
+    for attempt in range(BATCH_GET_MAX_ATTEMPTS):
+        resp = client.batch_write_item(RequestItems={table_name: requests})
+        requests = resp.get('UnprocessedItems', {}).get(table_name)
+        if not requests:
+            return
+        backoff(attempt)
+    raise RuntimeError(f'BatchWriteItem left {len(requests)} deletes unprocessed')
+
+
+def batch_delete_items(keys, max_workers=4):
+    """Delete items by primary key ({'PK', 'SK'} dicts) with BatchWriteItem.
+
+    Keys are de-duplicated and split into chunks of 25 written concurrently;
+    UnprocessedItems are retried with backoff. Uses the client only, so it is
+    safe to call from worker threads."""
+    unique = list({_item_key(k): {'PK': k['PK'], 'SK': k['SK']} for k in keys}.values())
+    if not unique:
+        return
+    table = get_table()
+    client = table.meta.client
+    chunks = [unique[i:i + BATCH_WRITE_CHUNK_SIZE] for i in range(0, len(unique), BATCH_WRITE_CHUNK_SIZE)]
+    if len(chunks) == 1:
+        _batch_delete_chunk(client, table.name, chunks[0])
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as pool:
+            list(pool.map(lambda c: _batch_delete_chunk(client, table.name, c), chunks))
+    if _identity_map is not None:
+        for k in unique:
+            _identity_map[_item_key(k)] = None
+
+
 def decimal_default(obj):
     if isinstance(obj, Decimal):
-        return int(obj) if obj % 1 == 0 else float(obj)
+        # int() plus a comparison is cheaper than Decimal modulo
+        i = int(obj)
+        return i if i == obj else float(obj)
     raise TypeError
 
 
+def _select_dumps():
+    if JSON_SERIALIZER in ('auto', 'orjson'):
+        try:
+            import orjson
+        except ImportError:
+            if JSON_SERIALIZER == 'orjson':
+                raise
+        else:
+            return lambda obj: orjson.dumps(obj, default=decimal_default).decode()
+    return functools.partial(json.dumps, default=decimal_default)
+
+
 def to_json(obj):
-    return json.dumps(obj, default=decimal_default)
+    """Serialize a response body. Decimals (resource API numbers) go through
+    decimal_default; items from the fast path already carry ints and never do."""
+    global _dumps
+    if _dumps is None:
+        _dumps = _select_dumps()
+    return _dumps(obj)
@@ -0,0 +1,169 @@
+import functools
+import json
+import os
+import time
+
+# Per-invocation DynamoDB/S3 call accounting, printed as one CloudWatch
+# Embedded Metric Format line per invocation. Off unless METRICS_ENABLED:
+# disabled, clients get no event hooks and instrument_handler costs one flag
+# check per invocation.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'false').lower() == 'true'
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'FileShare')
+
+# DynamoDB operations that accept ReturnConsumedCapacity
+_READ_OPS = frozenset(['GetItem', 'BatchGetItem', 'Query', 'Scan', 'TransactGetItems'])
+_WRITE_OPS = frozenset(['PutItem', 'UpdateItem', 'DeleteItem', 'BatchWriteItem', 'TransactWriteItems'])
+
+_METRICS = [
+    ('Latency', 'Milliseconds'),
+    ('DynamoDBCalls', 'Count'),
+    ('DynamoDBTime', 'Milliseconds'),
+    ('ConsumedRCU', 'Count'),
+    ('ConsumedWCU', 'Count'),
+    ('S3Calls', 'Count'),
+    ('S3Time', 'Milliseconds'),
+    ('OtherTime', 'Milliseconds'),
+]
+
+# Accumulator for the invocation in progress; None outside instrument_handler
+_current = None
+# The last emitted record, for tests and local debugging
+last_metrics = None
+
+
+def instrument_client(client, service):
+    """Hook a boto3 client ('dynamodb' or 's3') into the per-invocation counters."""
+    if not METRICS_ENABLED:
+        return client
+    events = client.meta.events
+    if service == 'dynamodb':
+        events.register('before-parameter-build.dynamodb', _request_capacity)
+    events.register(f'before-call.{service}', _before_call)
+    events.register(f'after-call.{service}', functools.partial(_after_call, service))
+    events.register(f'after-call-error.{service}', functools.partial(_after_call, service))
+    return client
+
+
+def _request_capacity(params, model, **kwargs):
+    if model.name in _READ_OPS or model.name in _WRITE_OPS:
+        params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+
+def _before_call(model, context, **kwargs):
+    context['metrics_call'] = (model.name, time.perf_counter())
+
+
+def _after_call(service, context, parsed=None, **kwargs):
+    call = context.get('metrics_call')
+    if _current is None or call is None:
+        return
+    op, start = call
+    stats = _current
+    stats[f'{service}_calls'] += 1
+    stats[f'{service}_ms'] += (time.perf_counter() - start) * 1000
+    name = f'{service}.{op}'
+    stats['ops'][name] = stats['ops'].get(name, 0) + 1
+
+    capacity = (parsed or {}).get('ConsumedCapacity')
+    if capacity:
+        units = sum(c.get('CapacityUnits', 0) for c in (capacity if isinstance(capacity, list) else [capacity]))
+        stats['rcu' if op in _READ_OPS else 'wcu'] += units
+
+
+def _route(event):
+    # API Gateway's resource template keeps the dimension low-cardinality;
+    # behind /{proxy+} the router fills it in with the matched pattern
+    resource = event.get('resource')
+    if not resource or '{proxy+}' in resource:
+        resource = event.get('path', '')
+    return f'{event.get("httpMethod", "")} {resource}'
+
+
+def set_route(route):
+    """Name the Route dimension of the invocation in progress. The router
+    calls it as soon as it has matched (or failed to match) a pattern, so
+    requests it answers itself never report their raw path."""
+    if _current is not None:
+        _current['route'] = route
+
+
+def _emf(stats, status, latency_ms):
+    values = {
+        'Latency': latency_ms,
+        'DynamoDBCalls': stats['dynamodb_calls'],
+        'DynamoDBTime': stats['dynamodb_ms'],
+        'ConsumedRCU': stats['rcu'],
+        'ConsumedWCU': stats['wcu'],
+        'S3Calls': stats['s3_calls'],
+        'S3Time': stats['s3_ms'],
+        'OtherTime': max(latency_ms - stats['dynamodb_ms'] - stats['s3_ms'], 0),
+    }
+    return {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [['Route']],
+                'Metrics': [{'Name': name, 'Unit': unit} for name, unit in _METRICS],
+            }],
+        },
+        'Route': stats['route'],
+        'Status': status,
+        'FunctionName': os.environ.get('AWS_LAMBDA_FUNCTION_NAME', ''),
+        'Operations': stats['ops'],
+        **{k: round(v, 2) if isinstance(v, float) else v for k, v in values.items()},
+    }
+
+
+def count_event(name, **dimensions):
+    """Print one EMF line counting a single occurrence of name (e.g.
+    count_event('LoginShed', Reason='username')), so CloudWatch sums them
+    across containers. Unlike the per-invocation record this is printed even
+    with METRICS_ENABLED off: these are rare events that are always worth
+    reporting, and it needs no client hooks."""
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [sorted(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': 'Count'}],
+            }],
+        },
+        'FunctionName': os.environ.get('AWS_LAMBDA_FUNCTION_NAME', ''),
+        **dimensions,
+        name: 1,
+    }
+    print(json.dumps(record))
+    return record
+
+
+def instrument_handler(handler):
+    """Decorator for lambda_handler: collect call counts, capacity and timings
+    for the invocation and print them as one EMF line."""
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        global _current, last_metrics
+        if not METRICS_ENABLED:
+            return handler(event, context)
+        if _current is not None:
+            # Nested handler (router -> resource handler): the outer
+            # invocation owns the record, the inner one knows the route
+            _current['route'] = _route(event)
+            return handler(event, context)
+
+        _current = {
+            'route': _route(event), 'ops': {}, 'rcu': 0, 'wcu': 0,
+            'dynamodb_calls': 0, 'dynamodb_ms': 0.0, 's3_calls': 0, 's3_ms': 0.0,
+        }
+        start = time.perf_counter()
+        status = 500
+        try:
+            resp = handler(event, context)
+            status = resp.get('statusCode', 200)
+            return resp
+        finally:
+            stats, _current = _current, None
+            last_metrics = _emf(stats, status, (time.perf_counter() - start) * 1000)
+            print(json.dumps(last_metrics))
+    return wrapper
@@ -1,16 +1,63 @@
 import hashlib
+import hmac
+import os
 import secrets
 
+# Stored format: <algorithm>:<iterations>:<salt>:<hash>, e.g. pbkdf2_sha256:100000:ab12..:cd34..
+# Hashes written before the format was versioned are <salt>:<hash> at 100k PBKDF2-SHA256.
+PASSWORD_HASH_ALGORITHM = os.environ.get('PASSWORD_HASH_ALGORITHM', 'pbkdf2_sha256')
+PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', '100000'))
 
-def hash_password(password):
+LEGACY_ALGORITHM = 'pbkdf2_sha256'
+LEGACY_ITERATIONS = 100000
+
+# Algorithm name -> hashlib digest used with PBKDF2-HMAC
+ALGORITHMS = {
+    'pbkdf2_sha256': 'sha256',
+    'pbkdf2_sha512': 'sha512',
+}
+
+# Fail the cold start, not every login and user write, on a misconfiguration
+if PASSWORD_HASH_ALGORITHM not in ALGORITHMS:
+    raise ValueError(f'PASSWORD_HASH_ALGORITHM must be one of {", ".join(ALGORITHMS)}, '
+                     f'not {PASSWORD_HASH_ALGORITHM!r}')
+
+
+def _derive(algorithm, iterations, password, salt):
+    return hashlib.pbkdf2_hmac(ALGORITHMS[algorithm], password.encode(), salt.encode(), iterations).hex()
+
+
+def _parse(stored_hash):
+    """Return (algorithm, iterations, salt, hash). Raises ValueError if malformed."""
+    parts = stored_hash.split(':')
+    if len(parts) == 2:
+        return LEGACY_ALGORITHM, LEGACY_ITERATIONS, parts[0], parts[1]
+    if len(parts) == 4 and parts[0] in ALGORITHMS:
+        return parts[0], int(parts[1]), parts[2], parts[3]
+    raise ValueError('Unrecognized password hash format')
+
+
+def hash_password(password, algorithm=None, iterations=None):
+    algorithm = algorithm or PASSWORD_HASH_ALGORITHM
+    iterations = iterations or PASSWORD_HASH_ITERATIONS
     salt = secrets.token_hex(16)
-    h = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), 100000)
-    return f'{salt}:{h.hex()}'
+    return f'{algorithm}:{iterations}:{salt}:{_derive(algorithm, iterations, password, salt)}'
 
 
 def verify_password(password, stored_hash):
     try:
-        salt, h = stored_hash.split(':')
-        return hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), 100000).hex() == h
+        algorithm, iterations, salt, h = _parse(stored_hash)
+        return hmac.compare_digest(_derive(algorithm, iterations, password, salt), h)
+    except (ValueError, AttributeError):
+        return False
+
+
+def needs_rehash(stored_hash):
+    """True if stored_hash was not produced with the current algorithm and cost."""
+    try:
+        algorithm, iterations, _, _ = _parse(stored_hash)
     except (ValueError, AttributeError):
         return False
+    return (len(stored_hash.split(':')) == 2
+            or algorithm != PASSWORD_HASH_ALGORITHM
+            or iterations != PASSWORD_HASH_ITERATIONS)
@@ -0,0 +1,38 @@
+from db_util import get_table, fast_get_item
+
+# Revision stamps for conditional GETs: one counter per listing scope, stored
+# as REVISION#<scope> / REVISION and bumped after every write that changes
+# what the listing returns. A list handler reads its stamp (one small read)
+# and can answer If-None-Match without running its queries.
+
+# Folder catalog and assignments (GET /folders)
+CATALOG = 'FOLDERS'
+
+
+def folder_scope(folder_id):
+    """Files and versions in one folder (GET /files?folderId=, versions)."""
+    return f'FOLDER#{folder_id}'
+
+
+def _key(scope):
+    return {'PK': f'REVISION#{scope}', 'SK': 'REVISION'}
+
+
+def get_revision(scope):
+    item = fast_get_item(_key(scope))
+    return int(item['revision']) if item else 0
+
+
+def bump_revision(scope):
+    """Call after the write, never before, so a stale listing can't be
+    served under a new stamp."""
+    get_table().update_item(
+        Key=_key(scope),
+        UpdateExpression='ADD #r :one',
+        ExpressionAttributeNames={'#r': 'revision'},
+        ExpressionAttributeValues={':one': 1},
+    )
+
+
+def delete_revision(scope):
+    get_table().delete_item(Key=_key(scope))
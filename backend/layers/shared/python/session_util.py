@@ -1,25 +1,272 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
 import secrets
 import time
-from db_util import get_table
-from boto3.dynamodb.conditions import Key
+import db_util
+from db_util import get_table, query_items, fast_get_item, fast_query_items, Key, error_code
+from cache_util import TTLCache, MISS
 
 SESSION_TTL_SECONDS = 86400  # 24 hours
 
+# Sliding expiry for opaque sessions: activity pushes ttl out to
+# now + SESSION_TTL_SECONDS, but only once the session has aged by
+# SESSION_REFRESH_INTERVAL_SECONDS, so a busy user costs at most
+# 86400 / interval writes a day. Sessions never outlive SESSION_MAX_LIFETIME_SECONDS.
+SESSION_REFRESH_INTERVAL_SECONDS = int(os.environ.get('SESSION_REFRESH_INTERVAL_SECONDS', '14400'))
+SESSION_MAX_LIFETIME_SECONDS = int(os.environ.get('SESSION_MAX_LIFETIME_SECONDS', '604800'))
 
-def create_session(username, role):
-    token = secrets.token_urlsafe(32)
-    now = int(time.time())
+# Per-container session cache. A session deleted by another container stays
+# valid here for at most SESSION_CACHE_TTL_SECONDS.
+SESSION_CACHE_TTL_SECONDS = int(os.environ.get('SESSION_CACHE_TTL_SECONDS', '60'))
+SESSION_CACHE_NEGATIVE_TTL_SECONDS = int(os.environ.get('SESSION_CACHE_NEGATIVE_TTL_SECONDS', '5'))
+SESSION_CACHE_MAX_ENTRIES = int(os.environ.get('SESSION_CACHE_MAX_ENTRIES', '1024'))
+
+_session_cache = TTLCache(SESSION_CACHE_MAX_ENTRIES, SESSION_CACHE_TTL_SECONDS)
+
+
+def _parse_signing_keys(value):
+    """Parse 'kid:secret,kid:secret' into an ordered {kid: secret_bytes} dict."""
+    keys = {}
+    for pair in value.split(','):
+        kid, sep, secret = pair.strip().partition(':')
+        if sep and kid and secret:
+            keys[kid] = secret.encode()
+    return keys
+
+
+# 'opaque' stores a random token in DynamoDB; 'signed' issues HMAC-signed
+# tokens that validate without a read (falls back to opaque if no key is
+# configured). Both formats are always accepted.
+SESSION_TOKEN_MODE = os.environ.get('SESSION_TOKEN_MODE', 'opaque')
+SESSION_SIGNING_KEYS = _parse_signing_keys(os.environ.get('SESSION_SIGNING_KEYS', ''))
+# Key used to sign new tokens; defaults to the first key listed. Older keys
+# stay in SESSION_SIGNING_KEYS so tokens they signed keep validating.
+SESSION_SIGNING_KEY_ID = os.environ.get('SESSION_SIGNING_KEY_ID') or next(iter(SESSION_SIGNING_KEYS), None)
+
+# Per-user revocation sets for signed tokens. A logout or user deletion made
+# in another container takes effect here within SESSION_CACHE_TTL_SECONDS.
+_revocation_cache = TTLCache(SESSION_CACHE_MAX_ENTRIES, SESSION_CACHE_TTL_SECONDS)
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _sign(kid, payload_b64):
+    return _b64encode(hmac.new(SESSION_SIGNING_KEYS[kid], f'{kid}.{payload_b64}'.encode(), hashlib.sha256).digest())
+
+
+def _create_signed_token(username, role, now):
+    """Token format: <kid>.<base64url JSON claims>.<base64url HMAC-SHA256>."""
+    kid = SESSION_SIGNING_KEY_ID
+    claims = {
+        'u': username,
+        'r': role,
+        'iat': now,
+        # Millisecond issue time, so a token issued in the same second as a
+        # revoke-all (e.g. the session created by a password change) survives it
+        'iatMs': int(time.time() * 1000),
+        'exp': now + SESSION_TTL_SECONDS,
+        'n': secrets.token_hex(8),
+    }
+    payload_b64 = _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+    return f'{kid}.{payload_b64}.{_sign(kid, payload_b64)}'
+
+
+def _decode_signed_token(token):
+    """Verify signature and expiry. Returns the claims dict or None."""
+    try:
+        kid, payload_b64, sig = token.split('.')
+        if kid not in SESSION_SIGNING_KEYS:
+            return None
+        if not hmac.compare_digest(sig, _sign(kid, payload_b64)):
+            return None
+        claims = json.loads(_b64decode(payload_b64))
+    except (ValueError, TypeError):
+        return None
+    if claims.get('exp', 0) < int(time.time()):
+        return None
+    return claims
+
+
+def _get_revocations(username):
+    """Return {'before': int (milliseconds), 'tokens': set} for a user, cached
+    per container."""
+    revoked = _revocation_cache.get(username)
+    if revoked is not MISS:
+        return revoked
+    revoked = {'before': 0, 'tokens': set()}
+    for item in query_items(KeyConditionExpression=Key('PK').eq(f'REVOKED#{username}')):
+        if item['SK'] == 'ALL':
+            if 'revokedBeforeMs' in item:
+                revoked['before'] = int(item['revokedBeforeMs'])
+            else:
+                # Written before millisecond revocation: covers the whole second
+                revoked['before'] = int(item['revokedBefore']) * 1000 + 999
+        else:
+            revoked['tokens'].add(item['SK'])
+    _revocation_cache.set(username, revoked)
+    return revoked
+
+
+def _is_revoked(claims):
+    revoked = _get_revocations(claims['u'])
+    issued_ms = claims.get('iatMs', claims['iat'] * 1000)
+    return issued_ms <= revoked['before'] or f'TOKEN#{claims["iat"]}#{claims["n"]}' in revoked['tokens']
+
+
+def _revoke_signed_token(claims):
     get_table().put_item(Item={
+        'PK': f'REVOKED#{claims["u"]}',
+        'SK': f'TOKEN#{claims["iat"]}#{claims["n"]}',
+        'ttl': claims['exp'],
+    })
+    _revocation_cache.pop(claims['u'])
+
+
+def _revoke_all_signed_tokens(usernames):
+    """Revoke every signed token issued to each of usernames up to now."""
+    now_ms = int(time.time() * 1000)
+    now = now_ms // 1000
+    with get_table().batch_writer() as batch:
+        for username in usernames:
+            batch.put_item(Item={
+                'PK': f'REVOKED#{username}',
+                'SK': 'ALL',
+                'revokedBefore': now,
+                'revokedBeforeMs': now_ms,
+                'ttl': now + SESSION_TTL_SECONDS,
+            })
+    for username in usernames:
+        _revocation_cache.pop(username)
+
+
+def load_folder_acl(username):
+    """Return the IDs of the folders assigned to username. Strongly consistent:
+    the result is stored as the snapshot for the latest aclRevision, and a
+    lagging read would keep an unassigned folder in it until the next change."""
+    return [item['folderId'] for item in fast_query_items(
+        'PK = :pk AND begins_with(SK, :sk)', {':pk': f'USER#{username}', ':sk': 'FOLDER#'},
+        projection=['folderId'], consistent=True,
+    )]
+
+
+def session_keys_for_user(username):
+    """Yield the keys of username's opaque session items (GSI1 SESSIONS#<username>).
+    Uses the low-level client, so it is safe to call from worker threads."""
+    for item in fast_query_items('GSI1PK = :pk', {':pk': f'SESSIONS#{username}'},
+                                 index='GSI1', projection=['PK', 'SK']):
+        yield {'PK': item['PK'], 'SK': item['SK']}
+
+
+def refresh_folder_acl(username):
+    """Bump the user's aclRevision and rewrite the folder snapshot (folderIds)
+    stored on the user item, where the admin user listing reads it, and on
+    each of their sessions. Call after any change to the user's assignments.
+    Containers holding a cached copy of a session pick up the new snapshot
+    within SESSION_CACHE_TTL_SECONDS."""
+    table = get_table()
+    try:
+        resp = table.update_item(
+            Key={'PK': f'USER#{username}', 'SK': f'USER#{username}'},
+            UpdateExpression='ADD aclRevision :one',
+            ConditionExpression='attribute_exists(PK)',
+            ExpressionAttributeValues={':one': 1},
+            ReturnValues='UPDATED_NEW',
+        )
+    except db_util.ClientError as e:
+        if error_code(e) == 'ConditionalCheckFailedException':
+            return
+        raise
+    revision = resp['Attributes']['aclRevision']
+    folder_ids = load_folder_acl(username)
+    # On the user item aclRevision is the counter itself, so its snapshot
+    # carries its own revision attribute
+    _write_folder_snapshot({'PK': f'USER#{username}', 'SK': f'USER#{username}'},
+        folder_ids, revision, 'folderIdsRevision')
+    for key in session_keys_for_user(username):
+        _write_folder_snapshot(key, folder_ids, revision, 'aclRevision')
+    _session_cache.evict_if(lambda item: item is not None and item['username'] == username)
+
+
+def _write_folder_snapshot(key, folder_ids, revision, revision_attr):
+    try:
+        # Never overwrite a snapshot written by a newer revision
+        get_table().update_item(
+            Key=key,
+            UpdateExpression='SET folderIds = :f, #rev = :r',
+            ConditionExpression='attribute_exists(PK) AND (attribute_not_exists(#rev) OR #rev < :r)',
+            ExpressionAttributeNames={'#rev': revision_attr},
+            ExpressionAttributeValues={':f': folder_ids, ':r': revision},
+        )
+    except db_util.ClientError as e:
+        if error_code(e) != 'ConditionalCheckFailedException':
+            raise
+
+
+def create_session(username, role, acl_revision=0):
+    """Create a session. Non-admin opaque sessions carry a snapshot of the
+    user's assigned folder IDs (folderIds) taken at acl_revision, so access
+    checks can be answered from the session itself."""
+    now = int(time.time())
+    if SESSION_TOKEN_MODE == 'signed' and SESSION_SIGNING_KEY_ID in SESSION_SIGNING_KEYS:
+        return _create_signed_token(username, role, now)
+    token = secrets.token_urlsafe(32)
+    item = {
         'PK': f'SESSION#{token}',
         'SK': f'SESSION#{token}',
+        'GSI1PK': f'SESSIONS#{username}',
+        'GSI1SK': f'SESSION#{token}',
         'username': username,
         'role': role,
         'createdAt': now,
         'ttl': now + SESSION_TTL_SECONDS,
-    })
+        'aclRevision': acl_revision,
+    }
+    if role != 'admin':
+        item['folderIds'] = load_folder_acl(username)
+    get_table().put_item(Item=item)
+    if role != 'admin':
+        _catch_up_folder_snapshot(item)
+    _session_cache.set(token, item)
     return token
 
 
+def _catch_up_folder_snapshot(item):
+    """An assignment change between load_folder_acl and put_item ran its
+    refresh_folder_acl before the session existed, so it skipped it. Re-read
+    the user's aclRevision and rewrite the snapshot if it moved."""
+    username = item['username']
+    user = fast_get_item({'PK': f'USER#{username}', 'SK': f'USER#{username}'},
+                         projection=['aclRevision'], consistent=True) or {}
+    revision = user.get('aclRevision', 0)
+    if revision <= item['aclRevision']:
+        return
+    folder_ids = load_folder_acl(username)
+    _write_folder_snapshot({'PK': item['PK'], 'SK': item['SK']}, folder_ids, revision, 'aclRevision')
+    item.update(folderIds=folder_ids, aclRevision=revision)
+
+
+def _get_session_item(token):
+    """Read-through lookup of a session item. Misses are cached briefly too."""
+    item = _session_cache.get(token)
+    if item is not MISS:
+        return item
+    item = fast_get_item({'PK': f'SESSION#{token}', 'SK': f'SESSION#{token}'})
+    if item:
+        _session_cache.set(token, item)
+    else:
+        _session_cache.set(token, None, SESSION_CACHE_NEGATIVE_TTL_SECONDS)
+    return item
+
+
 def validate_session(event):
     """Extract and validate session token from Authorization header.
     Returns (username, role) or None."""
@@ -28,31 +275,86 @@ def validate_session(event):
     if not auth.startswith('Bearer '):
         return None
     token = auth[7:]
-    resp = get_table().get_item(Key={'PK': f'SESSION#{token}', 'SK': f'SESSION#{token}'})
-    item = resp.get('Item')
+    if '.' in token:
+        claims = _decode_signed_token(token)
+        if not claims or _is_revoked(claims):
+            return None
+        return {'username': claims['u'], 'role': claims['r'], 'token': token}
+    now = int(time.time())
+    item = _get_session_item(token)
+    if item and item.get('ttl', 0) < now:
+        # The cached copy may predate an extension made by another container
+        _session_cache.pop(token)
+        item = _get_session_item(token)
+        if item and item.get('ttl', 0) < now:
+            _session_cache.set(token, None, SESSION_CACHE_NEGATIVE_TTL_SECONDS)
+            return None
     if not item:
         return None
-    if item.get('ttl', 0) < int(time.time()):
-        return None
-    return {'username': item['username'], 'role': item['role'], 'token': token}
+    _extend_session(token, item, now)
+    session = {'username': item['username'], 'role': item['role'], 'token': token}
+    if 'folderIds' in item:
+        session['folderIds'] = item['folderIds']
+    return session
+
+
+def _extend_session(token, item, now):
+    """Slide the session's ttl forward if it has aged past the refresh interval.
+    The conditional write coalesces concurrent refreshes from several containers.
+    Sessions without GSI1 keys predate SESSIONS#<username> and are invisible
+    to revoke-all and user deletion, so they are left to expire at their
+    original ttl instead."""
+    if 'GSI1PK' not in item:
+        return
+    new_ttl = min(now + SESSION_TTL_SECONDS, int(item.get('createdAt', now)) + SESSION_MAX_LIFETIME_SECONDS)
+    if new_ttl - item['ttl'] < SESSION_REFRESH_INTERVAL_SECONDS:
+        return
+    try:
+        get_table().update_item(
+            Key={'PK': f'SESSION#{token}', 'SK': f'SESSION#{token}'},
+            UpdateExpression='SET #ttl = :t',
+            ConditionExpression='attribute_exists(PK) AND #ttl <= :stale',
+            ExpressionAttributeNames={'#ttl': 'ttl'},
+            ExpressionAttributeValues={':t': new_ttl, ':stale': new_ttl - SESSION_REFRESH_INTERVAL_SECONDS},
+        )
+    except db_util.ClientError as e:
+        if error_code(e) != 'ConditionalCheckFailedException':
+            raise
+        # Already extended (or deleted) elsewhere; re-read on the next request
+        _session_cache.pop(token)
+        return
+    item['ttl'] = new_ttl
 
 
 def delete_session(token):
+    if '.' in token:
+        claims = _decode_signed_token(token)
+        if claims:
+            _revoke_signed_token(claims)
+        return
     get_table().delete_item(Key={'PK': f'SESSION#{token}', 'SK': f'SESSION#{token}'})
+    _session_cache.pop(token)
 
 
 def delete_sessions_for_user(username):
-    """Delete all sessions for a user. Scans SESSION# items matching username."""
+    """Delete all sessions for a user via the SESSIONS#<username> partition on GSI1."""
     table = get_table()
-    # Sessions don't have a GSI by username, so we scan with filter.
-    # Acceptable because session count per user is small.
-    resp = table.scan(
-        FilterExpression='begins_with(PK, :prefix) AND username = :u',
-        ExpressionAttributeValues={':prefix': 'SESSION#', ':u': username},
-    )
     with table.batch_writer() as batch:
-        for item in resp.get('Items', []):
-            batch.delete_item(Key={'PK': item['PK'], 'SK': item['SK']})
+        for key in session_keys_for_user(username):
+            batch.delete_item(Key=key)
+    forget_sessions([username])
+
+
+def forget_sessions(usernames):
+    """Drop this container's cached sessions for usernames and, with signed
+    tokens, revoke every token issued to them so far. For callers that delete
+    the session items themselves (see session_keys_for_user)."""
+    usernames = set(usernames)
+    if not usernames:
+        return
+    _session_cache.evict_if(lambda item: item is not None and item['username'] in usernames)
+    if SESSION_SIGNING_KEYS:
+        _revoke_all_signed_tokens(usernames)
 
 
 def require_role(event, allowed_roles):
@@ -0,0 +1,52 @@
+import os
+import time
+from db_util import get_table
+from cache_util import TTLCache, MISS
+
+# Fixed-window failure counters, e.g. for login attempts per username / source IP.
+# Stored as THROTTLE#<scope>#<value> / WINDOW#<n> and incremented atomically;
+# each container caches counts for THROTTLE_CACHE_TTL_SECONDS, so a container
+# can refuse a hot key without a read.
+THROTTLE_WINDOW_SECONDS = int(os.environ.get('THROTTLE_WINDOW_SECONDS', '300'))
+THROTTLE_CACHE_TTL_SECONDS = int(os.environ.get('THROTTLE_CACHE_TTL_SECONDS', '10'))
+
+_count_cache = TTLCache(4096, THROTTLE_CACHE_TTL_SECONDS)
+
+
+def _key(scope, value):
+    window = int(time.time()) // THROTTLE_WINDOW_SECONDS
+    return {'PK': f'THROTTLE#{scope}#{value}', 'SK': f'WINDOW#{window}'}, window
+
+
+def get_count(scope, value):
+    key, window = _key(scope, value)
+    cache_key = (key['PK'], window)
+    count = _count_cache.get(cache_key)
+    if count is MISS:
+        item = get_table().get_item(Key=key).get('Item') or {}
+        count = int(item.get('failures', 0))
+        _count_cache.set(cache_key, count)
+    return count
+
+
+def record_failure(scope, value):
+    """Atomically increment the current window's counter. Returns the new count."""
+    key, window = _key(scope, value)
+    resp = get_table().update_item(
+        Key=key,
+        UpdateExpression='ADD failures :one SET #ttl = :ttl',
+        ExpressionAttributeNames={'#ttl': 'ttl'},
+        ExpressionAttributeValues={':one': 1, ':ttl': (window + 2) * THROTTLE_WINDOW_SECONDS},
+        ReturnValues='UPDATED_NEW',
+    )
+    count = int(resp['Attributes']['failures'])
+    _count_cache.set((key['PK'], window), count)
+    return count
+
+
+def reset(scope, value):
+    if get_count(scope, value) == 0:
+        return
+    key, window = _key(scope, value)
+    get_table().delete_item(Key=key)
+    _count_cache.set((key['PK'], window), 0)
@@ -17,20 +17,11 @@ os.environ['AWS_SECRET_ACCESS_KEY'] = 'minioadmin'
 import db_util
 db_util._table = None
 
-from functions.auth.app import lambda_handler as auth_handler
-from functions.users.app import lambda_handler as users_handler
-from functions.folders.app import lambda_handler as folders_handler
-from functions.files.app import lambda_handler as files_handler
+# Same route table and path-parameter matching as the single-Lambda deploy mode
+from functions.router.app import lambda_handler as router_handler
 
 from http.server import HTTPServer, BaseHTTPRequestHandler
-import json
-
-ROUTES = [
-    ('/auth/', auth_handler),
-    ('/users', users_handler),
-    ('/folders', folders_handler),
-    ('/files', files_handler),
-]
+import base64
 
 
 class Handler(BaseHTTPRequestHandler):
@@ -46,46 +37,26 @@ class Handler(BaseHTTPRequestHandler):
             from urllib.parse import parse_qs
             query = {k: v[0] for k, v in parse_qs(qs).items()}
 
-        # Parse path parameters
-        path_params = {}
-        for prefix, _ in ROUTES:
-            if path.startswith(prefix) and path != prefix.rstrip('/'):
-                parts = path.split('/')
-                if prefix == '/users' and len(parts) == 3:
-                    path_params['username'] = parts[2]
-                elif prefix == '/folders' and len(parts) == 3 and parts[2] != 'assignments':
-                    path_params['folderId'] = parts[2]
-                elif prefix == '/files' and '/versions' in path and len(parts) == 5:
-                    path_params['folderId'] = parts[2]
-                    path_params['fileName'] = parts[3]
-
         event = {
             'path': path,
             'httpMethod': method,
             'headers': dict(self.headers),
             'body': body,
             'queryStringParameters': query,
-            'pathParameters': path_params or None,
+            'pathParameters': None,
         }
 
-        handler = None
-        for prefix, h in ROUTES:
-            if path.startswith(prefix):
-                handler = h
-                break
-
-        if not handler:
-            self.send_response(404)
-            self.end_headers()
-            return
-
-        resp = handler(event, None)
+        resp = router_handler(event, None)
         self.send_response(resp.get('statusCode', 200))
         for k, v in (resp.get('headers') or {}).items():
             self.send_header(k, v)
         self.end_headers()
         if resp.get('body'):
-            self.wfile.write(resp['body'].encode())
+            # Compressed bodies come back base64-encoded, as API Gateway expects
+            if resp.get('isBase64Encoded'):
+                self.wfile.write(base64.b64decode(resp['body']))
+            else:
+                self.wfile.write(resp['body'].encode())
 
     def do_GET(self): self._handle('GET')
     def do_POST(self): self._handle('POST')
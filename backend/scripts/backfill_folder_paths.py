@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Backfill or repair folders' materialized paths.
+
+Folders store folderPath (the folder IDs from the top level down, each
+followed by '/') and GSI4PK/GSI4SK (FOLDERTREE / folderPath), which subtree
+queries and tree breadcrumbs read. Folders without them still work through
+slower parent-by-parent walks. A move too large for one transaction that
+failed part-way leaves stale paths under the moved folder. This recomputes
+every path from parentFolderId, the source of truth, top level first, and
+writes the ones that are missing or wrong:
+
+    TABLE_NAME=file-share-table python scripts/backfill_folder_paths.py [--dry-run]
+
+Then copy the paths onto assignment rows with
+scripts/verify_assignments.py --repair.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'layers', 'shared', 'python'))
+
+from db_util import get_table, query_items, Key
+from assignment_util import TREE_PARTITION
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help='only list the folders that need it')
+    args = parser.parse_args()
+
+    table = get_table()
+    count = 0
+    level = [('ROOT', '')]
+    while level:
+        next_level = []
+        for parent_id, parent_path in level:
+            for item in query_items(
+                IndexName='GSI2',
+                KeyConditionExpression=Key('GSI2PK').eq(f'PARENT#{parent_id}'),
+                projection=['folderId', 'folderPath', 'GSI4SK'],
+            ):
+                folder_id = item['folderId']
+                path = f'{parent_path}{folder_id}/'
+                next_level.append((folder_id, path))
+                if item.get('folderPath') == path and item.get('GSI4SK') == path:
+                    continue
+                count += 1
+                print(f'{folder_id}: {item.get("folderPath")!r} -> {path!r}')
+                if args.dry_run:
+                    continue
+                table.update_item(
+                    Key={'PK': f'FOLDER#{folder_id}', 'SK': f'FOLDER#{folder_id}'},
+                    UpdateExpression='SET folderPath = :path, GSI4PK = :t, GSI4SK = :path',
+                    ExpressionAttributeValues={':path': path, ':t': TREE_PARTITION},
+                )
+        level = next_level
+    print(f'{count} folder(s) {"need backfilling" if args.dry_run else "backfilled"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Backfill user items that predate the assignment snapshot or the by-role index.
+
+- folderIds: list_users reads each user's assigned folders from the user item;
+  users without it cost an extra query per listing.
+- GSI2PK/GSI2SK (ROLE#<role> / USER#<name>): GET /users?role= only sees users
+  that have them.
+
+Safe to re-run (refresh_folder_acl only writes newer revisions):
+
+    TABLE_NAME=file-share-table python scripts/backfill_users.py [--dry-run]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'layers', 'shared', 'python'))
+
+from db_util import get_table, query_items, Key
+from session_util import refresh_folder_acl
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help='only list the users that need it')
+    args = parser.parse_args()
+
+    table = get_table()
+    count = 0
+    for item in query_items(
+        IndexName='GSI1',
+        KeyConditionExpression=Key('GSI1PK').eq('USERS'),
+        projection=['username', 'role', 'folderIds', 'GSI2PK'],
+    ):
+        username = item['username']
+        missing = [name for name in ('folderIds', 'GSI2PK') if name not in item]
+        if not missing:
+            continue
+        count += 1
+        print(f'{username}: {", ".join(missing)}')
+        if args.dry_run:
+            continue
+        if 'GSI2PK' in missing:
+            table.update_item(
+                Key={'PK': f'USER#{username}', 'SK': f'USER#{username}'},
+                UpdateExpression='SET GSI2PK = :rk, GSI2SK = :uk',
+                ExpressionAttributeValues={':rk': f'ROLE#{item["role"]}', ':uk': f'USER#{username}'},
+            )
+        if 'folderIds' in missing:
+            refresh_folder_acl(username)
+    print(f'{count} user(s) {"need backfilling" if args.dry_run else "backfilled"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Response compression benchmark — ratio and CPU cost per encoding for typical list payloads.
+
+Serializes synthetic GET /files, /folders and /users bodies with db_util.to_json
+and compresses each with response_util.compress (gzip/deflate at several zlib
+levels, plus brotli when installed) to pick COMPRESSION_LEVEL / BROTLI_QUALITY:
+
+    python scripts/bench_compression.py [--rows 100,1000,10000] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'layers', 'shared', 'python'))
+
+import response_util
+from db_util import to_json
+
+
+def files_body(n):
+    return {'files': [{
+        'fileName': f'report-{i:06d}.pdf',
+        'folderId': '3f1c8a52-1111-4c2e-9a0b-0123456789ab',
+        'folderName': 'Quarterly Reports',
+        'fileSize': 1024 * (i + 1),
+        'uploadedBy': f'uploader{i % 5}',
+        'uploadedAt': 1700000000 + i * 37,
+        'latestVersion': i % 7 + 1,
+    } for i in range(n)]}
+
+
+def folders_body(n):
+    return {'folders': [{
+        'folderId': f'{i:08x}-1111-4c2e-9a0b-0123456789ab',
+        'folderName': f'Project {i}',
+        'parentFolderId': None if i % 10 == 0 else f'{i - i % 10:08x}-1111-4c2e-9a0b-0123456789ab',
+        'createdBy': 'admin',
+        'createdAt': 1700000000 + i,
+        'assignedUsers': [f'user{j}' for j in range(i % 4)],
+    } for i in range(n)]}
+
+
+def users_body(n):
+    return {'users': [{
+        'username': f'user{i:05d}',
+        'role': ('uploader', 'reader', 'viewer')[i % 3],
+        'createdAt': 1700000000 + i,
+        'assignedFolders': [f'{j:08x}-1111-4c2e-9a0b-0123456789ab' for j in range(i % 3)],
+    } for i in range(n)]}
+
+
+def best_of(repeat, fn):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def settings():
+    for level in (1, 6, 9):
+        yield f'gzip-{level}', 'gzip', ('COMPRESSION_LEVEL', level)
+    yield 'deflate-6', 'deflate', ('COMPRESSION_LEVEL', 6)
+    if response_util._brotli():
+        for quality in (1, 5, 11):
+            yield f'br-{quality}', 'br', ('BROTLI_QUALITY', quality)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='100,1000,10000', help='comma-separated row counts')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if not response_util._brotli():
+        print('brotli not installed; skipping br')
+    print(f'{"payload":<16}{"setting":<12}{"raw bytes":>12}{"compressed":>12}{"ratio":>8}{"ms":>9}{"MB/s":>9}')
+    for rows in (int(r) for r in args.rows.split(',')):
+        for name, build in (('files', files_body), ('folders', folders_body), ('users', users_body)):
+            data = to_json(build(rows)).encode()
+            for label, encoding, (attr, value) in settings():
+                setattr(response_util, attr, value)
+                out = response_util.compress(data, encoding)
+                t = best_of(args.repeat, lambda: response_util.compress(data, encoding))
+                print(f'{f"{name} x{rows}":<16}{label:<12}{len(data):>12,}{len(out):>12,}'
+                      f'{len(data) / len(out):>8.1f}{t * 1000:>9.2f}{len(data) / t / 1e6:>9.0f}')
+
+
+if __name__ == '__main__':
+    main()
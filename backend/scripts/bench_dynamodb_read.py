@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""DynamoDB read-path benchmark — resource API vs the low-level fast path in db_util.
+
+Default mode times attribute decoding alone on a synthetic query result shaped
+like file listing rows (TypeDeserializer, as the resource API uses, vs
+db_util.decode_item). With --table/--pk it also times full paginated queries of
+one partition against a live table through both paths:
+
+    python scripts/bench_dynamodb_read.py [--rows 10000] [--repeat 5]
+    TABLE_NAME=file-share-table python scripts/bench_dynamodb_read.py --table --pk FOLDER#<id>
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'layers', 'shared', 'python'))
+
+from boto3.dynamodb.types import TypeDeserializer
+from boto3.dynamodb.conditions import Key
+import db_util
+
+
+def synthetic_rows(n):
+    return [{
+        'PK': {'S': 'FOLDER#3f1c8a52-1111-4c2e-9a0b-0123456789ab'},
+        'SK': {'S': f'FILE#report-{i:06d}.pdf'},
+        'GSI4PK': {'S': 'FILES'},
+        'GSI4SK': {'S': f'FILE#report-{i:06d}.pdf'},
+        'fileName': {'S': f'report-{i:06d}.pdf'},
+        'folderId': {'S': '3f1c8a52-1111-4c2e-9a0b-0123456789ab'},
+        'folderName': {'S': 'Quarterly Reports'},
+        'latestVersion': {'N': str(i % 7 + 1)},
+        'fileSize': {'N': str(1024 * (i + 1))},
+        'uploadedBy': {'S': 'uploader1'},
+        'uploadedAt': {'N': str(1700000000 + i)},
+    } for i in range(n)]
+
+
+def best_of(repeat, fn):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_decode(rows, repeat):
+    raw = synthetic_rows(rows)
+    deserializer = TypeDeserializer()
+
+    def resource_decode():
+        return [{k: deserializer.deserialize(v) for k, v in item.items()} for item in raw]
+
+    def lean_decode():
+        return [db_util.decode_item(item) for item in raw]
+
+    t_resource = best_of(repeat, resource_decode)
+    t_lean = best_of(repeat, lean_decode)
+    print(f'decode {rows} rows (best of {repeat})')
+    print(f'  TypeDeserializer : {t_resource * 1000:8.1f} ms  ({rows / t_resource:,.0f} rows/s)')
+    print(f'  decode_item      : {t_lean * 1000:8.1f} ms  ({rows / t_lean:,.0f} rows/s)')
+    print(f'  speedup          : {t_resource / t_lean:8.2f}x')
+
+
+def bench_live(pk, repeat):
+    def resource_query():
+        return sum(1 for _ in db_util.query_items(KeyConditionExpression=Key('PK').eq(pk)))
+
+    def fast_query():
+        return sum(1 for _ in db_util.fast_query_items('PK = :pk', {':pk': pk}))
+
+    count = resource_query()  # warm the connection pool
+    t_resource = best_of(repeat, resource_query)
+    t_fast = best_of(repeat, fast_query)
+    print(f'query {pk} -> {count} items (best of {repeat})')
+    print(f'  resource query_items : {t_resource * 1000:8.1f} ms')
+    print(f'  fast_query_items     : {t_fast * 1000:8.1f} ms')
+    print(f'  speedup              : {t_resource / t_fast:8.2f}x')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--table', action='store_true', help='also query a live table (TABLE_NAME)')
+    parser.add_argument('--pk', help='partition key to query in --table mode')
+    args = parser.parse_args()
+
+    bench_decode(args.rows, args.repeat)
+    if args.table:
+        if not args.pk:
+            parser.error('--table requires --pk')
+        bench_live(args.pk, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Response serialization benchmark — a list_or_search_files payload through each encoder.
+
+Builds a {'files': [...]} body of --files rows shaped like _format_file output,
+once with Decimal numbers (resource API reads) and once with ints (fast-path
+reads), and times json.dumps with the old modulo-based Decimal callback,
+stdlib json and orjson (if installed) via db_util.to_json:
+
+    python scripts/bench_json.py [--files 10000] [--repeat 20]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'layers', 'shared', 'python'))
+
+import db_util
+
+
+def payload(n, number):
+    return {'files': [{
+        'fileName': f'report-{i:06d}.pdf',
+        'folderId': '3f1c8a52-1111-4c2e-9a0b-0123456789ab',
+        'folderName': 'Quarterly Reports',
+        'fileSize': number(1024 * (i + 1)),
+        'uploadedBy': 'uploader1',
+        'uploadedAt': number(1700000000 + i),
+        'latestVersion': number(i % 7 + 1),
+    } for i in range(n)]}
+
+
+def modulo_default(obj):
+    if isinstance(obj, Decimal):
+        return int(obj) if obj % 1 == 0 else float(obj)
+    raise TypeError
+
+
+def best_of(repeat, fn):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def encoder(name):
+    db_util.JSON_SERIALIZER = name
+    db_util._dumps = None
+    return db_util._select_dumps()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    encoders = [('json + modulo callback', lambda obj: json.dumps(obj, default=modulo_default)),
+                ('json', encoder('json'))]
+    try:
+        encoders.append(('orjson', encoder('orjson')))
+    except ImportError:
+        print('orjson not installed; skipping')
+
+    payload_decimal = payload(args.files, Decimal)
+    payload_int = payload(args.files, int)
+
+    print(f'{args.files} files, best of {args.repeat}')
+    print(f'{"encoder":<26}{"Decimal rows ms":>18}{"int rows ms":>14}{"bytes":>12}')
+    for name, dumps in encoders:
+        t_decimal = best_of(args.repeat, lambda: dumps(payload_decimal))
+        t_int = best_of(args.repeat, lambda: dumps(payload_int))
+        size = len(dumps(payload_int).encode())
+        print(f'{name:<26}{t_decimal * 1000:>18.1f}{t_int * 1000:>14.1f}{size:>12,}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Password hashing benchmark — hashes/sec and per-verify latency at each cost setting.
+
+Run on (or under the same CPU share as) the target Lambda memory size to pick
+PASSWORD_HASH_ITERATIONS against a login p99 budget. --threads also reports
+aggregate hashes/sec with that many hashing threads, which is what bounds
+POST /users/import (IMPORT_HASH_WORKERS):
+
+    python scripts/bench_password_hash.py [--seconds 2] [--iterations 50000,100000,200000] [--threads 1,2,4]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'layers', 'shared', 'python'))
+
+from password_util import ALGORITHMS, hash_password, verify_password
+
+DEFAULT_ITERATIONS = '25000,50000,100000,200000,310000,600000'
+
+
+def bench(algorithm, iterations, seconds):
+    stored = hash_password('benchmark-password', algorithm, iterations)
+    count = 0
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline or count < 3:
+        start = time.perf_counter()
+        verify_password('benchmark-password', stored)
+        latencies.append(time.perf_counter() - start)
+        count += 1
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'rate': count / total,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def bench_threads(algorithm, iterations, threads, seconds):
+    """Aggregate hashes/sec with `threads` workers hashing concurrently."""
+    def work(_):
+        count = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline or count < 1:
+            hash_password('benchmark-password', algorithm, iterations)
+            count += 1
+        return count
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        total = sum(pool.map(work, range(threads)))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=2.0, help='time budget per setting')
+    parser.add_argument('--iterations', default=DEFAULT_ITERATIONS, help='comma-separated iteration counts')
+    parser.add_argument('--algorithms', default=','.join(ALGORITHMS), help='comma-separated algorithms')
+    parser.add_argument('--threads', default='', help='comma-separated thread counts for aggregate throughput')
+    args = parser.parse_args()
+    threads = [int(t) for t in args.threads.split(',') if t]
+
+    print(f'{"algorithm":<16}{"iterations":>12}{"hashes/sec":>14}{"p50 ms":>10}{"p99 ms":>10}')
+    for algorithm in args.algorithms.split(','):
+        for iterations in (int(i) for i in args.iterations.split(',')):
+            r = bench(algorithm, iterations, args.seconds)
+            print(f'{algorithm:<16}{iterations:>12}{r["rate"]:>14.1f}{r["p50_ms"]:>10.1f}{r["p99_ms"]:>10.1f}')
+            for n in threads:
+                rate = bench_threads(algorithm, iterations, n, args.seconds)
+                print(f'{"":<16}{f"{n} thread(s)":>12}{rate:>14.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Check the folder fields copied onto assignment rows against the folders.
+
+Non-admin folder listings and trees read folderName, parentFolderId and
+folderPath from the user's assignment rows. This reports rows whose copy is
+missing (written before the field was copied) or differs from the folder, and
+rows whose folder no longer exists. --repair rewrites stale copies, deletes
+orphaned rows and refreshes the affected users' folder snapshots:
+
+    TABLE_NAME=file-share-table python scripts/verify_assignments.py [--repair]
+
+Exits 1 if drift was found and not repaired.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'layers', 'shared', 'python'))
+
+from assignment_util import find_drift, repair_drift
+from revision_util import CATALOG, bump_revision
+from session_util import refresh_folder_acl
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repair', action='store_true', help='fix the drift found')
+    args = parser.parse_args()
+
+    stale, orphaned = find_drift()
+    for row, changes in stale:
+        print(f'stale    {row["username"]} / {row["folderId"]}: '
+              + ', '.join(f'{k} {row.get(k)!r} -> {v!r}' for k, v in changes.items()))
+    for row in orphaned:
+        print(f'orphaned {row["username"]} / {row["folderId"]}: folder does not exist')
+    print(f'{len(stale)} stale, {len(orphaned)} orphaned')
+
+    if not (stale or orphaned):
+        return 0
+    if not args.repair:
+        return 1
+    for username in repair_drift(stale, orphaned):
+        refresh_folder_acl(username)
+    bump_revision(CATALOG)
+    print('repaired')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -26,6 +26,11 @@ REQUIRED_FILES=(
   "python/db_util.py"
   "python/response_util.py"
   "python/password_util.py"
+  "python/cache_util.py"
+  "python/throttle_util.py"
+  "python/revision_util.py"
+  "python/metrics_util.py"
+  "python/assignment_util.py"
   "requirements.txt"
 )
 
@@ -1,6 +1,8 @@
 import os
 import sys
 import json
+import contextlib
+from collections import Counter
 import pytest
 import boto3
 from moto import mock_aws
@@ -15,6 +17,19 @@ os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
 os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
 
 
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'benchmark: wall-clock measurement; runs only with RUN_BENCHMARKS=1')
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.environ.get('RUN_BENCHMARKS') == '1':
+        return
+    skip = pytest.mark.skip(reason='benchmark; set RUN_BENCHMARKS=1 to run')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+
 @pytest.fixture
 def aws_env():
     """Mock AWS services and create DynamoDB table + S3 bucket."""
@@ -22,6 +37,13 @@ def aws_env():
         # Reset cached table reference
         import db_util
         db_util._table = None
+        db_util._dynamodb_client = None
+        db_util._s3_client = None
+        import session_util
+        session_util._session_cache.clear()
+        session_util._revocation_cache.clear()
+        import throttle_util
+        throttle_util._count_cache.clear()
 
         # Create DynamoDB table
         dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
@@ -59,6 +81,67 @@ def aws_env():
         yield dynamodb
 
 
+class CallCounter:
+    """Per-operation AWS call counts, e.g. ops['dynamodb.Query']."""
+    def __init__(self):
+        self.ops = Counter()
+
+    def count(self, service):
+        return sum(n for op, n in self.ops.items() if op.startswith(f'{service}.'))
+
+    @property
+    def dynamodb(self):
+        return self.count('dynamodb')
+
+    @property
+    def s3(self):
+        return self.count('s3')
+
+    @property
+    def total(self):
+        return sum(self.ops.values())
+
+
+@pytest.fixture
+def query_budget(aws_env):
+    """Count DynamoDB and S3 calls made through db_util's clients and fail
+    the test if a block goes over budget:
+
+        with query_budget(dynamodb=3, s3=0) as calls:
+            lambda_handler(event, None)
+
+    Omitted limits are not checked; calls.ops has the per-operation counts."""
+    import db_util
+    active = []
+
+    def hook(service):
+        def on_call(model, **kwargs):
+            for counter in active:
+                counter.ops[f'{service}.{model.name}'] += 1
+        return on_call
+
+    # aws_env resets the cached clients, so these are fresh for this test
+    for service, client in (('dynamodb', db_util.get_table().meta.client),
+                            ('dynamodb', db_util.get_dynamodb_client()),
+                            ('s3', db_util.get_s3_client())):
+        client.meta.events.register(f'before-call.{service}', hook(service))
+
+    @contextlib.contextmanager
+    def budget(total=None, dynamodb=None, s3=None):
+        counter = CallCounter()
+        active.append(counter)
+        try:
+            yield counter
+        finally:
+            active.remove(counter)
+        for name, limit in (('total', total), ('dynamodb', dynamodb), ('s3', s3)):
+            actual = getattr(counter, name)
+            assert limit is None or actual <= limit, \
+                f'{name} calls {actual} > budget {limit}: {dict(counter.ops)}'
+
+    return budget
+
+
 def make_event(path, method='GET', body=None, headers=None, query=None, path_params=None):
     """Helper to build a Lambda event dict."""
     event = {
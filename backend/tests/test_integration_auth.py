@@ -49,12 +49,127 @@ class TestLogin:
         resp = lambda_handler(make_event('/auth/login', 'POST', body={'username': 'ghost', 'password': 'x'}), None)
         assert resp['statusCode'] == 401
 
+    def test_login_rehashes_outdated_hash(self, aws_env, monkeypatch):
+        import db_util, password_util
+        from functions.auth.app import lambda_handler
+        self._seed(aws_env)
+        monkeypatch.setattr(password_util, 'PASSWORD_HASH_ITERATIONS', 1000)
+        key = {'PK': 'USER#admin', 'SK': 'USER#admin'}
+
+        resp = lambda_handler(make_event('/auth/login', 'POST', body={'username': 'admin', 'password': 'ChangeMe123!'}), None)
+        assert resp['statusCode'] == 200
+        stored = db_util.get_table().get_item(Key=key)['Item']['passwordHash']
+        assert stored.startswith('pbkdf2_sha256:1000:')
+
+        resp = lambda_handler(make_event('/auth/login', 'POST', body={'username': 'admin', 'password': 'ChangeMe123!'}), None)
+        assert resp['statusCode'] == 200
+
+    def test_login_survives_failed_rehash(self, aws_env, monkeypatch, caplog):
+        import db_util, password_util
+        from functions.auth.app import lambda_handler
+        self._seed(aws_env)
+        monkeypatch.setattr(password_util, 'PASSWORD_HASH_ITERATIONS', 1000)
+
+        def throttled(**kwargs):
+            raise db_util.ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException'}}, 'UpdateItem')
+        monkeypatch.setattr(db_util.get_table(), 'update_item', throttled)
+        resp = lambda_handler(make_event('/auth/login', 'POST', body={'username': 'admin', 'password': 'ChangeMe123!'}), None)
+        assert resp['statusCode'] == 200
+        assert 'Rehashing the password of admin failed' in caplog.text
+
+    def test_login_with_text_and_base64_bodies(self, aws_env):
+        import base64
+        from functions.auth.app import lambda_handler
+        self._seed(aws_env)
+        body = json.dumps({'username': 'admin', 'password': 'ChangeMe123!'})
+        text = dict(make_event('/auth/login', 'POST'), body=body, isBase64Encoded=False)
+        encoded = dict(text, body=base64.b64encode(body.encode()).decode(), isBase64Encoded=True)
+        for event in (text, encoded):
+            resp = lambda_handler(event, None)
+            assert resp['statusCode'] == 200
+            assert parse_response(resp)['sessionToken']
+
     def test_login_empty_body(self, aws_env):
         from functions.auth.app import lambda_handler
         resp = lambda_handler(make_event('/auth/login', 'POST', body={}), None)
         assert resp['statusCode'] == 400
 
 
+class TestLoginThrottle:
+    def _login(self, username, password, ip=None):
+        from functions.auth.app import lambda_handler
+        event = make_event('/auth/login', 'POST', body={'username': username, 'password': password})
+        if ip:
+            event['requestContext'] = {'identity': {'sourceIp': ip}}
+        return lambda_handler(event, None)
+
+    def _count_verifies(self, monkeypatch):
+        import functions.auth.app as auth_app
+        calls = []
+        real_verify = auth_app.verify_password
+
+        def counting_verify(password, stored_hash):
+            calls.append(password)
+            return real_verify(password, stored_hash)
+        monkeypatch.setattr(auth_app, 'verify_password', counting_verify)
+        return calls
+
+    def test_username_shed_before_hashing(self, aws_env, monkeypatch):
+        import functions.auth.app as auth_app
+        auth_app.lambda_handler(make_event('/auth/seed-admin', 'POST'), None)
+        monkeypatch.setattr(auth_app, 'LOGIN_MAX_FAILURES_PER_USER', 3)
+        calls = self._count_verifies(monkeypatch)
+
+        for _ in range(3):
+            assert self._login('admin', 'wrong')['statusCode'] == 401
+        assert len(calls) == 3
+
+        resp = self._login('admin', 'ChangeMe123!')
+        assert resp['statusCode'] == 429
+        assert len(calls) == 3
+
+    def test_ip_shed_across_usernames(self, aws_env, monkeypatch):
+        import functions.auth.app as auth_app
+        monkeypatch.setattr(auth_app, 'LOGIN_MAX_FAILURES_PER_IP', 2)
+        calls = self._count_verifies(monkeypatch)
+        assert self._login('ghost1', 'x', ip='10.0.0.1')['statusCode'] == 401
+        assert self._login('ghost2', 'x', ip='10.0.0.1')['statusCode'] == 401
+        assert self._login('ghost3', 'x', ip='10.0.0.1')['statusCode'] == 429
+        assert len(calls) == 2
+        # Other source IPs are unaffected
+        assert self._login('ghost3', 'x', ip='10.0.0.2')['statusCode'] == 401
+
+    def test_shed_emits_metric(self, aws_env, monkeypatch, capsys):
+        import functions.auth.app as auth_app
+        monkeypatch.setattr(auth_app, 'LOGIN_MAX_FAILURES_PER_IP', 1)
+        self._login('ghost1', 'x', ip='10.0.0.1')
+        capsys.readouterr()
+        for _ in range(2):
+            assert self._login('ghost2', 'x', ip='10.0.0.1')['statusCode'] == 429
+
+        records = [json.loads(line) for line in capsys.readouterr().out.splitlines() if '"LoginShed"' in line]
+        assert [(r['LoginShed'], r['Reason']) for r in records] == [(1, 'sourceIp'), (1, 'sourceIp')]
+        directive = records[0]['_aws']['CloudWatchMetrics'][0]
+        assert directive['Dimensions'] == [['Reason']]
+        assert directive['Metrics'] == [{'Name': 'LoginShed', 'Unit': 'Count'}]
+
+    def test_unknown_username_still_hashes(self, aws_env, monkeypatch):
+        calls = self._count_verifies(monkeypatch)
+        assert self._login('ghost', 'x')['statusCode'] == 401
+        assert len(calls) == 1
+
+    def test_success_resets_username_counter(self, aws_env, monkeypatch):
+        import functions.auth.app as auth_app
+        auth_app.lambda_handler(make_event('/auth/seed-admin', 'POST'), None)
+        monkeypatch.setattr(auth_app, 'LOGIN_MAX_FAILURES_PER_USER', 3)
+        for _ in range(2):
+            assert self._login('admin', 'wrong')['statusCode'] == 401
+        assert self._login('admin', 'ChangeMe123!')['statusCode'] == 200
+        for _ in range(2):
+            assert self._login('admin', 'wrong')['statusCode'] == 401
+        assert self._login('admin', 'ChangeMe123!')['statusCode'] == 200
+
+
 class TestLogout:
     def test_logout_success(self, aws_env):
         from functions.auth.app import lambda_handler
@@ -107,6 +222,237 @@ class TestChangePassword:
         assert resp['statusCode'] == 401
 
 
+class TestSessionCache:
+    def _login(self):
+        from functions.auth.app import lambda_handler
+        lambda_handler(make_event('/auth/seed-admin', 'POST'), None)
+        login_resp = lambda_handler(make_event('/auth/login', 'POST', body={'username': 'admin', 'password': 'ChangeMe123!'}), None)
+        return parse_response(login_resp)['sessionToken']
+
+    def test_cached_session_skips_table_read(self, aws_env, monkeypatch):
+        import session_util
+        from session_util import validate_session
+        token = self._login()
+        event = make_event('/folders', headers=auth_header(token))
+        assert validate_session(event)['username'] == 'admin'
+
+        def fail(*args, **kwargs):
+            raise AssertionError('session read should be served from cache')
+        monkeypatch.setattr(session_util, 'fast_get_item', fail)
+        assert validate_session(event)['username'] == 'admin'
+
+    def test_unknown_token_is_negatively_cached(self, aws_env, monkeypatch):
+        import session_util
+        from session_util import validate_session
+        event = make_event('/folders', headers=auth_header('bogus'))
+        assert validate_session(event) is None
+
+        def fail(*args, **kwargs):
+            raise AssertionError('miss should be served from cache')
+        monkeypatch.setattr(session_util, 'fast_get_item', fail)
+        assert validate_session(event) is None
+
+    def test_delete_sessions_for_user_invalidates_cache(self, aws_env):
+        from session_util import validate_session, delete_sessions_for_user
+        token = self._login()
+        event = make_event('/folders', headers=auth_header(token))
+        assert validate_session(event)
+        delete_sessions_for_user('admin')
+        assert validate_session(event) is None
+
+
+class TestSlidingExpiry:
+    def _age_session(self, token, seconds, created_seconds_ago=None):
+        """Rewind a stored session as if it had been idle for a while."""
+        import time, db_util, session_util
+        key = {'PK': f'SESSION#{token}', 'SK': f'SESSION#{token}'}
+        now = int(time.time())
+        values = {':t': now + session_util.SESSION_TTL_SECONDS - seconds}
+        update = 'SET #ttl = :t'
+        if created_seconds_ago is not None:
+            update += ', createdAt = :c'
+            values[':c'] = now - created_seconds_ago
+        db_util.get_table().update_item(Key=key, UpdateExpression=update,
+            ExpressionAttributeNames={'#ttl': 'ttl'}, ExpressionAttributeValues=values)
+        session_util._session_cache.clear()
+        return key
+
+    def _ttl(self, key):
+        import db_util
+        return int(db_util.get_table().get_item(Key=key)['Item']['ttl'])
+
+    def test_active_session_is_extended(self, aws_env):
+        import time, session_util
+        from session_util import create_session, validate_session
+        token = create_session('alice', 'viewer')
+        key = self._age_session(token, session_util.SESSION_REFRESH_INTERVAL_SECONDS + 60)
+        assert validate_session(make_event('/folders', headers=auth_header(token)))
+        assert self._ttl(key) >= int(time.time()) + session_util.SESSION_TTL_SECONDS - 5
+
+    def test_recent_session_is_not_rewritten(self, aws_env, monkeypatch):
+        import db_util
+        from session_util import create_session, validate_session
+        token = create_session('alice', 'viewer')
+
+        def fail(**kwargs):
+            raise AssertionError('fresh sessions should not be rewritten')
+        monkeypatch.setattr(db_util.get_table(), 'update_item', fail)
+        for _ in range(5):
+            assert validate_session(make_event('/folders', headers=auth_header(token)))
+
+    def test_refresh_writes_once_per_interval(self, aws_env, monkeypatch):
+        import db_util, session_util
+        from session_util import create_session, validate_session
+        token = create_session('alice', 'viewer')
+        self._age_session(token, session_util.SESSION_REFRESH_INTERVAL_SECONDS + 60)
+        table = db_util.get_table()
+        real_update = table.update_item
+        writes = []
+
+        def counting_update(**kwargs):
+            writes.append(kwargs)
+            return real_update(**kwargs)
+        monkeypatch.setattr(table, 'update_item', counting_update)
+        for _ in range(3):
+            assert validate_session(make_event('/folders', headers=auth_header(token)))
+            session_util._session_cache.clear()
+        assert len(writes) == 1
+
+    def test_extension_capped_by_max_lifetime(self, aws_env):
+        import session_util
+        from session_util import create_session, validate_session
+        token = create_session('alice', 'viewer')
+        max_life = session_util.SESSION_MAX_LIFETIME_SECONDS
+        key = self._age_session(token, session_util.SESSION_REFRESH_INTERVAL_SECONDS + 60,
+            created_seconds_ago=max_life - 3600)
+        before = self._ttl(key)
+        assert validate_session(make_event('/folders', headers=auth_header(token)))
+        assert self._ttl(key) == before
+
+    def test_session_without_gsi1_keys_is_not_extended(self, aws_env):
+        import db_util, session_util
+        from session_util import create_session, validate_session
+        token = create_session('alice', 'viewer')
+        key = self._age_session(token, session_util.SESSION_REFRESH_INTERVAL_SECONDS + 60)
+        db_util.get_table().update_item(Key=key, UpdateExpression='REMOVE GSI1PK, GSI1SK')
+        session_util._session_cache.clear()
+        before = self._ttl(key)
+        assert validate_session(make_event('/folders', headers=auth_header(token)))
+        assert self._ttl(key) == before
+
+    def test_stale_cached_expiry_rechecks_table(self, aws_env):
+        import time, session_util
+        from session_util import create_session, validate_session
+        token = create_session('alice', 'viewer')
+        # Cached copy says expired; the table (extended elsewhere) says valid
+        session_util._session_cache.get(token)['ttl'] = int(time.time()) - 1
+        assert validate_session(make_event('/folders', headers=auth_header(token)))
+
+
+class TestSignedSessions:
+    def _enable(self, monkeypatch):
+        import session_util
+        monkeypatch.setattr(session_util, 'SESSION_TOKEN_MODE', 'signed')
+        monkeypatch.setattr(session_util, 'SESSION_SIGNING_KEYS', {'k1': b'secret-one', 'k0': b'secret-zero'})
+        monkeypatch.setattr(session_util, 'SESSION_SIGNING_KEY_ID', 'k1')
+
+    def _login(self, username='admin', password='ChangeMe123!'):
+        from functions.auth.app import lambda_handler
+        lambda_handler(make_event('/auth/seed-admin', 'POST'), None)
+        login_resp = lambda_handler(make_event('/auth/login', 'POST', body={'username': username, 'password': password}), None)
+        return parse_response(login_resp)['sessionToken']
+
+    def test_signed_token_validates_without_session_read(self, aws_env, monkeypatch):
+        import session_util
+        from session_util import validate_session
+        self._enable(monkeypatch)
+        token = self._login()
+        assert token.startswith('k1.')
+
+        def fail(*args, **kwargs):
+            raise AssertionError('signed tokens should not read a session item')
+        monkeypatch.setattr(session_util, 'fast_get_item', fail)
+        session = validate_session(make_event('/folders', headers=auth_header(token)))
+        assert session['username'] == 'admin'
+        assert session['role'] == 'admin'
+
+    def test_tampered_token_rejected(self, aws_env, monkeypatch):
+        from session_util import validate_session
+        self._enable(monkeypatch)
+        kid, payload, sig = self._login().split('.')
+        forged = f'{kid}.{payload}.{"A" * len(sig)}'
+        assert validate_session(make_event('/folders', headers=auth_header(forged))) is None
+
+    def test_unknown_key_id_rejected(self, aws_env, monkeypatch):
+        import session_util
+        self._enable(monkeypatch)
+        token = self._login()
+        monkeypatch.setattr(session_util, 'SESSION_SIGNING_KEYS', {'k2': b'other'})
+        assert session_util.validate_session(make_event('/folders', headers=auth_header(token))) is None
+
+    def test_expired_token_rejected(self, aws_env, monkeypatch):
+        import session_util
+        self._enable(monkeypatch)
+        monkeypatch.setattr(session_util, 'SESSION_TTL_SECONDS', -1)
+        token = self._login()
+        assert session_util.validate_session(make_event('/folders', headers=auth_header(token))) is None
+
+    def test_logout_revokes_token(self, aws_env, monkeypatch):
+        from functions.auth.app import lambda_handler
+        self._enable(monkeypatch)
+        token = self._login()
+        other = self._login()
+        resp = lambda_handler(make_event('/auth/logout', 'POST', headers=auth_header(token)), None)
+        assert resp['statusCode'] == 200
+        resp2 = lambda_handler(make_event('/auth/logout', 'POST', headers=auth_header(token)), None)
+        assert resp2['statusCode'] == 401
+        # Other sessions of the same user are unaffected
+        resp3 = lambda_handler(make_event('/auth/logout', 'POST', headers=auth_header(other)), None)
+        assert resp3['statusCode'] == 200
+
+    def test_delete_user_revokes_all_tokens(self, aws_env, monkeypatch):
+        from functions.users.app import lambda_handler as users_handler
+        from session_util import validate_session
+        self._enable(monkeypatch)
+        admin_token = self._login()
+        users_handler(make_event('/users', 'POST',
+            body={'username': 'alice', 'password': 'p', 'role': 'viewer'},
+            headers=auth_header(admin_token)), None)
+        alice_token = self._login('alice', 'p')
+        assert validate_session(make_event('/folders', headers=auth_header(alice_token)))
+
+        users_handler(make_event('/users/alice', 'DELETE',
+            headers=auth_header(admin_token), path_params={'username': 'alice'}), None)
+        assert validate_session(make_event('/folders', headers=auth_header(alice_token))) is None
+
+    def test_login_in_same_second_as_revoke_all_is_valid(self, aws_env, monkeypatch):
+        import session_util
+        from functions.users.app import lambda_handler as users_handler
+        self._enable(monkeypatch)
+        admin_token = self._login()
+        create = make_event('/users', 'POST',
+            body={'username': 'alice', 'password': 'p', 'role': 'viewer'}, headers=auth_header(admin_token))
+        users_handler(create, None)
+        old_token = self._login('alice', 'p')
+        # Run the revoke-all and the new login inside one (future) second
+        second = int(session_util.time.time()) + 1
+        ticks = iter(range(1, 1000))
+        with monkeypatch.context() as m:
+            m.setattr(session_util.time, 'time', lambda: second + next(ticks) / 1000)
+            users_handler(make_event('/users/alice', 'DELETE',
+                headers=auth_header(admin_token), path_params={'username': 'alice'}), None)
+            users_handler(create, None)
+            new_token = self._login('alice', 'p')
+        assert session_util.validate_session(make_event('/folders', headers=auth_header(old_token))) is None
+        assert session_util.validate_session(make_event('/folders', headers=auth_header(new_token)))['username'] == 'alice'
+
+    def test_opaque_tokens_still_accepted(self, aws_env, monkeypatch):
+        from session_util import validate_session
+        token = self._login()
+        self._enable(monkeypatch)
+        assert validate_session(make_event('/folders', headers=auth_header(token)))['username'] == 'admin'
+
+
 class TestRouting:
     def test_options_returns_200(self, aws_env):
         from functions.auth.app import lambda_handler
@@ -0,0 +1,279 @@
+"""Integration tests for shared-layer DynamoDB helpers."""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'layers', 'shared', 'python'))
+
+
+def _put_items(n):
+    import db_util
+    table = db_util.get_table()
+    with table.batch_writer() as batch:
+        for i in range(n):
+            batch.put_item(Item={'PK': f'ITEM#{i}', 'SK': f'ITEM#{i}', 'n': i})
+
+
+def _key(i):
+    return {'PK': f'ITEM#{i}', 'SK': f'ITEM#{i}'}
+
+
+class TestBatchGetItems:
+    def test_empty(self, aws_env):
+        from db_util import batch_get_items
+        assert batch_get_items([]) == []
+
+    def test_chunks_and_preserves_order(self, aws_env, monkeypatch):
+        import db_util
+        _put_items(250)
+        client = db_util.get_table().meta.client
+        real_batch_get = client.batch_get_item
+        calls = []
+
+        def counting_batch_get(**kwargs):
+            calls.append(len(kwargs['RequestItems']['test-table']['Keys']))
+            return real_batch_get(**kwargs)
+        monkeypatch.setattr(client, 'batch_get_item', counting_batch_get)
+
+        keys = [_key(i) for i in reversed(range(250))]
+        items = db_util.batch_get_items(keys)
+        assert [int(item['n']) for item in items] == list(reversed(range(250)))
+        assert sorted(calls) == [50, 100, 100]
+
+    def test_missing_and_duplicate_keys(self, aws_env):
+        from db_util import batch_get_items
+        _put_items(2)
+        items = batch_get_items([_key(1), _key(99), _key(1), _key(0)])
+        assert [item and int(item['n']) for item in items] == [1, None, 1, 0]
+
+    def test_projection(self, aws_env):
+        from db_util import batch_get_items
+        _put_items(1)
+        [item] = batch_get_items([_key(0)], projection=['n'])
+        assert set(item) == {'PK', 'SK', 'n'}
+
+    def test_retries_unprocessed_keys(self, aws_env, monkeypatch):
+        import db_util
+        _put_items(3)
+        client = db_util.get_table().meta.client
+        real_batch_get = client.batch_get_item
+        calls = []
+
+        def flaky_batch_get(**kwargs):
+            calls.append(kwargs)
+            request = kwargs['RequestItems']['test-table']
+            if len(calls) == 1:
+                # Serve only the first key; hand the rest back as unprocessed
+                resp = real_batch_get(RequestItems={'test-table': {**request, 'Keys': request['Keys'][:1]}})
+                resp['UnprocessedKeys'] = {'test-table': {**request, 'Keys': request['Keys'][1:]}}
+                return resp
+            return real_batch_get(**kwargs)
+        monkeypatch.setattr(client, 'batch_get_item', flaky_batch_get)
+        monkeypatch.setattr(db_util.time, 'sleep', lambda s: None)
+
+        items = db_util.batch_get_items([_key(0), _key(1), _key(2)])
+        assert [int(item['n']) for item in items] == [0, 1, 2]
+        assert len(calls) == 2
+
+
+class TestBatchDeleteItems:
+    def test_chunks_and_deletes(self, aws_env, monkeypatch):
+        import db_util
+        _put_items(60)
+        client = db_util.get_table().meta.client
+        real_batch_write = client.batch_write_item
+        calls = []
+
+        def counting_batch_write(**kwargs):
+            calls.append(len(kwargs['RequestItems']['test-table']))
+            return real_batch_write(**kwargs)
+        monkeypatch.setattr(client, 'batch_write_item', counting_batch_write)
+
+        db_util.batch_delete_items([_key(i) for i in range(55)] + [_key(0)])
+        assert sorted(calls) == [5, 25, 25]
+        remaining = db_util.batch_get_items([_key(i) for i in range(60)])
+        assert [i for i, item in enumerate(remaining) if item] == list(range(55, 60))
+
+    def test_retries_unprocessed_items(self, aws_env, monkeypatch):
+        import db_util
+        _put_items(3)
+        client = db_util.get_table().meta.client
+        real_batch_write = client.batch_write_item
+        calls = []
+
+        def flaky_batch_write(**kwargs):
+            calls.append(kwargs)
+            requests = kwargs['RequestItems']['test-table']
+            if len(calls) == 1:
+                resp = real_batch_write(RequestItems={'test-table': requests[:1]})
+                resp['UnprocessedItems'] = {'test-table': requests[1:]}
+                return resp
+            return real_batch_write(**kwargs)
+        monkeypatch.setattr(client, 'batch_write_item', flaky_batch_write)
+        monkeypatch.setattr(db_util.time, 'sleep', lambda s: None)
+
+        db_util.batch_delete_items([_key(0), _key(1), _key(2)])
+        assert len(calls) == 2
+        assert db_util.batch_get_items([_key(0), _key(1), _key(2)]) == [None, None, None]
+
+
+class TestQueryItems:
+    def test_limit_and_projection(self, aws_env):
+        from boto3.dynamodb.conditions import Key
+        import db_util
+        table = db_util.get_table()
+        for i in range(5):
+            table.put_item(Item={'PK': 'P', 'SK': f'S#{i}', 'n': i, 'extra': 'x'})
+        items = list(db_util.query_items(KeyConditionExpression=Key('PK').eq('P'), Limit=2, limit=3, projection=['n']))
+        assert [int(i['n']) for i in items] == [0, 1, 2]
+        assert all(set(i) == {'n'} for i in items)
+
+
+class TestRequestScope:
+    def _spy_get_item(self, monkeypatch):
+        import db_util
+        raw = db_util.get_table()._table
+        real_get_item = raw.get_item
+        calls = []
+
+        def counting_get_item(**kwargs):
+            calls.append(kwargs['Key'])
+            return real_get_item(**kwargs)
+        monkeypatch.setattr(raw, 'get_item', counting_get_item)
+        return calls
+
+    def test_duplicate_reads_cost_nothing(self, aws_env, monkeypatch):
+        import db_util
+        _put_items(1)
+        calls = self._spy_get_item(monkeypatch)
+
+        @db_util.request_scope
+        def handler(event, context):
+            table = db_util.get_table()
+            first = table.get_item(Key=_key(0))['Item']
+            second = table.get_item(Key=_key(0))['Item']
+            missing = [table.get_item(Key=_key(9)).get('Item') for _ in range(2)]
+            return first, second, missing
+
+        first, second, missing = handler({}, None)
+        assert first == second
+        assert missing == [None, None]
+        assert len(calls) == 2
+        assert db_util.last_request_stats == {'reads': 2, 'hits': 2}
+
+    def test_own_writes_update_the_map(self, aws_env, monkeypatch):
+        import db_util
+        calls = self._spy_get_item(monkeypatch)
+
+        @db_util.request_scope
+        def handler(event, context):
+            table = db_util.get_table()
+            table.put_item(Item={'PK': 'A', 'SK': 'A', 'v': 1})
+            put = table.get_item(Key={'PK': 'A', 'SK': 'A'})['Item']['v']
+            table.update_item(Key={'PK': 'A', 'SK': 'A'}, UpdateExpression='SET v = :v',
+                ExpressionAttributeValues={':v': 2})
+            updated = table.get_item(Key={'PK': 'A', 'SK': 'A'})['Item']['v']
+            with table.batch_writer() as batch:
+                batch.delete_item(Key={'PK': 'A', 'SK': 'A'})
+            deleted = table.get_item(Key={'PK': 'A', 'SK': 'A'}).get('Item')
+            return put, updated, deleted
+
+        assert handler({}, None) == (1, 2, None)
+        # Only the read after update_item had to go to the table
+        assert len(calls) == 1
+
+    def test_transactions_and_consistent_reads_skip_stale_entries(self, aws_env, monkeypatch):
+        import db_util
+        _put_items(2)
+
+        @db_util.request_scope
+        def handler(event, context):
+            table = db_util.get_table()
+            table.get_item(Key=_key(0))
+            table.get_item(Key=_key(1))
+            db_util.transact_write_items([
+                {'Put': {'TableName': table.name, 'Item': dict(_key(0), n=10)}},
+                {'Delete': {'TableName': table.name, 'Key': _key(1)}},
+            ])
+            after_transact = table.get_item(Key=_key(0))['Item']['n'], table.get_item(Key=_key(1)).get('Item')
+            table.meta.client.put_item(TableName=table.name, Item=dict(_key(0), n=20))
+            cached = table.get_item(Key=_key(0))['Item']['n']
+            consistent = table.get_item(Key=_key(0), ConsistentRead=True)['Item']['n']
+            return after_transact, cached, consistent
+
+        assert handler({}, None) == ((10, None), 10, 20)
+
+    def test_batch_get_items_shares_the_map(self, aws_env, monkeypatch):
+        import db_util
+        _put_items(3)
+
+        @db_util.request_scope
+        def handler(event, context):
+            db_util.get_table().get_item(Key=_key(0))
+            return db_util.batch_get_items([_key(0), _key(1), _key(2)])
+
+        assert [int(i['n']) for i in handler({}, None)] == [0, 1, 2]
+        assert db_util.last_request_stats == {'reads': 3, 'hits': 1}
+
+    def test_cache_cleared_after_handler(self, aws_env, monkeypatch):
+        import db_util
+        _put_items(1)
+
+        @db_util.request_scope
+        def handler(event, context):
+            return db_util.get_table().get_item(Key=_key(0))['Item']
+
+        handler({}, None)
+        calls = self._spy_get_item(monkeypatch)
+        handler({}, None)
+        db_util.get_table().get_item(Key=_key(0))
+        assert len(calls) == 2
+
+
+class TestFastPath:
+    def test_fast_get_item(self, aws_env):
+        from db_util import fast_get_item
+        _put_items(1)
+        assert fast_get_item(_key(0)) == {'PK': 'ITEM#0', 'SK': 'ITEM#0', 'n': 0}
+        assert fast_get_item(_key(0), projection=['n']) == {'n': 0}
+        assert fast_get_item(_key(5)) is None
+
+    def test_fast_query_items_paginates(self, aws_env):
+        import db_util
+        table = db_util.get_table()
+        for i in range(5):
+            table.put_item(Item={'PK': 'P', 'SK': f'S#{i}', 'n': i})
+        items = list(db_util.fast_query_items('PK = :pk AND begins_with(SK, :sk)', {':pk': 'P', ':sk': 'S#'}))
+        assert [i['n'] for i in items] == [0, 1, 2, 3, 4]
+        limited = list(db_util.fast_query_items('PK = :pk', {':pk': 'P'}, projection=['n'], limit=2))
+        assert limited == [{'n': 0}, {'n': 1}]
+
+    def test_load_folder_acl_reads_consistently(self, aws_env, monkeypatch):
+        import db_util, session_util
+        client = db_util.get_dynamodb_client()
+        real_query = client.query
+        calls = []
+
+        def spy(**kwargs):
+            calls.append(kwargs)
+            return real_query(**kwargs)
+        monkeypatch.setattr(client, 'query', spy)
+        assert session_util.load_folder_acl('nobody') == []
+        assert calls[0]['ConsistentRead'] is True
+
+    def test_fast_scan_items_segments(self, aws_env):
+        import db_util
+        _put_items(30)
+        whole = db_util.fast_scan_items(projection=['n'])
+        parallel = db_util.fast_scan_items(projection=['n'], segments=4)
+        assert sorted(i['n'] for i in whole) == list(range(30))
+        assert sorted(i['n'] for i in parallel) == list(range(30))
+
+    def test_fast_get_item_shares_identity_map(self, aws_env):
+        import db_util
+        _put_items(1)
+
+        @db_util.request_scope
+        def handler(event, context):
+            db_util.get_table().get_item(Key=_key(0))
+            return db_util.fast_get_item(_key(0))
+
+        assert handler({}, None)['n'] == 0
+        assert db_util.last_request_stats == {'reads': 1, 'hits': 1}
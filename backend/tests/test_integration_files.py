@@ -171,6 +171,140 @@ class TestListFiles:
         assert names == ['alpha.txt', 'bravo.txt', 'charlie.txt']
 
 
+class TestConditionalList:
+    def _list(self, handler, token, folder_id, etag=None):
+        headers = auth_header(token)
+        if etag:
+            headers['If-None-Match'] = etag
+        return handler(make_event('/files', 'GET', query={'folderId': folder_id}, headers=headers), None)
+
+    def test_not_modified_skips_queries(self, aws_env, monkeypatch):
+        from functions.files import app as files_app
+        tokens, folder_id = _full_setup(aws_env)
+        files_app.lambda_handler(make_event('/files/upload-url', 'POST',
+            body={'folderId': folder_id, 'fileName': 'a.txt', 'fileSize': 10},
+            headers=auth_header(tokens['admin'])), None)
+
+        first = self._list(files_app.lambda_handler, tokens['viewer1'], folder_id)
+        etag = first['headers']['ETag']
+
+        def boom(*args):
+            raise AssertionError('listing should not be rebuilt')
+
+        monkeypatch.setattr(files_app, '_list_folder_files', boom)
+        resp = self._list(files_app.lambda_handler, tokens['viewer1'], folder_id, etag)
+        assert resp['statusCode'] == 304
+        assert resp['body'] == ''
+        assert resp['headers']['ETag'] == etag
+
+    def test_upload_changes_etag(self, aws_env):
+        from functions.files.app import lambda_handler
+        tokens, folder_id = _full_setup(aws_env)
+        etag = self._list(lambda_handler, tokens['viewer1'], folder_id)['headers']['ETag']
+
+        lambda_handler(make_event('/files/upload-url', 'POST',
+            body={'folderId': folder_id, 'fileName': 'a.txt', 'fileSize': 10},
+            headers=auth_header(tokens['admin'])), None)
+
+        resp = self._list(lambda_handler, tokens['viewer1'], folder_id, etag)
+        assert resp['statusCode'] == 200
+        assert resp['headers']['ETag'] != etag
+        assert len(parse_response(resp)['files']) == 1
+
+    def test_search_uses_payload_etag(self, aws_env):
+        from functions.files.app import lambda_handler
+        tokens, folder_id = _full_setup(aws_env)
+        lambda_handler(make_event('/files/upload-url', 'POST',
+            body={'folderId': folder_id, 'fileName': 'report.pdf', 'fileSize': 10},
+            headers=auth_header(tokens['admin'])), None)
+
+        event = make_event('/files', 'GET', query={'search': 'report'}, headers=auth_header(tokens['viewer1']))
+        etag = lambda_handler(event, None)['headers']['ETag']
+        event['headers']['If-None-Match'] = etag
+        assert lambda_handler(event, None)['statusCode'] == 304
+
+
+class TestFolderAclSnapshot:
+    def test_access_check_uses_session_snapshot(self, aws_env):
+        import db_util
+        from functions.files.app import lambda_handler
+        tokens, folder_id = _full_setup(aws_env)
+        lambda_handler(make_event('/files/upload-url', 'POST',
+            body={'folderId': folder_id, 'fileName': 'a.txt', 'fileSize': 1},
+            headers=auth_header(tokens['admin'])), None)
+
+        # Remove the assignment row behind the API's back: the access checks
+        # must still pass because they answer from the session snapshot.
+        db_util.get_table().delete_item(Key={'PK': 'USER#viewer1', 'SK': f'FOLDER#{folder_id}'})
+
+        resp = lambda_handler(make_event('/files', 'GET',
+            query={'folderId': folder_id},
+            headers=auth_header(tokens['viewer1'])), None)
+        assert resp['statusCode'] == 200
+        resp = lambda_handler(make_event('/files', 'GET',
+            query={'search': 'a.txt'},
+            headers=auth_header(tokens['viewer1'])), None)
+        assert len(parse_response(resp)['files']) == 1
+
+    def test_unassign_refreshes_snapshot(self, aws_env):
+        import session_util
+        from functions.files.app import lambda_handler
+        from functions.folders.app import lambda_handler as folders_handler
+        tokens, folder_id = _full_setup(aws_env)
+        folders_handler(make_event('/folders/assignments', 'DELETE',
+            body={'username': 'viewer1', 'folderIds': [folder_id]},
+            headers=auth_header(tokens['admin'])), None)
+
+        # Drop the container cache too, so the stored snapshot itself is checked
+        session_util._session_cache.clear()
+        resp = lambda_handler(make_event('/files', 'GET',
+            query={'folderId': folder_id},
+            headers=auth_header(tokens['viewer1'])), None)
+        assert resp['statusCode'] == 403
+
+    def test_delete_folder_refreshes_snapshot(self, aws_env):
+        from functions.files.app import lambda_handler
+        from functions.folders.app import lambda_handler as folders_handler
+        tokens, folder_id = _full_setup(aws_env)
+        folders_handler(make_event(f'/folders/{folder_id}', 'DELETE',
+            headers=auth_header(tokens['admin']),
+            path_params={'folderId': folder_id}), None)
+
+        resp = lambda_handler(make_event('/files/upload-url', 'POST',
+            body={'folderId': folder_id, 'fileName': 'late.txt', 'fileSize': 1},
+            headers=auth_header(tokens['uploader1'])), None)
+        assert resp['statusCode'] == 403
+
+
+    def test_unassign_during_login_reaches_new_session(self, monkeypatch, aws_env):
+        import session_util
+        from functions.auth.app import lambda_handler as auth_handler
+        from functions.files.app import lambda_handler
+        from functions.folders.app import lambda_handler as folders_handler
+        tokens, folder_id = _full_setup(aws_env)
+        real_load = session_util.load_folder_acl
+        raced = []
+
+        def load_then_unassign(username):
+            folder_ids = real_load(username)
+            if not raced:
+                # Lands after login took its snapshot, before the session exists
+                raced.append(username)
+                folders_handler(make_event('/folders/assignments', 'DELETE',
+                    body={'username': 'viewer1', 'folderIds': [folder_id]},
+                    headers=auth_header(tokens['admin'])), None)
+            return folder_ids
+        monkeypatch.setattr(session_util, 'load_folder_acl', load_then_unassign)
+        token = parse_response(auth_handler(make_event('/auth/login', 'POST',
+            body={'username': 'viewer1', 'password': 'p'}), None))['sessionToken']
+        assert raced == ['viewer1']
+
+        session_util._session_cache.clear()
+        resp = lambda_handler(make_event('/files', 'GET',
+            query={'folderId': folder_id}, headers=auth_header(token)), None)
+        assert resp['statusCode'] == 403
+
+
 class TestDownloadUrl:
     def test_admin_can_download(self, aws_env):
         from functions.files.app import lambda_handler
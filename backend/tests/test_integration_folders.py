@@ -58,6 +58,26 @@ class TestCreateFolder:
             headers=auth_header(admin_token)), None)
         assert resp['statusCode'] == 409
 
+    def test_nesting_depth_limited(self, aws_env, monkeypatch):
+        import functions.folders.app as folders_app
+        admin_token, _ = _setup(aws_env)
+        monkeypatch.setattr(folders_app, 'FOLDER_MAX_DEPTH', 2)
+        a = _create(admin_token, 'A')
+        b = _create(admin_token, 'B', a)
+        resp = folders_app.lambda_handler(make_event('/folders', 'POST',
+            body={'folderName': 'C', 'parentFolderId': b}, headers=auth_header(admin_token)), None)
+        assert resp['statusCode'] == 400
+
+    def test_default_depth_fits_sort_key(self, aws_env):
+        import functions.folders.app as folders_app
+        admin_token, _ = _setup(aws_env)
+        parent = 'ROOT'
+        for level in range(folders_app.FOLDER_MAX_DEPTH):
+            parent = _create(admin_token, f'L{level}', parent)
+        resp = folders_app.lambda_handler(make_event('/folders', 'POST',
+            body={'folderName': 'Too deep', 'parentFolderId': parent}, headers=auth_header(admin_token)), None)
+        assert resp['statusCode'] == 400
+
     def test_create_folder_forbidden_for_non_admin(self, aws_env):
         from functions.folders.app import lambda_handler
         _, viewer_token = _setup(aws_env)
@@ -84,6 +104,31 @@ class TestListFolders:
         folders = parse_response(resp)['folders']
         assert len(folders) == 2
 
+    def test_admin_sees_assigned_users(self, aws_env, monkeypatch):
+        import functions.folders.app as folders_app
+        from functions.folders.app import lambda_handler
+        from functions.users.app import lambda_handler as users_handler
+        admin_token, _ = _setup(aws_env)
+        users_handler(make_event('/users', 'POST',
+            body={'username': 'alice', 'password': 'p', 'role': 'reader'},
+            headers=auth_header(admin_token)), None)
+        a, b, c = (parse_response(lambda_handler(make_event('/folders', 'POST',
+            body={'folderName': name}, headers=auth_header(admin_token)), None))['folderId'] for name in 'ABC')
+        for username, folder_ids in (('viewer1', [a, b]), ('alice', [a])):
+            lambda_handler(make_event('/folders/assignments', 'POST',
+                body={'username': username, 'folderIds': folder_ids}, headers=auth_header(admin_token)), None)
+
+        def assigned():
+            folders = parse_response(lambda_handler(make_event('/folders', 'GET',
+                headers=auth_header(admin_token)), None))['folders']
+            return {f['folderId']: f['assignedUsers'] for f in folders}
+
+        expected = {a: ['alice', 'viewer1'], b: ['viewer1'], c: []}
+        assert assigned() == expected
+        # Same join from a parallel scan
+        monkeypatch.setattr(folders_app, 'ASSIGNMENT_SCAN_SEGMENTS', 3)
+        assert assigned() == expected
+
     def test_non_admin_sees_only_assigned(self, aws_env):
         from functions.folders.app import lambda_handler
         admin_token, viewer_token = _setup(aws_env)
@@ -106,6 +151,50 @@ class TestListFolders:
         assert len(folders) == 1
         assert folders[0]['folderName'] == 'Assigned'
 
+    def test_etag_tracks_catalog_revision(self, aws_env):
+        from functions.folders.app import lambda_handler
+        admin_token, viewer_token = _setup(aws_env)
+        f = parse_response(lambda_handler(make_event('/folders', 'POST',
+            body={'folderName': 'A'}, headers=auth_header(admin_token)), None))
+
+        def list_with(token, etag=None):
+            headers = auth_header(token)
+            if etag:
+                headers['If-None-Match'] = etag
+            return lambda_handler(make_event('/folders', 'GET', headers=headers), None)
+
+        admin_etag = list_with(admin_token)['headers']['ETag']
+        viewer_etag = list_with(viewer_token)['headers']['ETag']
+        assert admin_etag != viewer_etag
+        assert list_with(admin_token, admin_etag)['statusCode'] == 304
+
+        # Assignment changes what both views return
+        lambda_handler(make_event('/folders/assignments', 'POST',
+            body={'username': 'viewer1', 'folderIds': [f['folderId']]},
+            headers=auth_header(admin_token)), None)
+        assert list_with(admin_token, admin_etag)['statusCode'] == 200
+        resp = list_with(viewer_token, viewer_etag)
+        assert resp['statusCode'] == 200
+        assert len(parse_response(resp)['folders']) == 1
+
+    def test_large_listing_gzipped(self, aws_env):
+        import base64, gzip
+        from functions.folders.app import lambda_handler
+        admin_token, _ = _setup(aws_env)
+        for i in range(20):
+            lambda_handler(make_event('/folders', 'POST',
+                body={'folderName': f'Folder {i:02d}'},
+                headers=auth_header(admin_token)), None)
+
+        resp = lambda_handler(make_event('/folders', 'GET',
+            headers={**auth_header(admin_token), 'Accept': 'application/json', 'Accept-Encoding': 'gzip, deflate'}), None)
+        assert resp['statusCode'] == 200
+        assert resp['isBase64Encoded'] is True
+        assert resp['headers']['Content-Encoding'] == 'gzip'
+        assert resp['headers']['ETag'].endswith('-gzip"')
+        folders = json.loads(gzip.decompress(base64.b64decode(resp['body'])))['folders']
+        assert len(folders) == 20
+
 
 class TestDeleteFolder:
     def test_delete_folder(self, aws_env):
@@ -125,6 +214,22 @@ class TestDeleteFolder:
             headers=auth_header(admin_token)), None)
         assert len(parse_response(list_resp)['folders']) == 0
 
+    def test_delete_removes_whole_subtree(self, aws_env):
+        import db_util
+        from functions.folders.app import lambda_handler
+        admin_token, _ = _setup(aws_env)
+        top = parent = _create(admin_token, 'L0')
+        for depth in range(1, 6):
+            parent = _create(admin_token, f'L{depth}', parent)
+        _create(admin_token, 'Sibling', top)
+        keep = _create(admin_token, 'Keep')
+        resp = lambda_handler(make_event(f'/folders/{top}', 'DELETE',
+            headers=auth_header(admin_token), path_params={'folderId': top}), None)
+        assert resp['statusCode'] == 200
+        assert _names(_tree(admin_token)['tree']) == [('Keep', [])]
+        remaining = list(db_util.fast_query_items('GSI4PK = :t', {':t': 'FOLDERTREE'}, index='GSI4'))
+        assert [f['folderId'] for f in remaining] == [keep]
+
     def test_delete_nonexistent(self, aws_env):
         from functions.folders.app import lambda_handler
         admin_token, _ = _setup(aws_env)
@@ -172,3 +277,286 @@ class TestAssignments:
             body={'username': 'ghost', 'folderIds': ['x']},
             headers=auth_header(admin_token)), None)
         assert resp['statusCode'] == 404
+
+
+class TestAssignmentCopies:
+    def _tree(self, admin_token):
+        from functions.folders.app import lambda_handler
+        parent = parse_response(lambda_handler(make_event('/folders', 'POST',
+            body={'folderName': 'Parent'}, headers=auth_header(admin_token)), None))['folderId']
+        child = parse_response(lambda_handler(make_event('/folders', 'POST',
+            body={'folderName': 'Child', 'parentFolderId': parent}, headers=auth_header(admin_token)), None))['folderId']
+        return parent, child
+
+    def _viewer_folders(self, viewer_token):
+        from functions.folders.app import lambda_handler
+        return parse_response(lambda_handler(make_event('/folders', 'GET',
+            headers=auth_header(viewer_token)), None))['folders']
+
+    def test_rows_carry_folder_fields(self, aws_env):
+        import db_util
+        from functions.folders.app import lambda_handler
+        admin_token, viewer_token = _setup(aws_env)
+        parent, child = self._tree(admin_token)
+        lambda_handler(make_event('/folders/assignments', 'POST',
+            body={'username': 'viewer1', 'folderIds': [child, 'no-such-folder']},
+            headers=auth_header(admin_token)), None)
+
+        rows = list(db_util.fast_query_items('PK = :pk AND begins_with(SK, :sk)',
+            {':pk': 'USER#viewer1', ':sk': 'FOLDER#'}))
+        assert [(r['folderId'], r['folderName'], r['parentFolderId']) for r in rows] == [(child, 'Child', parent)]
+        assert self._viewer_folders(viewer_token) == [
+            {'folderId': child, 'folderName': 'Child', 'parentFolderId': parent}]
+
+    def test_legacy_rows_read_the_folder(self, aws_env):
+        import db_util
+        from functions.folders.app import lambda_handler
+        admin_token, viewer_token = _setup(aws_env)
+        parent, child = self._tree(admin_token)
+        lambda_handler(make_event('/folders/assignments', 'POST',
+            body={'username': 'viewer1', 'folderIds': [parent, child]}, headers=auth_header(admin_token)), None)
+        table = db_util.get_table()
+        table.update_item(Key={'PK': 'USER#viewer1', 'SK': f'FOLDER#{child}'},
+            UpdateExpression='REMOVE parentFolderId')
+
+        by_id = {f['folderId']: f for f in self._viewer_folders(viewer_token)}
+        assert by_id[child] == {'folderId': child, 'folderName': 'Child', 'parentFolderId': parent}
+        assert by_id[parent]['parentFolderId'] == 'ROOT'
+
+    def test_find_and_repair_drift(self, aws_env):
+        import db_util
+        from assignment_util import find_drift, repair_drift
+        from functions.folders.app import lambda_handler
+        admin_token, viewer_token = _setup(aws_env)
+        parent, child = self._tree(admin_token)
+        lambda_handler(make_event('/folders/assignments', 'POST',
+            body={'username': 'viewer1', 'folderIds': [parent, child]}, headers=auth_header(admin_token)), None)
+        assert find_drift() == ([], [])
+
+        table = db_util.get_table()
+        table.update_item(Key={'PK': 'USER#viewer1', 'SK': f'FOLDER#{child}'},
+            UpdateExpression='SET folderName = :n REMOVE parentFolderId', ExpressionAttributeValues={':n': 'Old'})
+        # An assignment that raced its folder's delete
+        table.put_item(Item={'PK': 'USER#viewer1', 'SK': 'FOLDER#gone', 'GSI3PK': 'FOLDER#gone',
+            'GSI3SK': 'USER#viewer1', 'username': 'viewer1', 'folderId': 'gone',
+            'folderName': 'Gone', 'parentFolderId': 'ROOT'})
+
+        stale, orphaned = find_drift()
+        assert [(row['folderId'], changes) for row, changes in stale] == [
+            (child, {'folderName': 'Child', 'parentFolderId': parent})]
+        assert [row['folderId'] for row in orphaned] == ['gone']
+        assert 'gone' in [f['folderId'] for f in self._viewer_folders(viewer_token)]
+
+        assert repair_drift(stale, orphaned) == ['viewer1']
+        assert find_drift() == ([], [])
+        assert sorted((f['folderName'], f['parentFolderId']) for f in self._viewer_folders(viewer_token)) == [
+            ('Child', parent), ('Parent', 'ROOT')]
+
+
+def _create(admin_token, name, parent='ROOT'):
+    from functions.folders.app import lambda_handler
+    return parse_response(lambda_handler(make_event('/folders', 'POST',
+        body={'folderName': name, 'parentFolderId': parent}, headers=auth_header(admin_token)), None))['folderId']
+
+
+def _tree(token, folder_id=None):
+    from functions.folders.app import lambda_handler
+    return parse_response(lambda_handler(make_event('/folders/tree', 'GET', headers=auth_header(token),
+        query={'folderId': folder_id} if folder_id else None), None))
+
+
+def _names(nodes):
+    return [(n['folderName'], _names(n['children'])) for n in nodes]
+
+
+class TestFolderTree:
+    def test_paths_stored_on_create(self, aws_env):
+        import db_util
+        admin_token, _ = _setup(aws_env)
+        a = _create(admin_token, 'A')
+        b = _create(admin_token, 'B', a)
+        item = db_util.get_table().get_item(Key={'PK': f'FOLDER#{b}', 'SK': f'FOLDER#{b}'})['Item']
+        assert item['folderPath'] == item['GSI4SK'] == f'{a}/{b}/'
+        assert item['GSI4PK'] == 'FOLDERTREE'
+
+    def test_create_under_missing_parent(self, aws_env):
+        from functions.folders.app import lambda_handler
+        admin_token, _ = _setup(aws_env)
+        resp = lambda_handler(make_event('/folders', 'POST',
+            body={'folderName': 'X', 'parentFolderId': 'no-such-folder'}, headers=auth_header(admin_token)), None)
+        assert resp['statusCode'] == 404
+
+    def test_admin_tree_and_subtree(self, aws_env):
+        admin_token, _ = _setup(aws_env)
+        a = _create(admin_token, 'A')
+        b = _create(admin_token, 'B', a)
+        _create(admin_token, 'D', b)
+        _create(admin_token, 'C', b)
+        _create(admin_token, 'Z')
+        assert _names(_tree(admin_token)['tree']) == [
+            ('A', [('B', [('C', []), ('D', [])])]), ('Z', [])]
+
+        body = _tree(admin_token, b)
+        assert _names(body['tree']) == [('B', [('C', []), ('D', [])])]
+        assert body['breadcrumbs'] == [{'folderId': a, 'folderName': 'A'}, {'folderId': b, 'folderName': 'B'}]
+        assert _tree(admin_token, 'no-such-folder')['error']
+
+    def test_viewer_sees_assigned_folders_only(self, aws_env):
+        from functions.folders.app import lambda_handler
+        admin_token, viewer_token = _setup(aws_env)
+        a = _create(admin_token, 'A')
+        b = _create(admin_token, 'B', a)
+        c = _create(admin_token, 'C', b)
+        d = _create(admin_token, 'D', c)
+        # B is not assigned: C hangs directly under A
+        lambda_handler(make_event('/folders/assignments', 'POST',
+            body={'username': 'viewer1', 'folderIds': [a, c, d]}, headers=auth_header(admin_token)), None)
+
+        assert _names(_tree(viewer_token)['tree']) == [('A', [('C', [('D', [])])])]
+        body = _tree(viewer_token, c)
+        assert _names(body['tree']) == [('C', [('D', [])])]
+        assert [crumb['folderName'] for crumb in body['breadcrumbs']] == ['A', 'C']
+        resp = lambda_handler(make_event('/folders/tree', 'GET', headers=auth_header(viewer_token),
+            query={'folderId': b}), None)
+        assert resp['statusCode'] == 403
+
+    def test_legacy_folders_without_paths(self, aws_env):
+        import db_util
+        admin_token, _ = _setup(aws_env)
+        a = _create(admin_token, 'A')
+        b = _create(admin_token, 'B', a)
+        c = _create(admin_token, 'C', b)
+        table = db_util.get_table()
+        for fid in (a, b, c):
+            table.update_item(Key={'PK': f'FOLDER#{fid}', 'SK': f'FOLDER#{fid}'},
+                UpdateExpression='REMOVE folderPath, GSI4PK, GSI4SK')
+
+        body = _tree(admin_token, b)
+        assert _names(body['tree']) == [('B', [('C', [])])]
+        assert [crumb['folderName'] for crumb in body['breadcrumbs']] == ['A', 'B']
+        d = _create(admin_token, 'D', c)
+        item = table.get_item(Key={'PK': f'FOLDER#{d}', 'SK': f'FOLDER#{d}'})['Item']
+        assert item['folderPath'] == f'{a}/{b}/{c}/{d}/'
+
+
+class TestMoveFolder:
+    def _move(self, token, folder_id, parent_id):
+        from functions.folders.app import lambda_handler
+        return lambda_handler(make_event(f'/folders/{folder_id}', 'PUT', body={'parentFolderId': parent_id},
+            headers=auth_header(token), path_params={'folderId': folder_id}), None)
+
+    def test_move_rewrites_subtree_and_assignments(self, aws_env):
+        import db_util
+        from assignment_util import find_drift
+        from functions.folders.app import lambda_handler
+        admin_token, viewer_token = _setup(aws_env)
+        a = _create(admin_token, 'A')
+        b = _create(admin_token, 'B', a)
+        c = _create(admin_token, 'C', b)
+        z = _create(admin_token, 'Z')
+        lambda_handler(make_event('/folders/assignments', 'POST',
+            body={'username': 'viewer1', 'folderIds': [b, c, z]}, headers=auth_header(admin_token)), None)
+
+        assert self._move(admin_token, b, z)['statusCode'] == 200
+        assert _names(_tree(admin_token)['tree']) == [('A', []), ('Z', [('B', [('C', [])])])]
+        item = db_util.get_table().get_item(Key={'PK': f'FOLDER#{c}', 'SK': f'FOLDER#{c}'})['Item']
+        assert item['folderPath'] == item['GSI4SK'] == f'{z}/{b}/{c}/'
+        assert find_drift() == ([], [])
+        assert _names(_tree(viewer_token)['tree']) == [('Z', [('B', [('C', [])])])]
+
+        assert self._move(admin_token, b, 'ROOT')['statusCode'] == 200
+        assert _names(_tree(admin_token)['tree']) == [('A', []), ('B', [('C', [])]), ('Z', [])]
+        assert find_drift() == ([], [])
+
+    def test_move_beyond_max_depth_rejected(self, aws_env, monkeypatch):
+        import functions.folders.app as folders_app
+        admin_token, _ = _setup(aws_env)
+        monkeypatch.setattr(folders_app, 'FOLDER_MAX_DEPTH', 3)
+        a = _create(admin_token, 'A')
+        b = _create(admin_token, 'B', a)
+        x = _create(admin_token, 'X')
+        y = _create(admin_token, 'Y', x)
+        assert self._move(admin_token, x, b)['statusCode'] == 400
+        assert self._item(y)['folderPath'] == f'{x}/{y}/'
+        assert self._move(admin_token, x, a)['statusCode'] == 200
+
+    def _item(self, folder_id):
+        import db_util
+        return db_util.get_table().get_item(Key={'PK': f'FOLDER#{folder_id}', 'SK': f'FOLDER#{folder_id}'})['Item']
+
+    def test_large_move_is_batched(self, aws_env, monkeypatch):
+        import functions.folders.app as folders_app
+        from assignment_util import find_drift
+        admin_token, _ = _setup(aws_env)
+        a = _create(admin_token, 'A')
+        b = _create(admin_token, 'B', a)
+        c = _create(admin_token, 'C', b)
+        z = _create(admin_token, 'Z')
+        folders_app.lambda_handler(make_event('/folders/assignments', 'POST',
+            body={'username': 'viewer1', 'folderIds': [b, c]}, headers=auth_header(admin_token)), None)
+        monkeypatch.setattr(folders_app, 'TRANSACT_MAX_ITEMS', 2)
+
+        assert self._move(admin_token, b, z)['statusCode'] == 200
+        assert self._item(c)['folderPath'] == f'{z}/{b}/{c}/'
+        assert find_drift() == ([], [])
+
+    def test_stale_path_in_subtree_is_skipped(self, aws_env):
+        import db_util
+        admin_token, _ = _setup(aws_env)
+        a = _create(admin_token, 'A')
+        b = _create(admin_token, 'B', a)
+        x = _create(admin_token, 'X')
+        z = _create(admin_token, 'Z')
+        # X's path claims it is under A, but its parent pointer says top level
+        db_util.get_table().update_item(Key={'PK': f'FOLDER#{x}', 'SK': f'FOLDER#{x}'},
+            UpdateExpression='SET folderPath = :p, GSI4SK = :p', ExpressionAttributeValues={':p': f'{a}/{x}/'})
+
+        assert self._move(admin_token, a, z)['statusCode'] == 200
+        assert self._item(b)['folderPath'] == f'{z}/{a}/{b}/'
+        assert self._item(x)['folderPath'] == f'{a}/{x}/'
+
+    def test_folder_created_during_move_is_repathed(self, aws_env, monkeypatch):
+        import db_util
+        import functions.folders.app as folders_app
+        admin_token, _ = _setup(aws_env)
+        a = _create(admin_token, 'A')
+        b = _create(admin_token, 'B', a)
+        z = _create(admin_token, 'Z')
+        real_rewrite = folders_app._rewrite_paths
+
+        def create_then_rewrite(folders, new_paths, moved=None):
+            if moved is not None:
+                # Committed under B's old path after the move read the subtree
+                db_util.get_table().put_item(Item={'PK': 'FOLDER#late', 'SK': 'FOLDER#late',
+                    'GSI1PK': 'FOLDERS', 'GSI1SK': 'FOLDER#late', 'GSI2PK': f'PARENT#{b}', 'GSI2SK': 'FOLDER#late',
+                    'GSI4PK': 'FOLDERTREE', 'GSI4SK': f'{a}/{b}/late/', 'folderId': 'late',
+                    'folderName': 'Late', 'parentFolderId': b, 'folderPath': f'{a}/{b}/late/'})
+            return real_rewrite(folders, new_paths, moved)
+        monkeypatch.setattr(folders_app, '_rewrite_paths', create_then_rewrite)
+
+        assert self._move(admin_token, a, z)['statusCode'] == 200
+        assert self._item('late')['folderPath'] == self._item('late')['GSI4SK'] == f'{z}/{a}/{b}/late/'
+
+    def test_create_under_moved_parent_is_refused(self, aws_env, monkeypatch):
+        import functions.folders.app as folders_app
+        admin_token, _ = _setup(aws_env)
+        a = _create(admin_token, 'A')
+        real_get = folders_app._get_folder
+        # The parent as read just before a move rewrote its path
+        monkeypatch.setattr(folders_app, '_get_folder',
+            lambda fid: dict(real_get(fid), folderPath=f'old/{fid}/') if fid == a else real_get(fid))
+        resp = folders_app.lambda_handler(make_event('/folders', 'POST',
+            body={'folderName': 'B', 'parentFolderId': a}, headers=auth_header(admin_token)), None)
+        assert resp['statusCode'] == 409
+
+    def test_invalid_moves(self, aws_env):
+        admin_token, viewer_token = _setup(aws_env)
+        a = _create(admin_token, 'A')
+        b = _create(admin_token, 'B', a)
+        _create(admin_token, 'B')
+        assert self._move(admin_token, a, b)['statusCode'] == 400
+        assert self._move(admin_token, a, a)['statusCode'] == 400
+        assert self._move(admin_token, b, 'ROOT')['statusCode'] == 409
+        assert self._move(admin_token, b, 'no-such-folder')['statusCode'] == 404
+        assert self._move(admin_token, 'no-such-folder', a)['statusCode'] == 404
+        assert self._move(viewer_token, b, 'ROOT')['statusCode'] == 403
@@ -0,0 +1,101 @@
+"""Integration tests for per-invocation call accounting (metrics_util)."""
+import os, sys, json
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'layers', 'shared', 'python'))
+
+import pytest
+from conftest import make_event, parse_response, seed_admin, auth_header
+
+
+@pytest.fixture
+def metrics_on(monkeypatch):
+    # Set before the first client is created so the hooks are registered
+    import metrics_util
+    monkeypatch.setattr(metrics_util, 'METRICS_ENABLED', True)
+    monkeypatch.setattr(metrics_util, 'last_metrics', None)
+    return metrics_util
+
+
+def _emf_lines(out):
+    return [json.loads(line) for line in out.splitlines() if line.startswith('{"_aws"')]
+
+
+class TestMetrics:
+    def test_one_emf_line_per_invocation(self, aws_env, metrics_on, capsys):
+        from functions.folders.app import lambda_handler
+        admin_token = seed_admin(aws_env)
+        lambda_handler(make_event('/folders', 'POST',
+            body={'folderName': 'Docs'}, headers=auth_header(admin_token)), None)
+        capsys.readouterr()
+
+        lambda_handler(make_event('/folders', 'GET', headers=auth_header(admin_token)), None)
+        lines = _emf_lines(capsys.readouterr().out)
+        assert len(lines) == 1
+        record = lines[0]
+        assert record == metrics_on.last_metrics
+        assert record['Route'] == 'GET /folders'
+        assert record['Status'] == 200
+        assert record['DynamoDBCalls'] == sum(n for op, n in record['Operations'].items() if op.startswith('dynamodb.'))
+        assert record['Operations'].get('dynamodb.Query', 0) >= 1
+        assert record['ConsumedRCU'] > 0
+        assert record['S3Calls'] == 0
+        assert record['Latency'] >= record['DynamoDBTime']
+        metric_names = {m['Name'] for m in record['_aws']['CloudWatchMetrics'][0]['Metrics']}
+        assert {'Latency', 'DynamoDBCalls', 'ConsumedRCU', 'ConsumedWCU', 'S3Calls'} <= metric_names
+        assert all(name in record for name in metric_names)
+
+    def test_requests_consumed_capacity(self, aws_env, metrics_on):
+        import db_util
+        seen = []
+        client = db_util.get_dynamodb_client()
+        client.meta.events.register('before-call.dynamodb.GetItem',
+            lambda params, **kwargs: seen.append(json.loads(params['body']).get('ReturnConsumedCapacity')))
+        db_util.fast_get_item({'PK': 'X', 'SK': 'X'})
+        assert seen == ['TOTAL']
+
+    def test_s3_calls_counted(self, aws_env, metrics_on):
+        from functions.folders.app import lambda_handler
+        admin_token = seed_admin(aws_env)
+        folder = parse_response(lambda_handler(make_event('/folders', 'POST',
+            body={'folderName': 'Docs'}, headers=auth_header(admin_token)), None))
+        lambda_handler(make_event(f'/folders/{folder["folderId"]}', 'DELETE',
+            headers=auth_header(admin_token), path_params={'folderId': folder['folderId']}), None)
+        assert metrics_on.last_metrics['Operations'].get('s3.ListObjectsV2') == 1
+        assert metrics_on.last_metrics['S3Calls'] == 1
+
+    def test_router_emits_once_with_route_pattern(self, aws_env, metrics_on, capsys):
+        from functions.router.app import lambda_handler
+        admin_token = seed_admin(aws_env)
+        capsys.readouterr()
+        lambda_handler(dict(make_event('/users/nobody', 'DELETE', headers=auth_header(admin_token)),
+            resource='/{proxy+}'), None)
+        lines = _emf_lines(capsys.readouterr().out)
+        assert len(lines) == 1
+        assert lines[0]['Route'] == 'DELETE /users/{username}'
+        assert lines[0]['Status'] == 404
+
+    def test_router_short_circuits_report_pattern(self, aws_env, metrics_on):
+        from functions.router.app import lambda_handler
+        seed_admin(aws_env)
+
+        def route_of(path, method, **kwargs):
+            lambda_handler(dict(make_event(path, method, **kwargs), resource='/{proxy+}'), None)
+            return metrics_on.last_metrics['Status'], metrics_on.last_metrics['Route']
+
+        assert route_of('/files/f1/a.txt/versions', 'GET') == (401, 'GET /files/{folderId}/{fileName}/versions')
+        assert route_of('/users/alice', 'DELETE') == (403, 'DELETE /users/{username}')
+        assert route_of('/wp-admin/setup.php', 'GET') == (404, 'GET UNMATCHED')
+
+    def test_disabled_emits_nothing(self, aws_env, capsys):
+        import metrics_util
+        from functions.auth.app import lambda_handler
+        assert metrics_util.METRICS_ENABLED is False
+        lambda_handler(make_event('/auth/seed-admin', 'POST'), None)
+        assert _emf_lines(capsys.readouterr().out) == []
+
+        # No hooks registered on clients either
+        class Events:
+            def register(self, *args, **kwargs):
+                raise AssertionError('hook registered while disabled')
+
+        client = type('Client', (), {'meta': type('Meta', (), {'events': Events()})()})()
+        assert metrics_util.instrument_client(client, 'dynamodb') is client
@@ -0,0 +1,93 @@
+"""Integration tests for the single-Lambda router."""
+import os, sys, re
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'layers', 'shared', 'python'))
+
+from conftest import make_event, parse_response, seed_admin, auth_header
+
+TEMPLATE = os.path.join(os.path.dirname(__file__), '..', 'template.yaml')
+
+
+def _template_routes():
+    with open(TEMPLATE) as f:
+        text = f.read()
+    pairs = re.findall(r'Path: (\S+)\n\s+Method: (\w+)', text)
+    return {(method.upper(), path) for path, method in pairs if '{proxy+}' not in path}
+
+
+class TestRouteTable:
+    def test_covers_every_template_route(self):
+        from functions.router.app import ROUTES
+        routes = {(method, pattern) for method, pattern, _, _ in ROUTES}
+        assert _template_routes() <= routes
+
+    def test_literal_routes_win_over_params(self):
+        from functions.router.app import match_route, SESSION
+        assert match_route('DELETE', '/folders/assignments')[:3] == ('folders', ('admin',), {})
+        module, _, params, pattern = match_route('DELETE', '/folders/abc-123')
+        assert module == 'folders' and params == {'folderId': 'abc-123'}
+        assert pattern == '/folders/{folderId}'
+        assert match_route('GET', '/folders/tree')[:3] == ('folders', SESSION, {})
+        assert match_route('PUT', '/folders/abc-123')[3] == '/folders/{folderId}'
+
+    def test_multi_param_route(self):
+        from functions.router.app import match_route
+        _, _, params, _ = match_route('GET', '/files/f1/report.pdf/versions')
+        assert params == {'folderId': 'f1', 'fileName': 'report.pdf'}
+
+    def test_unknown_route(self):
+        from functions.router.app import match_route
+        assert match_route('GET', '/nope') is None
+        assert match_route('PATCH', '/users') is None
+
+
+class TestRouterDispatch:
+    def test_options_and_not_found(self, aws_env):
+        from functions.router.app import lambda_handler
+        assert lambda_handler(make_event('/anything', 'OPTIONS'), None)['statusCode'] == 200
+        assert lambda_handler(make_event('/nope', 'GET'), None)['statusCode'] == 404
+
+    def test_route_auth_rejects_before_handler(self, aws_env, monkeypatch):
+        from functions.router import app as router
+
+        def boom(event, context):
+            raise AssertionError('handler should not run')
+
+        monkeypatch.setattr(router, '_modules', {m: boom for m in ('auth', 'users', 'folders', 'files')})
+        assert router.lambda_handler(make_event('/users', 'GET'), None)['statusCode'] == 403
+        assert router.lambda_handler(make_event('/folders', 'GET'), None)['statusCode'] == 401
+        assert router.lambda_handler(make_event('/auth/logout', 'POST'), None)['statusCode'] == 401
+
+    def test_role_checked_per_route(self, aws_env):
+        from functions.router.app import lambda_handler
+        admin_token = seed_admin(aws_env)
+        lambda_handler(make_event('/users', 'POST',
+            body={'username': 'viewer1', 'password': 'p', 'role': 'viewer'},
+            headers=auth_header(admin_token)), None)
+        viewer_token = parse_response(lambda_handler(make_event('/auth/login', 'POST',
+            body={'username': 'viewer1', 'password': 'p'}), None))['sessionToken']
+
+        assert lambda_handler(make_event('/folders', 'GET',
+            headers=auth_header(viewer_token)), None)['statusCode'] == 200
+        assert lambda_handler(make_event('/folders', 'POST', body={'folderName': 'X'},
+            headers=auth_header(viewer_token)), None)['statusCode'] == 403
+
+    def test_path_params_filled_from_pattern(self, aws_env):
+        from functions.router.app import lambda_handler
+        admin_token = seed_admin(aws_env)
+        folder = parse_response(lambda_handler(make_event('/folders', 'POST',
+            body={'folderName': 'Docs'}, headers=auth_header(admin_token)), None))
+
+        # Behind /{proxy+} API Gateway only supplies {'proxy': ...}
+        resp = lambda_handler(make_event(f'/folders/{folder["folderId"]}', 'DELETE',
+            headers=auth_header(admin_token), path_params={'proxy': f'folders/{folder["folderId"]}'}), None)
+        assert resp['statusCode'] == 200
+        listed = parse_response(lambda_handler(make_event('/folders', 'GET',
+            headers=auth_header(admin_token)), None))
+        assert listed['folders'] == []
+
+    def test_same_result_as_split_handlers(self, aws_env):
+        from functions.router.app import lambda_handler
+        from functions.users.app import lambda_handler as users_handler
+        admin_token = seed_admin(aws_env)
+        event = make_event('/users', 'GET', headers=auth_header(admin_token))
+        assert lambda_handler(event, None) == users_handler(event, None)
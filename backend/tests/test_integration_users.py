@@ -1,5 +1,6 @@
 """Integration tests for Users Lambda."""
 import os, sys, json
+import pytest
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'layers', 'shared', 'python'))
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'functions', 'auth'))
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'functions', 'users'))
@@ -62,6 +63,103 @@ class TestListUsers:
         assert 'admin' in usernames
         assert 'alice' in usernames
 
+    def test_list_users_pages_with_cursor(self, aws_env):
+        from functions.users.app import lambda_handler
+        token = _get_admin_token(aws_env)
+        for name in ('alice', 'bob', 'carol'):
+            lambda_handler(make_event('/users', 'POST',
+                body={'username': name, 'password': 'p', 'role': 'reader'},
+                headers=auth_header(token)), None)
+
+        pages, cursor = [], None
+        while True:
+            query = {'limit': '3'}
+            if cursor:
+                query['cursor'] = cursor
+            body = parse_response(lambda_handler(make_event('/users', 'GET',
+                headers=auth_header(token), query=query), None))
+            pages.append([u['username'] for u in body['users']])
+            cursor = body['nextCursor']
+            if not cursor:
+                break
+        assert pages[0] == ['admin', 'alice', 'bob']
+        assert [name for page in pages for name in page] == ['admin', 'alice', 'bob', 'carol']
+
+    def test_list_users_filters(self, aws_env):
+        from functions.users.app import lambda_handler
+        token = _get_admin_token(aws_env)
+        for name, role in (('alice', 'reader'), ('albert', 'uploader'), ('bob', 'reader')):
+            lambda_handler(make_event('/users', 'POST',
+                body={'username': name, 'password': 'p', 'role': role},
+                headers=auth_header(token)), None)
+
+        def names(**query):
+            resp = lambda_handler(make_event('/users', 'GET', headers=auth_header(token), query=query), None)
+            assert resp['statusCode'] == 200
+            return [u['username'] for u in parse_response(resp)['users']]
+
+        assert names(role='reader') == ['alice', 'bob']
+        assert names(prefix='al') == ['albert', 'alice']
+        assert names(role='reader', prefix='al') == ['alice']
+        assert names(sortOrder='desc') == ['bob', 'alice', 'albert', 'admin']
+
+        # Role changes move the user between role pages
+        lambda_handler(make_event('/users/bob', 'PUT', body={'role': 'uploader'},
+            headers=auth_header(token), path_params={'username': 'bob'}), None)
+        assert names(role='reader') == ['alice']
+        assert names(role='uploader') == ['albert', 'bob']
+
+    @pytest.mark.parametrize('query', [
+        {'limit': 'ten'}, {'limit': '0'}, {'limit': '1000'}, {'role': 'owner'},
+        {'cursor': 'not-a-cursor'}, {'cursor': 'e30'},
+    ])
+    def test_list_users_rejects_bad_params(self, aws_env, query):
+        from functions.users.app import lambda_handler
+        token = _get_admin_token(aws_env)
+        resp = lambda_handler(make_event('/users', 'GET', headers=auth_header(token), query=query), None)
+        assert resp['statusCode'] == 400
+
+    def test_assigned_folders_follow_assignments(self, aws_env):
+        from functions.users.app import lambda_handler
+        from functions.folders.app import lambda_handler as folders_handler
+        token = _get_admin_token(aws_env)
+        f1, f2 = (parse_response(folders_handler(make_event('/folders', 'POST',
+            body={'folderName': name}, headers=auth_header(token)), None))['folderId'] for name in ('A', 'B'))
+
+        def assigned():
+            users = parse_response(lambda_handler(make_event('/users', 'GET', headers=auth_header(token)), None))['users']
+            return {u['username']: sorted(u['assignedFolders']) for u in users}
+
+        # Assigned at creation
+        lambda_handler(make_event('/users', 'POST',
+            body={'username': 'alice', 'password': 'p', 'role': 'reader', 'folderIds': [f1]},
+            headers=auth_header(token)), None)
+        assert assigned() == {'admin': [], 'alice': [f1]}
+
+        folders_handler(make_event('/folders/assignments', 'POST',
+            body={'username': 'alice', 'folderIds': [f2]}, headers=auth_header(token)), None)
+        assert assigned()['alice'] == sorted([f1, f2])
+
+        folders_handler(make_event('/folders/assignments', 'DELETE',
+            body={'username': 'alice', 'folderIds': [f1]}, headers=auth_header(token)), None)
+        assert assigned()['alice'] == [f2]
+
+        folders_handler(make_event(f'/folders/{f2}', 'DELETE',
+            headers=auth_header(token), path_params={'folderId': f2}), None)
+        assert assigned()['alice'] == []
+
+    def test_legacy_user_without_snapshot(self, aws_env):
+        from functions.users.app import lambda_handler
+        token = _get_admin_token(aws_env)
+        table = aws_env.Table('test-table')
+        table.put_item(Item={'PK': 'USER#old', 'SK': 'USER#old', 'GSI1PK': 'USERS', 'GSI1SK': 'USER#old',
+            'username': 'old', 'role': 'viewer', 'passwordHash': 'x'})
+        table.put_item(Item={'PK': 'USER#old', 'SK': 'FOLDER#f1', 'GSI3PK': 'FOLDER#f1', 'GSI3SK': 'USER#old',
+            'username': 'old', 'folderId': 'f1'})
+
+        users = parse_response(lambda_handler(make_event('/users', 'GET', headers=auth_header(token)), None))['users']
+        assert {u['username']: u['assignedFolders'] for u in users}['old'] == ['f1']
+
     def test_list_users_forbidden_for_non_admin(self, aws_env):
         from functions.users.app import lambda_handler as users_handler
         from functions.auth.app import lambda_handler as auth_handler
@@ -130,3 +228,338 @@ class TestDeleteUser:
             headers=auth_header(token),
             path_params={'username': 'admin'}), None)
         assert resp['statusCode'] == 400
+
+    def test_delete_user_revokes_all_sessions_without_scan(self, aws_env, monkeypatch):
+        import db_util
+        from functions.users.app import lambda_handler
+        from session_util import create_session, validate_session
+        token = _get_admin_token(aws_env)
+        lambda_handler(make_event('/users', 'POST',
+            body={'username': 'alice', 'password': 'p', 'role': 'viewer'},
+            headers=auth_header(token)), None)
+        alice_tokens = [create_session('alice', 'viewer') for _ in range(3)]
+
+        table = db_util.get_table()
+        real_query = table.query
+
+        def fail(**kwargs):
+            raise AssertionError('session revocation should not scan the table')
+
+        def one_per_page(**kwargs):
+            # Force pagination so every page of sessions must be followed
+            return real_query(Limit=1, **kwargs)
+        monkeypatch.setattr(table, 'scan', fail)
+        monkeypatch.setattr(table, 'query', one_per_page)
+
+        resp = lambda_handler(make_event('/users/alice', 'DELETE',
+            headers=auth_header(token),
+            path_params={'username': 'alice'}), None)
+        assert resp['statusCode'] == 200
+        for t in alice_tokens:
+            assert validate_session(make_event('/folders', headers=auth_header(t))) is None
+        # Admin's own session is untouched
+        assert validate_session(make_event('/folders', headers=auth_header(token)))['username'] == 'admin'
+
+
+class TestImportUsers:
+    @pytest.fixture(autouse=True)
+    def cheap_hashes(self, monkeypatch):
+        import password_util
+        monkeypatch.setattr(password_util, 'PASSWORD_HASH_ITERATIONS', 1000)
+
+    def _import(self, token, body, content_type='application/json', context=None):
+        from functions.users.app import lambda_handler
+        event = make_event('/users/import', 'POST', headers={**auth_header(token), 'Content-Type': content_type})
+        event['body'] = body if isinstance(body, str) else json.dumps(body)
+        return lambda_handler(event, context)
+
+    def _folder(self, token, name):
+        from functions.folders.app import lambda_handler
+        return parse_response(lambda_handler(make_event('/folders', 'POST',
+            body={'folderName': name}, headers=auth_header(token)), None))['folderId']
+
+    def _login(self, username, password):
+        from functions.auth.app import lambda_handler
+        return lambda_handler(make_event('/auth/login', 'POST',
+            body={'username': username, 'password': password}), None)['statusCode']
+
+    def test_hash_failure_reported_per_row(self, aws_env, monkeypatch):
+        import functions.users.app as users_app
+        token = _get_admin_token(aws_env)
+        real_hash = users_app.hash_password
+
+        def failing_hash(password):
+            if password == 'bad':
+                raise ValueError('boom')
+            return real_hash(password)
+        monkeypatch.setattr(users_app, 'hash_password', failing_hash)
+        resp = self._import(token, {'users': [
+            {'username': 'alice', 'password': 'pa', 'role': 'reader'},
+            {'username': 'bob', 'password': 'bad', 'role': 'viewer'},
+            {'username': 'carol', 'password': 'pc', 'role': 'viewer'},
+        ]})
+        assert resp['statusCode'] == 200
+        assert [r['status'] for r in parse_response(resp)['results']] == [201, 500, 201]
+        assert self._login('carol', 'pc') == 200
+
+    def test_json_import(self, aws_env):
+        from functions.users.app import lambda_handler
+        token = _get_admin_token(aws_env)
+        fid = self._folder(token, 'Docs')
+        resp = self._import(token, {'users': [
+            {'username': 'alice', 'password': 'pa', 'role': 'reader', 'folderIds': [fid]},
+            {'username': 'bob', 'password': 'pb', 'role': 'viewer'},
+        ]})
+        assert resp['statusCode'] == 200
+        report = parse_response(resp)
+        assert report['created'] == 2 and report['failed'] == 0
+        assert [r['status'] for r in report['results']] == [201, 201]
+
+        users = parse_response(lambda_handler(make_event('/users', 'GET',
+            headers=auth_header(token), query={'role': 'reader'}), None))['users']
+        assert [(u['username'], u['assignedFolders']) for u in users] == [('alice', [fid])]
+        assert self._login('alice', 'pa') == 200
+        assert self._login('bob', 'pb') == 200
+
+    def test_csv_import(self, aws_env):
+        token = _get_admin_token(aws_env)
+        f1, f2 = self._folder(token, 'A'), self._folder(token, 'B')
+        csv_body = f'username,password,role,folderIds\ncarol,pc,uploader,{f1};{f2}\ndave,pd,viewer,\n'
+        report = parse_response(self._import(token, csv_body, 'text/csv; charset=utf-8'))
+        assert report['created'] == 2
+        from session_util import load_folder_acl
+        assert sorted(load_folder_acl('carol')) == sorted([f1, f2])
+        assert load_folder_acl('dave') == []
+
+    def test_csv_import_with_bom(self, aws_env):
+        import base64
+        token = _get_admin_token(aws_env)
+        csv_body = '\ufeffusername,password,role,folderIds\r\ncarol,pc,uploader,\r\n'
+        assert parse_response(self._import(token, csv_body, 'text/csv'))['created'] == 1
+        # The same file as API Gateway delivers a binary body
+        from functions.users.app import lambda_handler
+        event = make_event('/users/import', 'POST', headers={**auth_header(token), 'Content-Type': 'text/csv'})
+        event.update(body=base64.b64encode(csv_body.replace('carol', 'erin').encode('utf-8')).decode(),
+                     isBase64Encoded=True)
+        assert parse_response(lambda_handler(event, None))['created'] == 1
+        assert self._login('erin', 'pc') == 200
+
+    def test_per_row_errors(self, aws_env):
+        token = _get_admin_token(aws_env)
+        self._import(token, [{'username': 'taken', 'password': 'p', 'role': 'viewer'}])
+        report = parse_response(self._import(token, [
+            {'username': 'ok1', 'password': 'p', 'role': 'viewer'},
+            {'username': 'taken', 'password': 'new', 'role': 'reader'},
+            {'username': 'ok1', 'password': 'p', 'role': 'viewer'},
+            {'username': 'boss', 'password': 'p', 'role': 'admin'},
+            {'username': 'lost', 'password': 'p', 'role': 'viewer', 'folderIds': ['nope']},
+            {'username': 'ok2', 'password': 'p', 'role': 'reader'},
+        ]))
+        assert [(r['row'], r['status']) for r in report['results']] == [
+            (1, 201), (2, 409), (3, 400), (4, 400), (5, 400), (6, 201)]
+        assert report['created'] == 2 and report['failed'] == 4
+        # The existing user was not overwritten
+        assert self._login('taken', 'p') == 200
+
+    def test_batches_across_transactions(self, aws_env, monkeypatch):
+        import functions.users.app as users_app
+        import db_util
+        token = _get_admin_token(aws_env)
+        fid = self._folder(token, 'Docs')
+        self._import(token, [{'username': 'u03', 'password': 'p', 'role': 'viewer'}])
+        monkeypatch.setattr(users_app, 'TRANSACT_MAX_ITEMS', 4)
+        client = db_util.get_table().meta.client
+        calls = []
+        real = client.transact_write_items
+        monkeypatch.setattr(client, 'transact_write_items',
+            lambda **kwargs: calls.append(len(kwargs['TransactItems'])) or real(**kwargs))
+
+        rows = [{'username': f'u{i:02d}', 'password': 'p', 'role': 'viewer',
+                 'folderIds': [fid] if i % 2 else []} for i in range(8)]
+        report = parse_response(self._import(token, rows))
+        assert [r['status'] for r in report['results']] == [201, 201, 201, 409, 201, 201, 201, 201]
+        # Rows packed up to 4 actions per transaction (user + assignments);
+        # the one holding u03 is retried without it
+        assert calls == [4, 3, 1, 3, 2]
+
+    def test_stops_near_timeout(self, aws_env):
+        token = _get_admin_token(aws_env)
+
+        class Context:
+            def get_remaining_time_in_millis(self):
+                return 500
+        report = parse_response(self._import(token,
+            [{'username': 'late', 'password': 'p', 'role': 'viewer'}], context=Context()))
+        assert report['results'] == [{'row': 1, 'username': 'late', 'status': 503,
+                                      'error': 'Not processed before the time limit; resubmit'}]
+        assert self._login('late', 'p') == 401
+
+    def test_rejects_bad_bodies(self, aws_env, monkeypatch):
+        import functions.users.app as users_app
+        token = _get_admin_token(aws_env)
+        assert self._import(token, 'not json')['statusCode'] == 400
+        assert self._import(token, [])['statusCode'] == 400
+        assert self._import(token, {'users': 'alice'})['statusCode'] == 400
+        monkeypatch.setattr(users_app, 'IMPORT_MAX_ROWS', 1)
+        rows = [{'username': n, 'password': 'p', 'role': 'viewer'} for n in ('a', 'b')]
+        assert self._import(token, rows)['statusCode'] == 413
+
+
+class TestBulkDeleteUsers:
+    @pytest.fixture(autouse=True)
+    def one_worker(self, monkeypatch):
+        # moto's TransactWriteItems snapshots the table unlocked, so
+        # concurrent transactions race inside moto itself
+        import functions.users.app as users_app
+        monkeypatch.setattr(users_app, 'BULK_DELETE_WORKERS', 1)
+
+    def _create(self, token, username, folder_ids=()):
+        from functions.users.app import lambda_handler
+        lambda_handler(make_event('/users', 'POST',
+            body={'username': username, 'password': 'p', 'role': 'reader', 'folderIds': list(folder_ids)},
+            headers=auth_header(token)), None)
+
+    def _folders(self, token, n):
+        from functions.folders.app import lambda_handler
+        return [parse_response(lambda_handler(make_event('/folders', 'POST',
+            body={'folderName': f'F{i}'}, headers=auth_header(token)), None))['folderId'] for i in range(n)]
+
+    def _delete(self, token, usernames):
+        from functions.users.app import lambda_handler
+        return lambda_handler(make_event('/users', 'DELETE',
+            body={'usernames': usernames}, headers=auth_header(token)), None)
+
+    def _partition(self, username):
+        import db_util
+        return list(db_util.fast_query_items('PK = :pk', {':pk': f'USER#{username}'}))
+
+    def test_cascades_users_assignments_and_sessions(self, aws_env):
+        from session_util import create_session, validate_session
+        token = _get_admin_token(aws_env)
+        fids = self._folders(token, 2)
+        self._create(token, 'alice', fids)
+        self._create(token, 'bob')
+        alice_session = create_session('alice', 'reader')
+        bob_session = create_session('bob', 'reader')
+
+        resp = self._delete(token, ['alice', 'bob', 'ghost', 'admin', 'alice'])
+        assert resp['statusCode'] == 200
+        report = parse_response(resp)
+        assert report['deleted'] == 2 and report['failed'] == 2
+        by_name = {r['username']: r for r in report['results']}
+        assert [r['username'] for r in report['results']] == ['alice', 'bob', 'ghost', 'admin']
+        assert by_name['alice']['mode'] == 'transaction'
+        assert (by_name['alice']['assignments'], by_name['alice']['sessions']) == (2, 1)
+        assert (by_name['bob']['assignments'], by_name['bob']['sessions']) == (0, 1)
+        assert by_name['alice']['ms'] >= 0
+        assert by_name['ghost']['status'] == 404
+        assert by_name['admin']['status'] == 400
+
+        assert self._partition('alice') == [] and self._partition('bob') == []
+        for t in (alice_session, bob_session):
+            assert validate_session(make_event('/folders', headers=auth_header(t))) is None
+        # Admin's folder listing no longer shows alice
+        from functions.folders.app import lambda_handler as folders_handler
+        folders = parse_response(folders_handler(make_event('/folders', 'GET', headers=auth_header(token)), None))['folders']
+        assert [f['assignedUsers'] for f in folders] == [[], []]
+
+    def test_assignment_racing_delete_is_removed(self, aws_env, monkeypatch):
+        import db_util
+        import functions.users.app as users_app
+        from assignment_util import assignment_item
+        token = _get_admin_token(aws_env)
+        [fid] = self._folders(token, 1)
+        self._create(token, 'alice')
+        real_keys = users_app.session_keys_for_user
+
+        def keys_then_assign(username):
+            # An assignment committed after the partition was read
+            db_util.get_table().put_item(Item=assignment_item(username, fid, {'folderName': 'F0'}))
+            return real_keys(username)
+        monkeypatch.setattr(users_app, 'session_keys_for_user', keys_then_assign)
+
+        [result] = parse_response(self._delete(token, ['alice']))['results']
+        assert (result['status'], result['assignments']) == (200, 1)
+        assert self._partition('alice') == []
+
+    def test_assign_after_delete_writes_nothing(self, aws_env, monkeypatch):
+        import db_util
+        import functions.folders.app as folders_app
+        token = _get_admin_token(aws_env)
+        [fid] = self._folders(token, 1)
+        self._create(token, 'alice')
+        real_get = folders_app.batch_get_items
+
+        def get_then_delete(keys, **kwargs):
+            # The user is deleted after assign_folders checked it exists
+            items = real_get(keys, **kwargs)
+            self._delete(token, ['alice'])
+            return items
+        monkeypatch.setattr(folders_app, 'batch_get_items', get_then_delete)
+
+        resp = folders_app.lambda_handler(make_event('/folders/assignments', 'POST',
+            body={'username': 'alice', 'folderIds': [fid]}, headers=auth_header(token)), None)
+        assert resp['statusCode'] == 404
+        assert self._partition('alice') == []
+
+    def test_unexpected_errors_are_not_reported_as_retryable(self, aws_env, monkeypatch):
+        import functions.users.app as users_app
+        token = _get_admin_token(aws_env)
+        self._create(token, 'alice')
+
+        def broken(username):
+            raise KeyError('bug')
+        monkeypatch.setattr(users_app, '_cascade_delete_user', broken)
+        with pytest.raises(KeyError):
+            self._delete(token, ['alice'])
+
+    def test_large_users_are_batched_user_item_last(self, aws_env, monkeypatch):
+        import functions.users.app as users_app
+        token = _get_admin_token(aws_env)
+        self._create(token, 'carol', self._folders(token, 4))
+        monkeypatch.setattr(users_app, 'TRANSACT_MAX_ITEMS', 3)
+
+        import db_util
+        client = db_util.get_table().meta.client
+        order = []
+        real_batch_write, real_delete = client.batch_write_item, client.delete_item
+        monkeypatch.setattr(client, 'batch_write_item', lambda **kw: order.append('batch') or real_batch_write(**kw))
+        monkeypatch.setattr(client, 'delete_item', lambda **kw: order.append(kw['Key']['SK']) or real_delete(**kw))
+
+        [result] = parse_response(self._delete(token, ['carol']))['results']
+        assert (result['status'], result['mode'], result['assignments']) == (200, 'batched', 4)
+        assert order == ['batch', 'USER#carol']
+        assert self._partition('carol') == []
+
+    def test_retries_conflicting_transaction(self, aws_env, monkeypatch):
+        from botocore.exceptions import ClientError
+        import db_util
+        import functions.users.app as users_app
+        token = _get_admin_token(aws_env)
+        self._create(token, 'dave', self._folders(token, 1))
+        client = db_util.get_table().meta.client
+        real = client.transact_write_items
+        calls = []
+
+        def conflict_once(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                raise ClientError({'Error': {'Code': 'TransactionCanceledException'},
+                                   'CancellationReasons': [{'Code': 'None'}, {'Code': 'TransactionConflict'}]},
+                                  'TransactWriteItems')
+            return real(**kwargs)
+        monkeypatch.setattr(client, 'transact_write_items', conflict_once)
+        monkeypatch.setattr(users_app.time, 'sleep', lambda s: None)
+
+        [result] = parse_response(self._delete(token, ['dave']))['results']
+        assert result['status'] == 200 and len(calls) == 2
+        assert self._partition('dave') == []
+
+    def test_rejects_bad_bodies(self, aws_env, monkeypatch):
+        import functions.users.app as users_app
+        token = _get_admin_token(aws_env)
+        assert self._delete(token, [])['statusCode'] == 400
+        assert self._delete(token, 'alice')['statusCode'] == 400
+        assert self._delete(token, [1])['statusCode'] == 400
+        monkeypatch.setattr(users_app, 'BULK_DELETE_MAX_USERS', 1)
+        assert self._delete(token, ['a', 'b'])['statusCode'] == 413
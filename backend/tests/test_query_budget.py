@@ -0,0 +1,207 @@
+"""Query budgets: DynamoDB/S3 calls per handler call, so N+1 regressions fail."""
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'layers', 'shared', 'python'))
+
+import pytest
+from conftest import make_event, parse_response, seed_admin, auth_header
+
+
+def _seed_folders(aws_env, n, assign_to=()):
+    """Write n root folders straight to the table, optionally assigned to users."""
+    table = aws_env.Table('test-table')
+    ids = []
+    with table.batch_writer() as batch:
+        for i in range(n):
+            fid = f'folder-{i:04d}'
+            ids.append(fid)
+            batch.put_item(Item={
+                'PK': f'FOLDER#{fid}', 'SK': f'FOLDER#{fid}',
+                'GSI1PK': 'FOLDERS', 'GSI1SK': f'FOLDER#{fid}',
+                'GSI2PK': 'PARENT#ROOT', 'GSI2SK': f'FOLDER#{fid}',
+                'GSI4PK': 'FOLDERTREE', 'GSI4SK': f'{fid}/',
+                'folderId': fid, 'folderName': f'Folder {i}', 'parentFolderId': 'ROOT', 'folderPath': f'{fid}/',
+                'createdAt': int(time.time()),
+            })
+            for username in assign_to:
+                batch.put_item(Item={
+                    'PK': f'USER#{username}', 'SK': f'FOLDER#{fid}',
+                    'GSI3PK': f'FOLDER#{fid}', 'GSI3SK': f'USER#{username}',
+                    'username': username, 'folderId': fid, 'folderName': f'Folder {i}',
+                    'parentFolderId': 'ROOT', 'folderPath': f'{fid}/', 'assignedAt': int(time.time()),
+                })
+    return ids
+
+
+def _seed_users(aws_env, n):
+    table = aws_env.Table('test-table')
+    with table.batch_writer() as batch:
+        for i in range(n):
+            username = f'user{i:04d}'
+            batch.put_item(Item={
+                'PK': f'USER#{username}', 'SK': f'USER#{username}',
+                'GSI1PK': 'USERS', 'GSI1SK': f'USER#{username}',
+                'username': username, 'passwordHash': 'x', 'role': 'viewer',
+                'mustChangePassword': False, 'createdAt': int(time.time()), 'folderIds': [],
+            })
+
+
+def _login(username, password='p'):
+    from functions.auth.app import lambda_handler as auth_handler
+    return parse_response(auth_handler(make_event('/auth/login', 'POST',
+        body={'username': username, 'password': password}), None))['sessionToken']
+
+
+def _viewer(admin_token):
+    from functions.users.app import lambda_handler as users_handler
+    users_handler(make_event('/users', 'POST',
+        body={'username': 'viewer1', 'password': 'p', 'role': 'viewer'},
+        headers=auth_header(admin_token)), None)
+
+
+class TestQueryBudgetFixture:
+    def test_counts_and_enforces(self, aws_env, query_budget):
+        import db_util
+        with query_budget() as calls:
+            db_util.fast_get_item({'PK': 'A', 'SK': 'A'})
+            list(db_util.query_items(KeyConditionExpression=db_util.Key('PK').eq('A')))
+            db_util.get_s3_client().list_objects_v2(Bucket='test-bucket')
+        assert calls.ops == {'dynamodb.GetItem': 1, 'dynamodb.Query': 1, 's3.ListObjectsV2': 1}
+        assert (calls.dynamodb, calls.s3, calls.total) == (2, 1, 3)
+
+        with pytest.raises(AssertionError, match='dynamodb calls 1 > budget 0'):
+            with query_budget(dynamodb=0):
+                db_util.fast_get_item({'PK': 'B', 'SK': 'B'})
+
+
+class TestFolderBudgets:
+    def test_non_admin_list_folders(self, aws_env, query_budget):
+        from functions.folders.app import lambda_handler
+        admin_token = seed_admin(aws_env)
+        _viewer(admin_token)
+        _seed_folders(aws_env, 200, assign_to=['viewer1'])
+        viewer_token = _login('viewer1')
+
+        # revision stamp + assignments query (folder fields are on the rows)
+        with query_budget(dynamodb=2, s3=0):
+            resp = lambda_handler(make_event('/folders', 'GET', headers=auth_header(viewer_token)), None)
+        assert len(parse_response(resp)['folders']) == 200
+
+    def test_admin_list_folders(self, aws_env, query_budget):
+        from functions.folders.app import lambda_handler
+        admin_token = seed_admin(aws_env)
+        _seed_folders(aws_env, 200, assign_to=['viewer2', 'viewer1'])
+
+        # Revision stamp, folders query, assignment scan
+        with query_budget(dynamodb=3, s3=0):
+            resp = lambda_handler(make_event('/folders', 'GET', headers=auth_header(admin_token)), None)
+        folders = parse_response(resp)['folders']
+        assert len(folders) == 200
+        assert all(f['assignedUsers'] == ['viewer1', 'viewer2'] for f in folders)
+
+    def test_folder_tree(self, aws_env, query_budget):
+        from functions.folders.app import lambda_handler
+        admin_token = seed_admin(aws_env)
+        _viewer(admin_token)
+        _seed_folders(aws_env, 200, assign_to=['viewer1'])
+        viewer_token = _login('viewer1')
+
+        # Revision stamp + folders query / assignments query
+        for token in (admin_token, viewer_token):
+            with query_budget(dynamodb=2, s3=0):
+                resp = lambda_handler(make_event('/folders/tree', 'GET', headers=auth_header(token)), None)
+            assert len(parse_response(resp)['tree']) == 200
+
+        # Revision stamp, folder, ancestors batch get, subtree range query
+        with query_budget(dynamodb=4, s3=0):
+            resp = lambda_handler(make_event('/folders/tree', 'GET', headers=auth_header(admin_token),
+                query={'folderId': 'folder-0001'}), None)
+        assert parse_response(resp)['breadcrumbs'] == [{'folderId': 'folder-0001', 'folderName': 'Folder 1'}]
+
+    def test_unchanged_listing_costs_one_read(self, aws_env, query_budget):
+        from functions.folders.app import lambda_handler
+        admin_token = seed_admin(aws_env)
+        _viewer(admin_token)
+        _seed_folders(aws_env, 50, assign_to=['viewer1'])
+        viewer_token = _login('viewer1')
+        etag = lambda_handler(make_event('/folders', 'GET', headers=auth_header(viewer_token)), None)['headers']['ETag']
+
+        with query_budget(dynamodb=1, s3=0):
+            resp = lambda_handler(make_event('/folders', 'GET',
+                headers={**auth_header(viewer_token), 'If-None-Match': etag}), None)
+        assert resp['statusCode'] == 304
+
+
+class TestFileBudgets:
+    def test_list_folder_files(self, aws_env, query_budget):
+        from functions.files.app import lambda_handler
+        admin_token = seed_admin(aws_env)
+        _viewer(admin_token)
+        folder_id = _seed_folders(aws_env, 1, assign_to=['viewer1'])[0]
+        viewer_token = _login('viewer1')
+        for i in range(100):
+            lambda_handler(make_event('/files/upload-url', 'POST',
+                body={'folderId': folder_id, 'fileName': f'f{i}.txt', 'fileSize': 10},
+                headers=auth_header(admin_token)), None)
+
+        # Access comes from the session snapshot: revision stamp + one query
+        with query_budget(dynamodb=2, s3=0):
+            resp = lambda_handler(make_event('/files', 'GET', query={'folderId': folder_id},
+                headers=auth_header(viewer_token)), None)
+        assert len(parse_response(resp)['files']) == 100
+
+    def test_upload_url(self, aws_env, query_budget):
+        from functions.files.app import lambda_handler
+        admin_token = seed_admin(aws_env)
+        folder_id = _seed_folders(aws_env, 1)[0]
+
+        # batch read of pointer + folder, version + pointer writes, revision bump
+        with query_budget(dynamodb=4, s3=0):
+            resp = lambda_handler(make_event('/files/upload-url', 'POST',
+                body={'folderId': folder_id, 'fileName': 'a.txt', 'fileSize': 10},
+                headers=auth_header(admin_token)), None)
+        assert resp['statusCode'] == 200
+
+
+class TestUserBudgets:
+    def test_list_users(self, aws_env, query_budget):
+        from functions.users.app import lambda_handler
+        admin_token = seed_admin(aws_env)
+        _seed_users(aws_env, 50)
+
+        with query_budget(dynamodb=3):
+            resp = lambda_handler(make_event('/users', 'GET', headers=auth_header(admin_token),
+                query={'limit': '100'}), None)
+        assert len(parse_response(resp)['users']) == 51
+
+    def test_import_users(self, aws_env, query_budget, monkeypatch):
+        import password_util
+        from functions.users.app import lambda_handler
+        monkeypatch.setattr(password_util, 'PASSWORD_HASH_ITERATIONS', 1000)
+        admin_token = seed_admin(aws_env)
+        fids = _seed_folders(aws_env, 2)
+        rows = [{'username': f'new{i:04d}', 'password': 'p', 'role': 'viewer', 'folderIds': fids[:i % 3]}
+                for i in range(120)]
+
+        # Session, one folder-name batch read, 3 transactions, revision bump
+        with query_budget(dynamodb=6):
+            resp = lambda_handler(make_event('/users/import', 'POST',
+                body={'users': rows}, headers=auth_header(admin_token)), None)
+        assert parse_response(resp)['created'] == 120
+
+    def test_bulk_delete_users(self, aws_env, query_budget, monkeypatch):
+        import functions.users.app as users_app
+        from functions.users.app import lambda_handler
+        # Concurrent transactions race inside moto (see TestBulkDeleteUsers)
+        monkeypatch.setattr(users_app, 'BULK_DELETE_WORKERS', 1)
+        from session_util import create_session
+        admin_token = seed_admin(aws_env)
+        _seed_users(aws_env, 20)
+        for i in range(20):
+            create_session(f'user{i:04d}', 'viewer')
+
+        # Session, then per user: partition query, sessions query, one
+        # transaction, partition re-read; one revision bump at most
+        with query_budget(dynamodb=1 + 4 * 20 + 1):
+            resp = lambda_handler(make_event('/users', 'DELETE',
+                body={'usernames': [f'user{i:04d}' for i in range(20)]}, headers=auth_header(admin_token)), None)
+        assert parse_response(resp)['deleted'] == 20
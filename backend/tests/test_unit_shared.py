@@ -2,11 +2,17 @@
 import os, sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'layers', 'shared', 'python'))
 
-from password_util import hash_password, verify_password
-from response_util import success, error
-from db_util import decimal_default, to_json
+from password_util import hash_password, verify_password, needs_rehash
+import response_util
+from response_util import (success, error, negotiate_encoding, choose_encoding, CORS_HEADERS,
+    make_etag, etag_matches, conditional)
+from db_util import decimal_default, to_json, _paginate, decode_item, client_config, encode_cursor, decode_cursor
+from cache_util import TTLCache, MISS
 from decimal import Decimal
+import base64
+import gzip
 import json
+import zlib
 
 
 # ---- password_util ----
@@ -22,6 +28,17 @@ class TestPasswordUtil:
         h = hash_password('correct')
         assert not verify_password('wrong', h)
 
+    def test_unknown_algorithm_fails_at_import(self, monkeypatch):
+        import importlib
+        import pytest
+        import password_util
+        monkeypatch.setenv('PASSWORD_HASH_ALGORITHM', 'md5')
+        with pytest.raises(ValueError, match='PASSWORD_HASH_ALGORITHM'):
+            importlib.reload(password_util)
+        monkeypatch.delenv('PASSWORD_HASH_ALGORITHM')
+        importlib.reload(password_util)
+        assert password_util.PASSWORD_HASH_ALGORITHM == 'pbkdf2_sha256'
+
     def test_empty_hash(self):
         assert not verify_password('anything', '')
 
@@ -35,6 +52,36 @@ class TestPasswordUtil:
         assert verify_password('same', h1)
         assert verify_password('same', h2)
 
+    def test_hash_records_algorithm_and_cost(self):
+        h = hash_password('pw', 'pbkdf2_sha256', 1000)
+        algorithm, iterations, _, _ = h.split(':')
+        assert algorithm == 'pbkdf2_sha256'
+        assert iterations == '1000'
+        assert verify_password('pw', h)
+        assert not verify_password('other', h)
+
+    def test_sha512_variant(self):
+        h = hash_password('pw', 'pbkdf2_sha512', 1000)
+        assert verify_password('pw', h)
+
+    def test_legacy_salt_hash_format_still_verifies(self):
+        import hashlib
+        legacy = 'abcd:' + hashlib.pbkdf2_hmac('sha256', b'pw', b'abcd', 100000).hex()
+        assert verify_password('pw', legacy)
+        assert not verify_password('other', legacy)
+
+    def test_unknown_algorithm_rejected(self):
+        assert not verify_password('pw', 'md5:1:salt:hash')
+
+    def test_needs_rehash(self, monkeypatch):
+        import password_util
+        monkeypatch.setattr(password_util, 'PASSWORD_HASH_ITERATIONS', 1000)
+        assert not needs_rehash(hash_password('pw'))
+        assert needs_rehash(hash_password('pw', iterations=2000))
+        assert needs_rehash(hash_password('pw', 'pbkdf2_sha512'))
+        assert needs_rehash('abcd:ef01')
+        assert not needs_rehash('garbage')
+
 
 # ---- response_util ----
 
@@ -61,6 +108,118 @@ class TestResponseUtil:
         assert resp['statusCode'] == 404
 
 
+class TestConditional:
+    def _event(self, if_none_match):
+        return {'headers': {'If-None-Match': if_none_match}}
+
+    def test_etag_matches(self):
+        etag = make_etag('files', 'f1', 3)
+        assert etag == make_etag('files', 'f1', 3)
+        assert etag != make_etag('files', 'f1', 4)
+        assert etag_matches(self._event(etag), etag)
+        assert etag_matches(self._event(f'"other", W/{etag}'), etag)
+        assert etag_matches(self._event(etag[:-1] + '-gzip"'), etag)
+        assert etag_matches(self._event('*'), etag)
+        assert not etag_matches(self._event('"other"'), etag)
+        assert not etag_matches({'headers': {}}, etag)
+
+    def test_conditional_with_stamp_skips_build(self):
+        etag = make_etag('x', 1)
+
+        def build():
+            raise AssertionError('should not build')
+
+        resp = conditional(self._event(etag), build, etag)
+        assert resp['statusCode'] == 304
+        assert resp['body'] == ''
+
+    def test_conditional_payload_etag(self):
+        resp = conditional({'headers': {}}, lambda: success({'a': 1}))
+        assert resp['statusCode'] == 200
+        etag = resp['headers']['ETag']
+        assert conditional(self._event(etag), lambda: success({'a': 1}))['statusCode'] == 304
+        assert conditional(self._event(etag), lambda: success({'a': 2}))['statusCode'] == 200
+
+    def test_errors_pass_through(self):
+        resp = conditional({'headers': {}}, lambda: error('nope', 404))
+        assert resp['statusCode'] == 404
+        assert 'ETag' not in resp['headers']
+
+
+class TestCompression:
+    BIG = {'files': [{'fileName': f'f{i}.txt', 'fileSize': i} for i in range(200)]}
+
+    def _handler(self, body, status=200):
+        return negotiate_encoding(lambda event, context: success(body, status))
+
+    def test_choose_encoding(self, monkeypatch):
+        monkeypatch.setattr(response_util, '_brotli', lambda: None)
+        assert choose_encoding('gzip, deflate, br') == 'gzip'
+        assert choose_encoding('deflate') == 'deflate'
+        assert choose_encoding('gzip;q=0.5, deflate') == 'deflate'
+        assert choose_encoding('gzip;q=0, *;q=0') is None
+        assert choose_encoding('*') == 'gzip'
+        assert choose_encoding('br') is None
+        assert choose_encoding('') is None
+
+    def test_prefers_brotli_when_installed(self, monkeypatch):
+        monkeypatch.setattr(response_util, '_brotli', lambda: object())
+        assert choose_encoding('gzip, deflate, br') == 'br'
+
+    def test_gzip_response(self):
+        resp = self._handler(self.BIG)({'headers': {'Accept': 'application/json', 'Accept-Encoding': 'gzip'}}, None)
+        assert resp['isBase64Encoded'] is True
+        assert resp['headers']['Content-Type'] == 'application/json'
+        assert resp['headers']['Content-Encoding'] == 'gzip'
+        assert resp['headers']['Vary'] == 'Accept-Encoding'
+        assert resp['headers']['Access-Control-Allow-Origin'] == '*'
+        assert json.loads(gzip.decompress(base64.b64decode(resp['body']))) == self.BIG
+
+    def test_deflate_response(self):
+        resp = self._handler(self.BIG)({'headers': {'accept': 'application/json', 'accept-encoding': 'deflate'}}, None)
+        assert json.loads(zlib.decompress(base64.b64decode(resp['body']))) == self.BIG
+
+    def test_identity_when_not_accepted(self):
+        resp = self._handler(self.BIG)({'headers': {}}, None)
+        assert 'isBase64Encoded' not in resp
+        assert json.loads(resp['body']) == self.BIG
+
+    def test_identity_unless_json_accepted(self):
+        # API Gateway would pass the base64 text through undecoded
+        for accept in (None, '*/*', 'text/html, */*'):
+            headers = {'Accept-Encoding': 'gzip', **({'Accept': accept} if accept else {})}
+            resp = self._handler(self.BIG)({'headers': headers}, None)
+            assert 'isBase64Encoded' not in resp
+            assert json.loads(resp['body']) == self.BIG
+
+    def test_small_and_error_bodies_untouched(self):
+        event = {'headers': {'Accept': 'application/json', 'Accept-Encoding': 'gzip'}}
+        assert 'isBase64Encoded' not in self._handler({'ok': True})(event, None)
+        assert 'isBase64Encoded' not in self._handler(self.BIG, 500)(event, None)
+        assert 'Content-Encoding' not in CORS_HEADERS
+
+    def test_base64_request_body_decoded(self):
+        seen = {}
+
+        def handler(event, context):
+            seen['body'] = event['body']
+            return success({})
+
+        body = base64.b64encode(b'{"username": "a"}').decode()
+        negotiate_encoding(handler)({'body': body, 'isBase64Encoded': True}, None)
+        assert seen['body'] == '{"username": "a"}'
+
+    def test_text_request_body_untouched(self):
+        seen = {}
+
+        def handler(event, context):
+            seen['body'] = event['body']
+            return success({})
+
+        negotiate_encoding(handler)({'body': '{"username": "a"}', 'isBase64Encoded': False}, None)
+        assert seen['body'] == '{"username": "a"}'
+
+
 # ---- db_util ----
 
 class TestDbUtil:
@@ -75,8 +234,157 @@ class TestDbUtil:
         with pytest.raises(TypeError):
             decimal_default('string')
 
+    def test_client_error_is_botocores(self):
+        import pytest
+        import db_util
+        from botocore.exceptions import ClientError
+        assert db_util.ClientError is ClientError
+        e = ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'PutItem')
+        assert db_util.error_code(e) == 'ConditionalCheckFailedException'
+        with pytest.raises(AttributeError):
+            db_util.NoSuchThing
+
+    def test_cursor_round_trip(self):
+        key = {'PK': 'USER#a/b+c', 'SK': 'USER#a/b+c', 'GSI1PK': 'USERS', 'GSI1SK': 'USER#a/b+c'}
+        cursor = encode_cursor(key)
+        assert '=' not in cursor and '+' not in cursor and '/' not in cursor
+        assert decode_cursor(cursor) == key
+
+    def test_decode_cursor_rejects_garbage(self):
+        import pytest
+        for cursor in ('!!!', encode_cursor([1]), encode_cursor({}), encode_cursor({'PK': 1})):
+            with pytest.raises(ValueError):
+                decode_cursor(cursor)
+
+    def _pages(self, pages):
+        calls = []
+
+        def operation(**kwargs):
+            calls.append(kwargs)
+            return pages[len(calls) - 1]
+        return operation, calls
+
+    def test_paginate_follows_last_evaluated_key(self):
+        op, calls = self._pages([
+            {'Items': [1, 2], 'LastEvaluatedKey': {'k': 'a'}},
+            {'Items': [3], 'LastEvaluatedKey': {'k': 'b'}},
+            {'Items': [4]},
+        ])
+        assert list(_paginate(op, {'TableName': 't'}, None, None)) == [1, 2, 3, 4]
+        assert [c.get('ExclusiveStartKey') for c in calls] == [None, {'k': 'a'}, {'k': 'b'}]
+
+    def test_paginate_is_lazy(self):
+        op, calls = self._pages([
+            {'Items': [1], 'LastEvaluatedKey': {'k': 'a'}},
+            {'Items': [2]},
+        ])
+        it = _paginate(op, {}, None, None)
+        assert next(it) == 1
+        assert len(calls) == 1
+
+    def test_paginate_limit_stops_early(self):
+        op, calls = self._pages([
+            {'Items': [1, 2], 'LastEvaluatedKey': {'k': 'a'}},
+            {'Items': [3, 4], 'LastEvaluatedKey': {'k': 'b'}},
+        ])
+        assert list(_paginate(op, {'Limit': 2}, 3, None)) == [1, 2, 3]
+        assert [c['Limit'] for c in calls] == [2, 1]
+
+    def test_paginate_projection_uses_placeholders(self):
+        op, calls = self._pages([{'Items': []}])
+        list(_paginate(op, {'ExpressionAttributeNames': {'#x': 'x'}}, None, ['PK', 'role']))
+        assert calls[0]['ProjectionExpression'] == '#p0, #p1'
+        assert calls[0]['ExpressionAttributeNames'] == {'#x': 'x', '#p0': 'PK', '#p1': 'role'}
+
+    def test_decode_item_matches_resource_types(self):
+        from boto3.dynamodb.types import TypeDeserializer
+        raw = {
+            'PK': {'S': 'FOLDER#1'}, 'size': {'N': '42'}, 'ratio': {'N': '0.5'},
+            'ok': {'BOOL': True}, 'none': {'NULL': True},
+            'tags': {'L': [{'S': 'a'}, {'N': '1'}]}, 'meta': {'M': {'k': {'S': 'v'}}},
+            'ids': {'SS': ['x', 'y']},
+        }
+        lean = decode_item(raw)
+        reference = {k: TypeDeserializer().deserialize(v) for k, v in raw.items()}
+        assert lean == reference
+        assert type(lean['size']) is int
+        assert lean['ratio'] == Decimal('0.5')
+
+    def test_client_config(self):
+        config = client_config()
+        assert config.retries['mode'] == 'adaptive'
+        assert config.tcp_keepalive is True
+        assert client_config(signature_version='s3v4').signature_version == 's3v4'
+
     def test_to_json_with_decimals(self):
         result = to_json({'count': Decimal('5'), 'price': Decimal('9.99')})
         parsed = json.loads(result)
         assert parsed['count'] == 5
         assert parsed['price'] == 9.99
+
+    def _dumps_with(self, monkeypatch, serializer):
+        import db_util
+        monkeypatch.setattr(db_util, 'JSON_SERIALIZER', serializer)
+        monkeypatch.setattr(db_util, '_dumps', None)
+        return to_json({'files': [{'name': 'a', 'size': Decimal('10'), 'ratio': Decimal('0.25'), 'n': 3}]})
+
+    def test_serializers_agree(self, monkeypatch):
+        import pytest
+        pytest.importorskip('orjson')
+        assert json.loads(self._dumps_with(monkeypatch, 'orjson')) == json.loads(self._dumps_with(monkeypatch, 'json'))
+
+    def test_auto_falls_back_to_stdlib(self, monkeypatch):
+        monkeypatch.setitem(sys.modules, 'orjson', None)
+        result = self._dumps_with(monkeypatch, 'auto')
+        assert json.loads(result) == {'files': [{'name': 'a', 'size': 10, 'ratio': 0.25, 'n': 3}]}
+
+    def test_forced_orjson_requires_it(self, monkeypatch):
+        import pytest
+        monkeypatch.setitem(sys.modules, 'orjson', None)
+        with pytest.raises(ImportError):
+            self._dumps_with(monkeypatch, 'orjson')
+
+
+# ---- cache_util ----
+
+class TestTTLCache:
+    def test_get_miss(self):
+        assert TTLCache(4, 60).get('k') is MISS
+
+    def test_set_and_get(self):
+        c = TTLCache(4, 60)
+        c.set('k', 'v')
+        assert c.get('k') == 'v'
+
+    def test_negative_entry_is_not_a_miss(self):
+        c = TTLCache(4, 60)
+        c.set('k', None)
+        assert c.get('k') is None
+
+    def test_expired_entry_is_a_miss(self, monkeypatch):
+        import cache_util
+        now = [1000.0]
+        monkeypatch.setattr(cache_util.time, 'monotonic', lambda: now[0])
+        c = TTLCache(4, 60)
+        c.set('k', 'v', 5)
+        now[0] += 6
+        assert c.get('k') is MISS
+        assert len(c) == 0
+
+    def test_lru_eviction(self):
+        c = TTLCache(2, 60)
+        c.set('a', 1)
+        c.set('b', 2)
+        c.get('a')
+        c.set('c', 3)
+        assert c.get('b') is MISS
+        assert c.get('a') == 1
+        assert c.get('c') == 3
+
+    def test_evict_if(self):
+        c = TTLCache(4, 60)
+        c.set('a', {'username': 'alice'})
+        c.set('b', {'username': 'bob'})
+        c.evict_if(lambda v: v['username'] == 'alice')
+        assert c.get('a') is MISS
+        assert c.get('b') == {'username': 'bob'}
@@ -2,7 +2,7 @@ const API_BASE = process.env.REACT_APP_API_URL || '';
 
 async function request(path, options = {}) {
   const token = sessionStorage.getItem('sessionToken');
-  const headers = { 'Content-Type': 'application/json', ...options.headers };
+  const headers = { 'Content-Type': 'application/json', Accept: 'application/json', ...options.headers };
   if (token) headers['Authorization'] = `Bearer ${token}`;
 
   const res = await fetch(`${API_BASE}${path}`, { ...options, headers });
@@ -26,14 +26,28 @@ export const api = {
   seedAdmin: () => request('/auth/seed-admin', { method: 'POST' }),
 
   // Users
-  getUsers: () => request('/users'),
+  getUsers: (params = {}) => request(`/users?${new URLSearchParams(params)}`),
+  getAllUsers: async (params = {}) => {
+    const users = [];
+    let cursor = null;
+    do {
+      const data = await request(`/users?${new URLSearchParams(cursor ? { ...params, cursor } : params)}`);
+      users.push(...(data.users || []));
+      cursor = data.nextCursor;
+    } while (cursor);
+    return { users };
+  },
   createUser: (data) => request('/users', { method: 'POST', body: JSON.stringify(data) }),
+  importUsers: (csv) => request('/users/import', { method: 'POST', body: csv, headers: { 'Content-Type': 'text/csv' } }),
   updateUser: (username, data) => request(`/users/${username}`, { method: 'PUT', body: JSON.stringify(data) }),
   deleteUser: (username) => request(`/users/${username}`, { method: 'DELETE' }),
+  deleteUsers: (usernames) => request('/users', { method: 'DELETE', body: JSON.stringify({ usernames }) }),
 
   // Folders
   getFolders: () => request('/folders'),
   createFolder: (data) => request('/folders', { method: 'POST', body: JSON.stringify(data) }),
+  getFolderTree: (params) => request(`/folders/tree?${new URLSearchParams(params)}`),
+  moveFolder: (folderId, parentFolderId) => request(`/folders/${folderId}`, { method: 'PUT', body: JSON.stringify({ parentFolderId }) }),
   deleteFolder: (folderId) => request(`/folders/${folderId}`, { method: 'DELETE' }),
   assignFolders: (data) => request('/folders/assignments', { method: 'POST', body: JSON.stringify(data) }),
   unassignFolders: (data) => request('/folders/assignments', { method: 'DELETE', body: JSON.stringify(data) }),
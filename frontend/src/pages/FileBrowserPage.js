@@ -38,10 +38,11 @@ export default function FileBrowserPage() {
   const [versions, setVersions] = useState(null);
   const [versionFile, setVersionFile] = useState('');
 
+  // Top-level folders, nested with their children, in one request
   const loadFolders = useCallback(async () => {
     try {
-      const data = await api.getFolders();
-      setFolders(data.folders || []);
+      const data = await api.getFolderTree();
+      setFolders(data.tree || []);
     } catch (ex) { setErr(ex.message); }
   }, []);
 
@@ -56,25 +57,30 @@ export default function FileBrowserPage() {
   useEffect(() => { loadFolders().finally(() => setLoading(false)); }, [loadFolders]);
   useEffect(() => { if (currentFolder) loadFiles(currentFolder.folderId); }, [currentFolder, loadFiles]);
 
-  const navigateToFolder = (folder) => {
-    setSearch('');
-    setCurrentFolder(folder);
-    setFolderPath(prev => [...prev, folder]);
+  // The folder's subtree and its breadcrumbs (ancestors from the top down)
+  const openFolder = async (folderId) => {
+    setErr('');
+    try {
+      const data = await api.getFolderTree({ folderId });
+      setSearch('');
+      setCurrentFolder(data.tree[0]);
+      setFolderPath(data.breadcrumbs || []);
+    } catch (ex) { setErr(ex.message); }
   };
 
+  const navigateToFolder = (folder) => openFolder(folder.folderId);
+
   const navigateUp = () => { // eslint-disable-line no-unused-vars
-    const newPath = [...folderPath];
-    newPath.pop();
-    setCurrentFolder(newPath.length > 0 ? newPath[newPath.length - 1] : null);
-    setFolderPath(newPath);
-    if (newPath.length === 0) setFiles([]);
+    if (folderPath.length > 1) {
+      openFolder(folderPath[folderPath.length - 2].folderId);
+    } else {
+      setCurrentFolder(null);
+      setFolderPath([]);
+      setFiles([]);
+    }
   };
 
-  const navigateToBreadcrumb = (index) => {
-    const newPath = folderPath.slice(0, index + 1);
-    setCurrentFolder(newPath[newPath.length - 1]);
-    setFolderPath(newPath);
-  };
+  const navigateToBreadcrumb = (index) => openFolder(folderPath[index].folderId);
 
   const handleSearch = async (e) => {
     e.preventDefault();
@@ -158,9 +164,7 @@ export default function FileBrowserPage() {
     } catch (ex) { setErr(ex.message); }
   };
 
-  const childFolders = currentFolder
-    ? folders.filter(f => f.parentFolderId === currentFolder.folderId)
-    : folders.filter(f => !f.parentFolderId || f.parentFolderId === 'ROOT');
+  const childFolders = currentFolder ? currentFolder.children || [] : folders;
 
   const sortIcon = (field) => {
     if (sortBy !== field) return <i className="bi bi-arrow-down-up text-muted ms-1" style={{ fontSize: 12 }}></i>;
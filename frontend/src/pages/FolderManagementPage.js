@@ -13,7 +13,7 @@ export default function FolderManagementPage() {
   const load = async () => {
     setLoading(true);
     try {
-      const [fData, uData] = await Promise.all([api.getFolders(), api.getUsers()]);
+      const [fData, uData] = await Promise.all([api.getFolders(), api.getAllUsers({ limit: 200 })]);
       setFolders(fData.folders || []);
       setUsers(uData.users || []);
     } catch (ex) { setErr(ex.message); }
@@ -42,6 +42,14 @@ export default function FolderManagementPage() {
     } catch (ex) { setErr(ex.message); }
   };
 
+  const handleMove = async (folderId, parentFolderId) => {
+    setErr('');
+    try {
+      await api.moveFolder(folderId, parentFolderId);
+      load();
+    } catch (ex) { setErr(ex.message); }
+  };
+
   const handleAssign = async (e) => {
     e.preventDefault();
     setErr('');
@@ -88,7 +96,12 @@ export default function FolderManagementPage() {
                 </span>
               ))}
             </td>
-            <td>
+            <td className="d-flex gap-2">
+              <select className="form-select form-select-sm" style={{ width: 140 }} value="" onChange={e => handleMove(f.folderId, e.target.value)} title="Move to">
+                <option value="" disabled>Move to...</option>
+                {(f.parentFolderId || 'ROOT') !== 'ROOT' && <option value="ROOT">Root (top level)</option>}
+                {folders.filter(o => o.folderId !== f.folderId && o.folderId !== f.parentFolderId).map(o => <option key={o.folderId} value={o.folderId}>{o.folderName}</option>)}
+              </select>
               <button className="btn btn-sm btn-outline-danger" onClick={() => handleDelete(f.folderId, f.folderName)} title="Delete"><i className="bi bi-trash"></i></button>
             </td>
           </tr>
@@ -171,7 +184,7 @@ export default function FolderManagementPage() {
                 <tr>
                   <th>Folder</th>
                   <th>Assigned Users</th>
-                  <th style={{ width: 80 }}>Actions</th>
+                  <th style={{ width: 200 }}>Actions</th>
                 </tr>
               </thead>
               <tbody>
@@ -8,17 +8,42 @@ export default function UserManagementPage() {
   const [showForm, setShowForm] = useState(false);
   const [editUser, setEditUser] = useState(null);
   const [form, setForm] = useState({ username: '', password: '', role: 'viewer' });
+  const [filters, setFilters] = useState({ prefix: '', role: '' });
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [importReport, setImportReport] = useState(null);
+  const [selected, setSelected] = useState([]);
+
+  const queryParams = (cursor) => {
+    const params = {};
+    if (filters.prefix) params.prefix = filters.prefix;
+    if (filters.role) params.role = filters.role;
+    if (cursor) params.cursor = cursor;
+    return params;
+  };
 
   const loadUsers = async () => {
     setLoading(true);
     try {
-      const data = await api.getUsers();
+      const data = await api.getUsers(queryParams());
       setUsers(data.users || []);
+      setNextCursor(data.nextCursor || null);
     } catch (ex) { setErr(ex.message); }
     finally { setLoading(false); }
   };
 
-  useEffect(() => { loadUsers(); }, []);
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const data = await api.getUsers(queryParams(nextCursor));
+      setUsers(prev => [...prev, ...(data.users || [])]);
+      setNextCursor(data.nextCursor || null);
+    } catch (ex) { setErr(ex.message); }
+    finally { setLoadingMore(false); }
+  };
+
+  // eslint-disable-next-line react-hooks/exhaustive-deps
+  useEffect(() => { loadUsers(); }, [filters]);
 
   const handleCreate = async (e) => {
     e.preventDefault();
@@ -46,6 +71,18 @@ export default function UserManagementPage() {
     } catch (ex) { setErr(ex.message); }
   };
 
+  const handleImport = async (e) => {
+    const file = e.target.files[0];
+    e.target.value = '';
+    if (!file) return;
+    setErr('');
+    setImportReport(null);
+    try {
+      setImportReport(await api.importUsers(await file.text()));
+      loadUsers();
+    } catch (ex) { setErr(ex.message); }
+  };
+
   const handleDelete = async (username) => {
     if (!window.confirm(`Delete user "${username}"?`)) return;
     try {
@@ -54,6 +91,21 @@ export default function UserManagementPage() {
     } catch (ex) { setErr(ex.message); }
   };
 
+  const toggleSelected = (username) => {
+    setSelected(prev => prev.includes(username) ? prev.filter(u => u !== username) : [...prev, username]);
+  };
+
+  const handleBulkDelete = async () => {
+    if (!window.confirm(`Delete ${selected.length} user(s)?`)) return;
+    try {
+      const report = await api.deleteUsers(selected);
+      const failed = report.results.filter(r => r.status !== 200);
+      if (failed.length) setErr(`Could not delete: ${failed.map(r => `${r.username} (${r.error})`).join(', ')}`);
+      setSelected([]);
+      loadUsers();
+    } catch (ex) { setErr(ex.message); }
+  };
+
   const startEdit = (user) => {
     setEditUser(user.username);
     setForm({ username: user.username, password: '', role: user.role });
@@ -69,13 +121,53 @@ export default function UserManagementPage() {
     <div className="container">
       <div className="d-flex justify-content-between align-items-center mb-4">
         <h4 className="fw-bold mb-0" style={{ color: '#2d6a4f' }}><i className="bi bi-people me-2"></i>User Management</h4>
-        <button className="btn btn-forest" onClick={() => { setEditUser(null); setForm({ username: '', password: '', role: 'viewer' }); setShowForm(!showForm); }}>
-          <i className="bi bi-person-plus me-1"></i>New User
-        </button>
+        <div>
+          {selected.length > 0 && (
+            <button className="btn btn-outline-danger me-2" onClick={handleBulkDelete}>
+              <i className="bi bi-trash me-1"></i>Delete {selected.length} selected
+            </button>
+          )}
+          <label className="btn btn-outline-forest me-2 mb-0" title="CSV columns: username,password,role,folderIds (folder IDs separated by ;)">
+            <i className="bi bi-upload me-1"></i>Import CSV
+            <input type="file" accept=".csv,text/csv" hidden onChange={handleImport} />
+          </label>
+          <button className="btn btn-forest" onClick={() => { setEditUser(null); setForm({ username: '', password: '', role: 'viewer' }); setShowForm(!showForm); }}>
+            <i className="bi bi-person-plus me-1"></i>New User
+          </button>
+        </div>
       </div>
 
+      {importReport && (
+        <div className={`alert ${importReport.failed ? 'alert-warning' : 'alert-success'} py-2 small`}>
+          Imported {importReport.created} user(s){importReport.failed ? `, ${importReport.failed} failed:` : '.'}
+          <button className="btn-close float-end" onClick={() => setImportReport(null)}></button>
+          {importReport.failed > 0 && (
+            <ul className="mb-0 mt-1">
+              {importReport.results.filter(r => r.status !== 201).map(r => (
+                <li key={r.row}>Row {r.row}{r.username ? ` (${r.username})` : ''}: {r.error}</li>
+              ))}
+            </ul>
+          )}
+        </div>
+      )}
+
       {err && <div className="alert alert-danger py-2 small">{err}<button className="btn-close float-end" onClick={() => setErr('')}></button></div>}
 
+      <div className="row g-2 mb-3">
+        <div className="col-md-4">
+          <input type="search" className="form-control" placeholder="Search by username prefix" value={filters.prefix} onChange={e => setFilters({ ...filters, prefix: e.target.value })} />
+        </div>
+        <div className="col-md-3">
+          <select className="form-select" value={filters.role} onChange={e => setFilters({ ...filters, role: e.target.value })}>
+            <option value="">All roles</option>
+            <option value="admin">Admin</option>
+            <option value="uploader">Uploader</option>
+            <option value="reader">Reader</option>
+            <option value="viewer">Viewer</option>
+          </select>
+        </div>
+      </div>
+
       {showForm && (
         <div className="card mb-4">
           <div className="card-body">
@@ -115,6 +207,7 @@ export default function UserManagementPage() {
             <table className="table table-hover mb-0">
               <thead style={{ backgroundColor: '#e9f5ef' }}>
                 <tr>
+                  <th style={{ width: 40 }}></th>
                   <th>Username</th>
                   <th>Role</th>
                   <th>Assigned Folders</th>
@@ -124,6 +217,11 @@ export default function UserManagementPage() {
               <tbody>
                 {users.map(u => (
                   <tr key={u.username}>
+                    <td>
+                      {u.username !== 'admin' && (
+                        <input type="checkbox" className="form-check-input" checked={selected.includes(u.username)} onChange={() => toggleSelected(u.username)} />
+                      )}
+                    </td>
                     <td className="fw-semibold"><i className="bi bi-person me-1"></i>{u.username}</td>
                     <td>{roleBadge(u.role)}</td>
                     <td><span className="text-muted small">{(u.assignedFolders || []).length} folder(s)</span></td>
@@ -137,10 +235,17 @@ export default function UserManagementPage() {
                     </td>
                   </tr>
                 ))}
-                {users.length === 0 && <tr><td colSpan="4" className="text-center text-muted py-4">No users found</td></tr>}
+                {users.length === 0 && <tr><td colSpan="5" className="text-center text-muted py-4">No users found</td></tr>}
               </tbody>
             </table>
           </div>
+          {nextCursor && (
+            <div className="card-footer text-center">
+              <button className="btn btn-sm btn-outline-forest" onClick={loadMore} disabled={loadingMore}>
+                {loadingMore ? <span className="spinner-border spinner-border-sm"></span> : 'Load more'}
+              </button>
+            </div>
+          )}
         </div>
       )}
     </div>